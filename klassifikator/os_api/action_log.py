@@ -0,0 +1,215 @@
+import os
+import glob
+import gzip
+import json
+import time
+import shutil
+import threading
+from queue import Queue, Empty, Full
+
+# Журнал действий пользователей (/v1/actions) в JSON lines.
+# Один поток-писатель держит файл открытым и пишет пачками: до batch_lines событий
+# или batch_ms с первого события пачки — одним write (+ fsync, если включён).
+# Ротация по размеру и/или смене дня; закрытые файлы сжимаются в .gz в фоне, хранится keep последних.
+# Переполненная очередь: put() ждёт до block_ms (backpressure), потом событие отбрасывается
+# и попадает в счётчик dropped.
+# sinks — дополнительные получатели каждой записанной пачки (sink(events)), например ActionStore.
+
+ACTION_LOG_BATCH_LINES = int(os.getenv("ACTION_LOG_BATCH_LINES", "500"))
+ACTION_LOG_BATCH_MS = int(os.getenv("ACTION_LOG_BATCH_MS", "200"))
+ACTION_LOG_FSYNC = os.getenv("ACTION_LOG_FSYNC", "0") == "1"
+ACTION_LOG_ROTATE_MB = int(os.getenv("ACTION_LOG_ROTATE_MB", "100"))
+ACTION_LOG_ROTATE_DAILY = os.getenv("ACTION_LOG_ROTATE_DAILY", "1") == "1"
+ACTION_LOG_COMPRESS = os.getenv("ACTION_LOG_COMPRESS", "1") == "1"
+ACTION_LOG_KEEP = int(os.getenv("ACTION_LOG_KEEP", "30"))
+ACTION_LOG_BLOCK_MS = int(os.getenv("ACTION_LOG_BLOCK_MS", "50"))
+
+
+class ActionLogWriter:
+    def __init__(self, path, queue_size=10000, batch_lines=ACTION_LOG_BATCH_LINES, batch_ms=ACTION_LOG_BATCH_MS,
+                 fsync=ACTION_LOG_FSYNC, rotate_mb=ACTION_LOG_ROTATE_MB, rotate_daily=ACTION_LOG_ROTATE_DAILY,
+                 compress=ACTION_LOG_COMPRESS, keep=ACTION_LOG_KEEP, block_ms=ACTION_LOG_BLOCK_MS, sinks=()):
+        self.path = path
+        self.batch_lines = max(1, batch_lines)
+        self.batch_s = batch_ms / 1000.0
+        self.fsync = fsync
+        self.rotate_bytes = rotate_mb * 1024 * 1024 if rotate_mb > 0 else None
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self.keep = keep
+        self.block_s = block_ms / 1000.0
+        self.sinks = list(sinks)
+
+        self._queue = Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._roll_lock = threading.Lock()     # сжатие/чистка закрытых файлов по одному
+        self._thread = None
+        self._f = None
+        self._day = None
+        self._size = 0
+        self._roll_seq = 0
+
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "bytes": 0,
+            "dropped": 0,
+            "blocked": 0,            # сколько put() ждали места в очереди
+            "fsyncs": 0,
+            "rotations": 0,
+            "errors": 0,
+            "last_error": None,
+            "last_batch_size": 0,
+            "sink_errors": 0,
+        }
+
+    # ---------- API ----------
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._open()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def put(self, event):
+        """-> True, если событие принято; False — очередь полна и за block_ms не освободилась."""
+        try:
+            self._queue.put_nowait(event)
+        except Full:
+            with self._lock:
+                self._stats["blocked"] += 1
+            try:
+                self._queue.put(event, timeout=self.block_s)
+            except Full:
+                with self._lock:
+                    self._stats["dropped"] += 1
+                return False
+        with self._lock:
+            self._stats["enqueued"] += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s.update({
+            "queue": self._queue.qsize(),
+            "queue_max": self._queue.maxsize,
+            "file": self.path,
+            "file_bytes": self._size,
+            "batch_lines": self.batch_lines,
+            "batch_ms": int(self.batch_s * 1000),
+            "fsync": self.fsync,
+        })
+        return s
+
+    # ---------- запись ----------
+
+    def _take_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_s
+        while len(batch) < self.batch_lines:
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=wait))
+            except Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                data = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in batch).encode("utf-8")
+                self._maybe_rotate(len(data))
+                self._f.write(data)
+                self._f.flush()
+                if self.fsync:
+                    os.fsync(self._f.fileno())
+                self._size += len(data)
+                with self._lock:
+                    self._stats["written"] += len(batch)
+                    self._stats["batches"] += 1
+                    self._stats["bytes"] += len(data)
+                    self._stats["last_batch_size"] = len(batch)
+                    if self.fsync:
+                        self._stats["fsyncs"] += 1
+            except Exception as e:
+                print("action logging failed:", e)
+                with self._lock:
+                    self._stats["errors"] += 1
+                    self._stats["last_error"] = str(e)
+                    self._stats["dropped"] += len(batch)
+                try:
+                    self._open()
+                except Exception:
+                    pass
+                continue
+
+            for sink in self.sinks:
+                try:
+                    sink(batch)
+                except Exception as e:
+                    print("action log sink failed:", e)
+                    with self._lock:
+                        self._stats["sink_errors"] += 1
+
+    # ---------- ротация ----------
+
+    def _open(self):
+        if self._f is not None:
+            try:
+                self._f.close()
+            except Exception:
+                pass
+        self._f = open(self.path, "ab", buffering=1024 * 1024)
+        self._size = self._f.tell()
+        st = os.stat(self.path)
+        self._day = time.strftime("%Y-%m-%d", time.localtime(st.st_mtime if self._size else time.time()))
+
+    def _maybe_rotate(self, incoming):
+        today = time.strftime("%Y-%m-%d")
+        by_day = self.rotate_daily and self._size > 0 and today != self._day
+        by_size = self.rotate_bytes is not None and self._size > 0 and self._size + incoming > self.rotate_bytes
+        if not (by_day or by_size):
+            return
+
+        self._f.close()
+        self._f = None
+        # имя сортируется по времени: actions.log.YYYYmmdd-HHMMSS-NNN[.gz]
+        base = f"{self.path}.{self._day.replace('-', '')}-{time.strftime('%H%M%S')}"
+        self._roll_seq += 1
+        n = self._roll_seq % 1000
+        rolled = f"{base}-{n:03d}"
+        while os.path.exists(rolled) or os.path.exists(rolled + ".gz"):
+            n += 1
+            rolled = f"{base}-{n:03d}"
+        os.replace(self.path, rolled)
+        self._open()
+        self._day = today
+        with self._lock:
+            self._stats["rotations"] += 1
+        threading.Thread(target=self._finish_rolled, args=(rolled,), daemon=True).start()
+
+    def _finish_rolled(self, rolled):
+        with self._roll_lock:
+            self._compress_and_prune(rolled)
+
+    def _compress_and_prune(self, rolled):
+        try:
+            if self.compress:
+                with open(rolled, "rb") as src, gzip.open(rolled + ".gz", "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.remove(rolled)
+            if self.keep > 0:
+                old = sorted(glob.glob(glob.escape(self.path) + ".*"))
+                for p in old[:-self.keep]:
+                    try:
+                        os.remove(p)
+                    except FileNotFoundError:
+                        pass
+        except Exception as e:
+            print("action log rotation cleanup failed:", e)
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# Действия пользователей (/v1/actions) в SQLite рядом с actions.log — чтобы отвечать на вопросы
+# "что ищут / что нажимают" без сканирования файла.
+# Пишет поток ActionLogWriter (sink), пачкой в одной транзакции:
+#   actions                — сырые события (индексы по ts, path+ts, event+ts), хранятся ACTION_STORE_DAYS дней;
+#   action_counts_hour/_day — счётчики по (начало часа/дня UTC, path, event), обновляются в той же транзакции;
+#                            агрегаты за месяцы читаются отсюда, а не из сырых событий.
+# path — страница портала, на которой случилось действие (data.path / data.page, иначе путь из Referer),
+# а не адрес приёмника: он у всех событий один — /v1/actions.
+# WAL: чтение из запросов не ждёт запись.
+
+ACTION_STORE_FILE = os.getenv("ACTION_STORE_FILE", "/app/logs/actions.sqlite")
+ACTION_STORE_DAYS = int(os.getenv("ACTION_STORE_DAYS", "180"))
+
+SCHEMA = """
+create table if not exists actions (
+  id     integer primary key,
+  ts     integer not null,          -- unix ms (UTC)
+  path   text,                      -- страница портала
+  event  text,
+  ip     text,
+  data   text                       -- payload как пришёл (json)
+);
+create index if not exists ix_actions_ts on actions (ts);
+create index if not exists ix_actions_path_ts on actions (path, ts);
+create index if not exists ix_actions_event_ts on actions (event, ts);
+
+create table if not exists action_counts_hour (
+  t      integer not null,          -- unix время начала часа (UTC), с
+  path   text    not null,
+  event  text    not null,
+  cnt    integer not null,
+  primary key (t, path, event)
+) without rowid;
+create index if not exists ix_action_counts_hour_event on action_counts_hour (event, t);
+
+create table if not exists action_counts_day (
+  t      integer not null,          -- unix время начала дня (UTC), с
+  path   text    not null,
+  event  text    not null,
+  cnt    integer not null,
+  primary key (t, path, event)
+) without rowid;
+create index if not exists ix_action_counts_day_event on action_counts_day (event, t);
+"""
+
+BUCKETS = {"hour": 3600, "day": 86400}
+GROUPS = ("event", "path")
+
+
+def event_type(e):
+    # тип события: из payload (event/type/action), для служебных записей — верхний уровень
+    data = e.get("data")
+    if isinstance(data, dict):
+        for k in ("event", "type", "action"):
+            if data.get(k):
+                return str(data[k])[:100]
+    return str(e.get("event") or "")[:100]
+
+
+def event_page(e):
+    # страница из payload (path/page), иначе путь из Referer; строка запроса в ключ счётчиков не идёт
+    data = e.get("data")
+    page = None
+    if isinstance(data, dict):
+        page = next((data[k] for k in ("path", "page") if isinstance(data.get(k), str) and data[k]), None)
+    if page is None and e.get("referer"):
+        page = e["referer"]
+    if not page:
+        return ""
+    try:
+        page = urlsplit(page).path or "/"
+    except ValueError:
+        pass
+    return page[:300]
+
+
+def event_ts_ms(e):
+    try:
+        return int(datetime.fromisoformat(e["ts"]).timestamp() * 1000)
+    except Exception:
+        return int(time.time() * 1000)
+
+
+class ActionStore:
+    def __init__(self, path=ACTION_STORE_FILE, keep_days=ACTION_STORE_DAYS):
+        self.path = path
+        self.keep_days = keep_days
+        self._local = threading.local()
+        self._write_conn = None
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"inserted": 0, "batches": 0, "pruned": 0, "errors": 0, "last_error": None}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("pragma journal_mode=wal")
+        conn.execute("pragma synchronous=normal")
+        return conn
+
+    # ---------- запись (поток ActionLogWriter) ----------
+
+    def write_batch(self, events):
+        rows = []
+        for e in events:
+            data = e.get("data")
+            rows.append((
+                event_ts_ms(e),
+                event_page(e),
+                event_type(e),
+                e.get("ip"),
+                json.dumps(data, ensure_ascii=False) if data is not None else None,
+            ))
+        counts = {b: {} for b in BUCKETS}
+        for ts, path, ev, _, _ in rows:
+            for b, step in BUCKETS.items():
+                k = (ts // 1000 // step * step, path, ev)
+                counts[b][k] = counts[b].get(k, 0) + 1
+
+        if self._write_conn is None:
+            self._write_conn = self._connect()
+        conn = self._write_conn
+        try:
+            conn.execute("begin")
+            conn.executemany("insert into actions (ts, path, event, ip, data) values (?, ?, ?, ?, ?)", rows)
+            for b, c in counts.items():
+                conn.executemany(f"""
+                    insert into action_counts_{b} (t, path, event, cnt) values (?, ?, ?, ?)
+                    on conflict (t, path, event) do update set cnt = cnt + excluded.cnt
+                """, [k + (v,) for k, v in c.items()])
+            conn.execute("commit")
+        except Exception as e:
+            try:
+                conn.execute("rollback")
+            except Exception:
+                pass
+            with self._lock:
+                self._stats["errors"] += 1
+                self._stats["last_error"] = str(e)
+            raise
+        with self._lock:
+            self._stats["inserted"] += len(rows)
+            self._stats["batches"] += 1
+        self._maybe_prune()
+
+    def _maybe_prune(self):
+        # сырые события старше keep_days удаляем раз в час; счётчики остаются
+        now = time.time()
+        if self.keep_days <= 0 or now - self._pruned_at < 3600:
+            return
+        self._pruned_at = now
+        cur = self._write_conn.execute("delete from actions where ts < ?", (int((now - self.keep_days * 86400) * 1000),))
+        with self._lock:
+            self._stats["pruned"] += cur.rowcount
+
+    # ---------- чтение ----------
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def counts(self, ts_from, ts_to, bucket="hour", group="event", event=None, path=None):
+        """Число событий по корзинам времени [ts_from, ts_to) (unix с) -> список dict.
+        Границы выравниваются вниз до начала корзины."""
+        step = BUCKETS[bucket]
+        where = ["t >= ?", "t < ?"]
+        params = [int(ts_from) // step * step, int(ts_to)]
+        if event is not None:
+            where.append("event = ?")
+            params.append(event)
+        if path is not None:
+            where.append("path = ?")
+            params.append(path)
+        key = f", {group}" if group else ""
+        sql = f"""
+            select t{key}, sum(cnt) as cnt
+            from action_counts_{bucket}
+            where {' and '.join(where)}
+            group by 1{', 2' if group else ''}
+            order by 1{', 2' if group else ''}
+        """
+        cols = ["t"] + ([group] if group else []) + ["cnt"]
+        return [dict(zip(cols, r)) for r in self._reader().execute(sql, params)]
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s.update({"file": self.path, "keep_days": self.keep_days})
+        try:
+            s["file_bytes"] = os.path.getsize(self.path)
+        except OSError:
+            s["file_bytes"] = None
+        return s
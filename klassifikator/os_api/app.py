@@ -1,30 +1,49 @@
 import os
+import hmac
 import json
+import math
+import time
+import hashlib
 import requests
 from flask import Flask, request, jsonify, send_file
-from openpyxl import load_workbook
-from copy import copy
 from flask_cors import CORS
 import tempfile
 from datetime import datetime, timezone
-from queue import Queue, Full
 
-import psycopg2
-import psycopg2.extras
-import subprocess
-import threading
+from pg_pool import PgPool
+from os_indexer import BulkIndexer
+from reindex_jobs import ReindexJob
+from search_gateway import SearchGateway, SearchCancelled
+from search_cache import SearchCache
+from action_log import ActionLogWriter
+from action_store import ActionStore, BUCKETS, GROUPS
+from count_cache import CountCache
+from metrics import RequestMetrics
+from slowlog import SlowLog
+from vom_export import (
+    VOM_EXPORT_SQL, VOM_FINGERPRINT_SQL, ExportNotReady, TemplateError, VomExportCache, build_vom_xlsx,
+)
 
 OPENSEARCH_URL = os.getenv("OPENSEARCH_URL", "http://opensearch:9200").rstrip("/")
 DEFAULT_INDEX  = os.getenv("OPENSEARCH_INDEX", "class_tree_v1")
+PAIRS_INDEX    = os.getenv("PAIRS_INDEX", "v_nomenclature_spec_pairs_v1")
 SEARCH_FIELDS  = os.getenv(
     "SEARCH_FIELDS",
     "l4_name^3,l3_name^2,l2_name^2,l1_name,path_name^2,l4_code,path_code"
 ).split(",")
 
 TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+# /admin/*: заголовок X-Admin-Token; пустой ADMIN_TOKEN — маршруты выключены (404), они видны через /api/ в nginx
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 XLSX_TEMPLATE = os.getenv("XLSX_TEMPLATE", "/templates/vom_template.xlsx")
 XLSX_SHEET    = os.getenv("XLSX_SHEET", "Каталог ВОМа")
 
+# кэш собранной выгрузки ВОМ
+VOM_EXPORT_CACHE_DIR = os.getenv("VOM_EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "vom_export"))
+VOM_EXPORT_FINGERPRINT_TTL = float(os.getenv("VOM_EXPORT_FINGERPRINT_TTL", "5"))
+VOM_EXPORT_WAIT_TIMEOUT = float(os.getenv("VOM_EXPORT_WAIT_TIMEOUT", "60"))
+VOM_EXPORT_WATCH_INTERVAL = float(os.getenv("VOM_EXPORT_WATCH_INTERVAL", "300"))
+
 # Postgres (Directus DB)
 PG_HOST = os.getenv("PG_HOST", "pg")
 PG_PORT = int(os.getenv("PG_PORT", "5432"))
@@ -36,69 +55,205 @@ PG_PASS = os.getenv("PG_PASS", "directus")
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+# /metrics, Server-Timing, X-Request-ID, см. metrics.py
+METRICS = RequestMetrics(app)
+
 ACTION_LOG_FILE = os.getenv("ACTION_LOG_FILE", "/app/logs/actions.log")
 ACTION_LOG_QUEUE_SIZE = int(os.getenv("ACTION_LOG_QUEUE_SIZE", "10000"))
 
-action_log_queue = Queue(maxsize=ACTION_LOG_QUEUE_SIZE)
+# те же события — в SQLite с почасовыми счётчиками для /v1/actions/stats (пусто — выключено)
+ACTION_STORE_FILE = os.getenv("ACTION_STORE_FILE", "/app/logs/actions.sqlite")
+ACTION_STORE = ActionStore(ACTION_STORE_FILE) if ACTION_STORE_FILE else None
 
+# пачечная запись с ротацией, см. action_log.py
+ACTION_LOG = ActionLogWriter(
+    ACTION_LOG_FILE,
+    queue_size=ACTION_LOG_QUEUE_SIZE,
+    sinks=[ACTION_STORE.write_batch] if ACTION_STORE else (),
+).start()
 
-def ensure_action_log_file(path: str):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "a", encoding="utf-8"):
-        pass
+startup_event = {
+    "ts": datetime.now(timezone.utc).isoformat(),
+    "event": "запись логов началась",
+}
+ACTION_LOG.put(startup_event)
 
 
-def action_log_worker():
-    while True:
-        log_line = action_log_queue.get()
-        try:
-            with open(ACTION_LOG_FILE, "a", encoding="utf-8") as f:
-                f.write(log_line)
-        except Exception as e:
-            print("action logging failed:", e)
-        finally:
-            action_log_queue.task_done()
+PG_POOL = PgPool(
+    host=PG_HOST,
+    port=PG_PORT,
+    dbname=PG_DB,
+    user=PG_USER,
+    password=PG_PASS
+)
+PG_POOL.fill()
 
+# кэш ответов /api/v1/search; индекс сбрасывается, когда в него что-то записали, см. search_cache.py
+SEARCH_CACHE = SearchCache()
 
-ensure_action_log_file(ACTION_LOG_FILE)
 
-startup_event = {
-    "ts": datetime.now(timezone.utc).isoformat(),
-    "event": "запись логов началась",
+def search_cache_invalidate(indices):
+    for index in indices:
+        SEARCH_CACHE.invalidate(index)
+
+
+def os_indexer_failed(indices):
+    # документы не записались и после повторов: их правки лежат в etl_changes_v1 — добирает incremental
+    for name, index in REINDEX_INDEX.items():
+        if index in indices:
+            print(f"os indexer: dead documents in {index}, scheduling incremental reindex")
+            REINDEX_JOBS[name].submit("incremental")
+
+
+OS_INDEXER = BulkIndexer(OPENSEARCH_URL, timeout=TIMEOUT, on_indexed=search_cache_invalidate,
+                         on_failed=os_indexer_failed).start()
+
+# поиск: общий пул keep-alive соединений к OpenSearch, отмена вытесненных запросов, см. search_gateway.py
+SEARCH = SearchGateway(OPENSEARCH_URL)
+
+# какой индекс (alias) пишет каждая задача переиндексации
+REINDEX_INDEX = {
+    "pairs": PAIRS_INDEX,
+    "nomen": "class_tree_nomen_v1",
 }
-with open(ACTION_LOG_FILE, "a", encoding="utf-8") as f:
-    f.write(json.dumps(startup_event, ensure_ascii=False) + "\n")
 
-threading.Thread(target=action_log_worker, daemon=True).start()
+
+def reindex_done(name, result, mode):
+    # и после отмены/ошибки: incremental мог успеть записать часть документов
+    search_cache_invalidate([REINDEX_INDEX[name]])
+    if mode == "full" and result == "ok":
+        # правки за время сборки поколения OS_INDEXER писал в старое поколение (alias переключён после);
+        # incremental от горизонта начала сборки доносит их в новое
+        REINDEX_JOBS[name].submit("incremental")
+
+
+# одна задача переиндексации на индекс, см. reindex_jobs.py
+REINDEX_JOBS = {
+    "pairs": ReindexJob("pairs", "/scripts/etl_pg_to_opensearch.py", on_done=reindex_done),
+    "nomen": ReindexJob("nomen", "/scripts/etl_nomen_to_opensearch.py", on_done=reindex_done),
+}
+
+
+# медленные запросы с планом / профилем, включается SLOWLOG=1, см. slowlog.py
+SLOWLOG = SlowLog(PG_POOL, SEARCH, context=METRICS.context).start()
 
 
 def pg_query(sql, params=None):
-    conn = psycopg2.connect(
-        host=PG_HOST,
-        port=PG_PORT,
-        dbname=PG_DB,
-        user=PG_USER,
-        password=PG_PASS
-    )
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute(sql, params or {})
-            rows = cur.fetchall()
-            conn.commit()
-            return [dict(r) for r in rows]
-    finally:
-        conn.close()
+    with METRICS.timed("pg"), SLOWLOG.pg(sql, params):
+        return PG_POOL.query(sql, params)
+
+
+METRICS.add_stats("pg_pool", PG_POOL.stats)
+METRICS.add_stats("search_gateway", SEARCH.stats)
+METRICS.add_stats("search_cache", SEARCH_CACHE.stats)
+METRICS.add_stats("os_indexer", OS_INDEXER.stats)
+METRICS.add_stats("action_log", ACTION_LOG.stats)
+
+
+# total для /pairs_list: count(*) по всей таблице считаем в фоне, а не на каждый запрос
+PAIRS_COUNT_TTL = float(os.getenv("PAIRS_COUNT_TTL", "60"))
+
+PAIRS_COUNT = CountCache(
+    lambda: pg_query("select count(*) as cnt from public.v_nomenclature_spec_pairs_v1")[0]["cnt"],
+    ttl=PAIRS_COUNT_TTL,
+    name="pairs count",
+)
 
 
 @app.get("/health")
 def health():
     try:
-        r = requests.get(OPENSEARCH_URL, timeout=TIMEOUT)
+        with METRICS.timed("opensearch"):
+            r = requests.get(OPENSEARCH_URL, timeout=TIMEOUT)
         return jsonify({"ok": True, "opensearch_status": r.status_code})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
+@app.get("/metrics")
+def metrics():
+    return app.response_class(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.get("/health/pg_pool")
+def health_pg_pool():
+    return jsonify(PG_POOL.stats())
+
+
+@app.get("/health/os_indexer")
+def health_os_indexer():
+    return jsonify(OS_INDEXER.stats())
+
+
+@app.get("/health/search")
+def health_search():
+    return jsonify(SEARCH.stats())
+
+
+@app.get("/health/action_log")
+def health_action_log():
+    s = ACTION_LOG.stats()
+    s["store"] = ACTION_STORE.stats() if ACTION_STORE else None
+    return jsonify(s)
+
+
+def admin_denied():
+    # -> ответ с ошибкой или None; в журнале — SQL с параметрами и тела поисковых запросов
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "not found"}), 404
+    token = request.headers.get("X-Admin-Token") or ""
+    if not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        return jsonify({"error": "admin token required"}), 403
+    return None
+
+
+@app.get("/admin/slowlog")
+def admin_slowlog():
+    # ?kind=pg|opensearch&limit=50&since_id=
+    denied = admin_denied()
+    if denied:
+        return denied
+    kind = (request.args.get("kind") or "").strip() or None
+    if kind not in (None, "pg", "opensearch"):
+        return jsonify({"error": "kind must be pg or opensearch"}), 400
+    try:
+        limit = int(request.args.get("limit") or "50")
+        since_id = int(request.args.get("since_id") or "0")
+    except ValueError:
+        return jsonify({"error": "limit and since_id must be integers"}), 400
+    return jsonify({"stats": SLOWLOG.stats(), "entries": SLOWLOG.entries(kind, limit, since_id)})
+
+
+@app.post("/admin/slowlog/clear")
+def admin_slowlog_clear():
+    denied = admin_denied()
+    if denied:
+        return denied
+    SLOWLOG.clear()
+    return jsonify({"ok": True})
+
+
+@app.get("/health/search_cache")
+def health_search_cache():
+    return jsonify(SEARCH_CACHE.stats())
+
+
+@app.post("/search_cache/invalidate")
+def search_cache_invalidate_route():
+    # для индексов, которые переиндексируют мимо os_api (class_tree_v1)
+    index = (request.args.get("index") or "").strip()
+    if not index:
+        return jsonify({"error": "index is required"}), 400
+    SEARCH_CACHE.invalidate(index)
+    return jsonify({"ok": True, "index": index})
+
+
+def search_response(body, cache_state):
+    resp = app.response_class(body, mimetype="application/json")
+    resp.headers["X-Cache"] = cache_state
+    return resp
+
+
 @app.get("/api/v1/search")
 def universal_search():
     q = (request.args.get("q") or "").strip()
@@ -108,6 +263,10 @@ def universal_search():
     if not q:
         return jsonify({"total": 0, "rows": []})
 
+    cached, cache_token = SEARCH_CACHE.get(SEARCH_CACHE.key(index, q, size))
+    if cached is not None:
+        return search_response(cached, "HIT")
+
     index_config = {
         "class_tree_v1": {
             "fields": SEARCH_FIELDS,
@@ -139,8 +298,10 @@ def universal_search():
     }
 
     try:
-        url = f"{OPENSEARCH_URL}/{index}/_search"
-        r = requests.post(url, json=body, timeout=TIMEOUT)
+        # X-Search-Client: новый запрос того же поля ввода отменяет предыдущий
+        with METRICS.timed("opensearch"), SLOWLOG.search(index, body):
+            r = SEARCH.search(index, body, client=request.headers.get("X-Search-Client"),
+                              opaque_id=METRICS.request_id())
         r.raise_for_status()
 
         data = r.json()
@@ -148,7 +309,11 @@ def universal_search():
         total = hits_data.get("total", {}).get("value", 0)
         rows = [h["_source"] for h in hits_data.get("hits", [])]
 
-        return jsonify({"total": total, "rows": rows})
+        out = (app.json.dumps({"total": total, "rows": rows}) + "\n").encode("utf-8")
+        SEARCH_CACHE.put(cache_token, out)
+        return search_response(out, "MISS")
+    except SearchCancelled:
+        return jsonify({"cancelled": True, "total": 0, "rows": []}), 499
     except Exception as e:
         return jsonify({"error": str(e), "total": 0, "rows": []}), 500
 
@@ -163,27 +328,110 @@ def track_action():
         "ts": datetime.now(timezone.utc).isoformat(),
         "ip": request.headers.get("X-Real-IP") or request.remote_addr,
         "user_agent": request.headers.get("User-Agent", ""),
+        "referer": request.headers.get("Referer"),
         "path": request.path,
         "data": payload,
     }
 
-    log_line = json.dumps(event, ensure_ascii=False) + "\n"
-    try:
-        action_log_queue.put_nowait(log_line)
+    if ACTION_LOG.put(event):
         return jsonify({"ok": True, "queued": True}), 202
-    except Full:
-        return jsonify({"ok": False, "queued": False, "error": "log queue is full"}), 503
+    # очередь не освободилась за ACTION_LOG_BLOCK_MS: событие учтено в dropped (/health/action_log)
+    return jsonify({"ok": False, "queued": False, "error": "log queue is full"}), 503, {"Retry-After": "1"}
     
+def parse_ts(raw, default):
+    # unix секунды или ISO-дата/время (без зоны — UTC)
+    raw = (raw or "").strip()
+    if not raw:
+        return default
+    try:
+        ts = float(raw)
+    except ValueError:
+        pass
+    else:
+        # float() принимает inf/nan и 1e20 — дальше они ломают арифметику корзин в ActionStore.counts
+        if not math.isfinite(ts):
+            raise ValueError(f"not a finite number: {raw}")
+        try:
+            datetime.fromtimestamp(ts, timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError(f"timestamp out of range: {raw}")
+        return ts
+    dt = datetime.fromisoformat(raw)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+@app.get("/v1/actions/stats")
+def actions_stats():
+    # ?from=&to=&bucket=hour|day&group=event|path|none&event=&path=
+    if ACTION_STORE is None:
+        return jsonify({"error": "action store is disabled"}), 404
+    t0 = time.perf_counter()
+    try:
+        ts_to = parse_ts(request.args.get("to"), time.time())
+        ts_from = parse_ts(request.args.get("from"), ts_to - 7 * 86400)
+    except ValueError as e:
+        return jsonify({"error": f"bad from/to: {e}"}), 400
+
+    bucket = (request.args.get("bucket") or ("hour" if ts_to - ts_from <= 3 * 86400 else "day")).strip()
+    if bucket not in BUCKETS:
+        return jsonify({"error": f"bucket must be one of: {', '.join(BUCKETS)}"}), 400
+    group = (request.args.get("group") or "event").strip()
+    if group == "none":
+        group = None
+    elif group not in GROUPS:
+        return jsonify({"error": f"group must be one of: {', '.join(GROUPS)}, none"}), 400
+
+    rows = ACTION_STORE.counts(
+        ts_from, ts_to, bucket=bucket, group=group,
+        event=request.args.get("event"), path=request.args.get("path"),
+    )
+    for r in rows:
+        r["t"] = datetime.fromtimestamp(r["t"], timezone.utc).isoformat()
+    return jsonify({
+        "from": datetime.fromtimestamp(ts_from, timezone.utc).isoformat(),
+        "to": datetime.fromtimestamp(ts_to, timezone.utc).isoformat(),
+        "bucket": bucket,
+        "group": group,
+        "total": sum(r["cnt"] for r in rows),
+        "rows": rows,
+        "took_ms": round((time.perf_counter() - t0) * 1000, 2),
+    })
+
+
 @app.get("/pairs_list")
 def pairs_list():
     limit  = int(request.args.get("limit") or "200")
     offset = int(request.args.get("offset") or "0")
+    after_id = (request.args.get("after_id") or "").strip()
 
     # защита от случайных огромных запросов
     if limit < 1: limit = 1
     if limit > 2000: limit = 2000
     if offset < 0: offset = 0
 
+    if after_id:
+        # keyset: seek по первичному ключу, стоимость не зависит от глубины страницы
+        if not after_id.lstrip("-").isdigit():
+            return jsonify({"error": "after_id must be an integer"}), 400
+        sql = """
+select id, name_tek, name_tep_korr
+from public.v_nomenclature_spec_pairs_v1
+where id > %(after_id)s
+order by id
+limit %(limit)s
+        """
+        rows = pg_query(sql, {"after_id": int(after_id), "limit": limit})
+        next_cursor = rows[-1]["id"] if len(rows) == limit else None
+        return jsonify({
+            "rows": rows,
+            "total": PAIRS_COUNT.get(),
+            "limit": limit,
+            "after_id": int(after_id),
+            "next_cursor": next_cursor,
+        })
+
     sql = """
 select id, name_tek, name_tep_korr
 from public.v_nomenclature_spec_pairs_v1
@@ -191,11 +439,15 @@ order by id
 limit %(limit)s offset %(offset)s
     """
     rows = pg_query(sql, {"limit": limit, "offset": offset})
+    next_cursor = rows[-1]["id"] if len(rows) == limit else None
 
-    sql_cnt = "select count(*) as cnt from public.v_nomenclature_spec_pairs_v1"
-    cnt = pg_query(sql_cnt)[0]["cnt"]
-
-    return jsonify({"rows": rows, "total": cnt, "limit": limit, "offset": offset})
+    return jsonify({
+        "rows": rows,
+        "total": PAIRS_COUNT.get(),
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor,
+    })
 
 
 @app.get("/pairs_rows")
@@ -221,31 +473,46 @@ order by id
     """
     return jsonify({"rows": pg_query(sql, {"ids": ids})})
 
-@app.post("/reindex")
-def reindex():
-    script = "/scripts/etl_pg_to_opensearch.py"
+def reindex_mode():
+    # ?mode=full — полная пересборка; по умолчанию incremental (по журналу etl_changes_v1)
+    mode = (request.args.get("mode") or "incremental").strip().lower()
+    return mode if mode in ("incremental", "full") else None
 
-    def run():
-        try:
-            subprocess.run(["python3", script], check=True)
-        except Exception as e:
-            print("reindex failed:", e)
+def reindex_submit(name):
+    mode = reindex_mode()
+    if mode is None:
+        return jsonify({"error": "mode must be incremental or full"}), 400
+    try:
+        state = REINDEX_JOBS[name].submit(mode)
+    except Exception as e:
+        print(f"reindex {name} failed to start:", e)
+        return jsonify({"error": str(e)}), 500
+    # queued: уже идёт задача по этому индексу, запрос склеен в один отложенный запуск
+    return jsonify({"ok": True, "job": name, "state": state, "started": state == "started", "mode": mode})
 
-    threading.Thread(target=run, daemon=True).start()
-    return jsonify({"ok": True, "started": True})
+@app.post("/reindex")
+def reindex():
+    return reindex_submit("pairs")
 
 @app.post("/reindex_nomen")
 def reindex_nomen():
-    script = "/scripts/etl_nomen_to_opensearch.py"
+    return reindex_submit("nomen")
 
-    def run():
-        try:
-            subprocess.run(["python3", script], check=True)
-        except Exception as e:
-            print("Nomen reindex failed:", e)
+@app.get("/reindex/status")
+def reindex_status():
+    name = (request.args.get("job") or "").strip()
+    if name:
+        if name not in REINDEX_JOBS:
+            return jsonify({"error": f"unknown job: {name}"}), 404
+        return jsonify(REINDEX_JOBS[name].status())
+    return jsonify({"jobs": [j.status() for j in REINDEX_JOBS.values()]})
 
-    threading.Thread(target=run, daemon=True).start()
-    return jsonify({"ok": True, "message": "Nomenclature reindex started"})
+@app.post("/reindex/cancel")
+def reindex_cancel():
+    name = (request.args.get("job") or "").strip()
+    if name not in REINDEX_JOBS:
+        return jsonify({"error": f"job must be one of: {', '.join(REINDEX_JOBS)}"}), 400
+    return jsonify({"ok": True, "job": name, "cancelled": REINDEX_JOBS[name].cancel()})
 
 
 @app.patch("/pairs_update/<int:row_id>")
@@ -268,139 +535,175 @@ returning id, name_tek, name_tep_korr
         rows = pg_query(sql, {"id": row_id, "name_tep_korr": name_tep_korr, "name_tek": name_tek})
         if not rows:
             return jsonify({"error": "row not found"}), 404
+        # правка сразу в индекс пар (через alias); полный /reindex после сохранения не нужен
+        try:
+            OS_INDEXER.upsert(PAIRS_INDEX, rows[0]["id"], rows[0])
+        except Exception as e:
+            print("pairs index enqueue failed:", e)
+        PAIRS_COUNT.invalidate()
         return jsonify(rows[0])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# дерево class_tree_nomen_v1 по одному уровню: без parent_id — корни L1,
+# иначе дети указанных узлов (parent_id можно передать списком через запятую)
+TREE_NOMEN_COLUMNS = ["id", "parent_id", "level", "code", "name", "pending_cnt", "unit", "approved", "note"]
+
+
+@app.get("/tree/nomen")
+def tree_nomen():
+    parent_ids = []
+    for raw in request.args.getlist("parent_id"):
+        parent_ids.extend(x.strip() for x in raw.split(",") if x.strip())
+
+    sql = """
+select
+  id,
+  parent_id,
+  level,
+  case level
+    when 1 then l1_code
+    when 2 then l2_code
+    when 3 then l3_code
+    else coalesce(l4_code, dup_root_id::text)
+  end as code,
+  case level
+    when 1 then l1_name
+    when 2 then l2_name
+    when 3 then l3_name
+    else coalesce(nullif(item_name, ''), l4_name)
+  end as name,
+  pending_cnt,
+  unit,
+  approved,
+  note
+from public.class_tree_nomen_v1
+where {where}
+order by l1_num, l2_num, l3_num, l4_num, level
+    """
+    if parent_ids:
+        rows = pg_query(sql.format(where="parent_id = any(%(parent_ids)s)"), {"parent_ids": parent_ids})
+    else:
+        rows = pg_query(sql.format(where="parent_id is null"))
+
+    with METRICS.timed("json"):
+        body = json.dumps({
+            "parent_id": parent_ids,
+            "columns": TREE_NOMEN_COLUMNS,
+            "rows": [[r[c] for c in TREE_NOMEN_COLUMNS] for r in rows],
+        }, ensure_ascii=False, separators=(",", ":"))
+
+    # ETag по содержимому: повторный запрос того же уровня получает 304 без тела
+    resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(hashlib.sha1(body.encode("utf-8")).hexdigest())
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+
+# отчёты читают сводку report_object_summary_v1 (sql/18_*.sql, триггеры на nomenclature_spec_all_v1):
+# строк в ней — по числу объектов, а не позиций номенклатуры
+REPORT_GROUPS = {
+    # group -> (колонки select, group by, order by)
+    "subobject": ("o.subobject_name as object_name", "o.subobject_name", "o.subobject_name"),
+    "object": ("s.object_id, s.object_code, s.object_name, o.subobject_name",
+               "s.object_id, s.object_code, s.object_name, o.subobject_name", "s.object_code, s.object_id"),
+}
+
+
 @app.get("/reports/nomenclature_by_object")
 def report_nomenclature_by_object():
-    sql = """
+    # ?group=subobject|object&object_id=1,2&q=&min_cnt=
+    group = (request.args.get("group") or "subobject").strip()
+    if group not in REPORT_GROUPS:
+        return jsonify({"error": f"group must be one of: {', '.join(REPORT_GROUPS)}"}), 400
+    cols, group_by, order = REPORT_GROUPS[group]
+
+    where, params = [], {}
+    object_ids = [x.strip() for x in (request.args.get("object_id") or "").split(",") if x.strip()]
+    if object_ids:
+        if not all(x.isdigit() for x in object_ids):
+            return jsonify({"error": "object_id must be integers"}), 400
+        where.append("s.object_id = any(%(object_ids)s)")
+        params["object_ids"] = [int(x) for x in object_ids]
+    q = (request.args.get("q") or "").strip()
+    if q:
+        where.append("(o.subobject_name ilike %(q)s or s.object_name ilike %(q)s)")
+        params["q"] = f"%{q}%"
+    having = ""
+    min_cnt = (request.args.get("min_cnt") or "").strip()
+    if min_cnt:
+        if not min_cnt.isdigit():
+            return jsonify({"error": "min_cnt must be an integer"}), 400
+        having = "having sum(s.total_positions) >= %(min_cnt)s"
+        params["min_cnt"] = int(min_cnt)
+
+    sql = f"""
       select
-        o.subobject_name  as object_name,
-        count(n.id)   as cnt
-      from public.nomenclature_spec_all_v1 n
-      left join public.object_v1 o on n.object_id = o.id
-      group by o.subobject_name
-      order by o.subobject_name
+        {cols},
+        sum(s.total_positions)::bigint                          as cnt,
+        sum(s.classified_positions)::bigint                     as classified,
+        sum(s.total_positions - s.classified_positions)::bigint as unclassified,
+        round(100.0 * sum(s.classified_positions) / nullif(sum(s.total_positions), 0), 2)::float8 as classified_pct
+      from public.report_object_summary_v1 s
+      left join public.object_v1 o on s.object_id = o.id
+      {('where ' + ' and '.join(where)) if where else ''}
+      group by {group_by}
+      {having}
+      order by {order}
     """
-    return jsonify(pg_query(sql))
+    return jsonify(pg_query(sql, params))
     
+def _vom_fingerprint():
+    r = pg_query(VOM_FINGERPRINT_SQL)[0]
+    # шаблон тоже часть выгрузки: заменили файл — пересобрать
+    st = os.stat(XLSX_TEMPLATE)
+    return f"{r['cnt']}:{r['checksum']}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def _vom_build(out_path):
+    with METRICS.timed("xlsx"):
+        return build_vom_xlsx(PG_POOL.stream(VOM_EXPORT_SQL), out_path, XLSX_TEMPLATE, XLSX_SHEET)
+
+
+VOM_CACHE = VomExportCache(
+    VOM_EXPORT_CACHE_DIR,
+    build=_vom_build,
+    fingerprint=_vom_fingerprint,
+    fingerprint_ttl=VOM_EXPORT_FINGERPRINT_TTL,
+)
+if VOM_EXPORT_WATCH_INTERVAL > 0:
+    VOM_CACHE.start_watcher(VOM_EXPORT_WATCH_INTERVAL)
+
+
 @app.get("/export/vom.xlsx")
 def export_vom_xlsx():
-    # 1) запрос (ты говорил: l4_name заменил на item_name — значит берём item_name)
-    sql = """
-    SELECT DISTINCT
-      level,
-      l1_code, l1_name,
-      l2_code, l2_name,
-      l3_code, l3_name,
-      l4_code,
-      item_name,
-      l1_num, l2_num, l3_num, l4_num
-    FROM public.class_tree_nomen_v1
-    WHERE level IN (1,2,3,4)
-    ORDER BY l1_num, l2_num, l3_num, l4_num, level, l1_code, l2_code, l3_code, l4_code;
-    """
-    rows = pg_query(sql)
-
-    # 2) читаем шаблон
     if not os.path.exists(XLSX_TEMPLATE):
         return jsonify({"error": f"template not found: {XLSX_TEMPLATE}"}), 500
 
-    wb = load_workbook(XLSX_TEMPLATE)
-    if XLSX_SHEET not in wb.sheetnames:
-        return jsonify({"error": f"sheet not found: {XLSX_SHEET}"}), 500
-
-    ws = wb[XLSX_SHEET]
-    max_col = ws.max_column
-
-    # строки-образцы стилей в шаблоне
-    ROW_L1, ROW_L2, ROW_L3, ROW_L4 = 2, 3, 4, 5
-
-    def snapshot_row_style(src_row: int):
-        snap = []
-        for col in range(1, max_col + 1):
-            c = ws.cell(src_row, col)
-            snap.append({
-                "style": copy(c._style),
-                "number_format": c.number_format,
-                "alignment": copy(c.alignment),
-                "font": copy(c.font),
-                "border": copy(c.border),
-                "fill": copy(c.fill),
-                "protection": copy(c.protection),
-            })
-        return snap
-
-    STYLE_L1 = snapshot_row_style(ROW_L1)
-    STYLE_L2 = snapshot_row_style(ROW_L2)
-    STYLE_L3 = snapshot_row_style(ROW_L3)
-    STYLE_L4 = snapshot_row_style(ROW_L4)
-
-    def apply_row_style(dst_row: int, style_snap):
-        for col in range(1, max_col + 1):
-            dst = ws.cell(dst_row, col)
-            s = style_snap[col - 1]
-            dst._style = copy(s["style"])
-            dst.number_format = s["number_format"]
-            dst.alignment = copy(s["alignment"])
-            dst.font = copy(s["font"])
-            dst.border = copy(s["border"])
-            dst.fill = copy(s["fill"])
-            dst.protection = copy(s["protection"])
-
-    # 3) чистим лист ниже заголовка
-    if ws.max_row > 1:
-        ws.delete_rows(2, ws.max_row - 1)
-
-    out_row = 2
-
-    def write_line(level: int, code: str, name: str, style_snap):
-        nonlocal out_row
-        ws.insert_rows(out_row)
-        apply_row_style(out_row, style_snap)
-        ws.cell(out_row, 1).value = level
-        ws.cell(out_row, 2).value = code
-        ws.cell(out_row, 5).value = name
-        out_row += 1
-
-    # 4) пишем как есть (по level)
-    for r in rows:
-        lvl = int(r.get("level") or 0)
-
-        if lvl == 1:
-            code, name, style = r.get("l1_code"), r.get("l1_name"), STYLE_L1
-        elif lvl == 2:
-            code, name, style = r.get("l2_code"), r.get("l2_name"), STYLE_L2
-        elif lvl == 3:
-            code, name, style = r.get("l3_code"), r.get("l3_name"), STYLE_L3
-        elif lvl == 4:
-            code, name, style = r.get("l4_code"), r.get("item_name"), STYLE_L4
-        else:
-            continue
-
-        write_line(lvl, code, name, style)
-
-    # перенос строк по столбцу E
-    for rr in range(1, ws.max_row + 1):
-        c = ws.cell(rr, 5)
-        a = copy(c.alignment)
-        a.wrap_text = True
-        c.alignment = a
-
-    # 5) сохраняем во временный файл и отдаём
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
-    tmp_path = tmp.name
-    tmp.close()
-
-    wb.save(tmp_path)
-
-    return send_file(
-        tmp_path,
+    try:
+        art, stale = VOM_CACHE.get(wait_timeout=VOM_EXPORT_WAIT_TIMEOUT)
+    except TemplateError as e:
+        return jsonify({"error": str(e)}), 500
+    except ExportNotReady as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+
+    resp = send_file(
+        art.path,
         as_attachment=True,
         download_name="vom_export.xlsx",
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        etag=art.etag,
+        last_modified=art.built_at,
+        max_age=0,
     )
+    if stale:
+        resp.headers["X-Export-Stale"] = "1"
+    return resp
+
+
+@app.get("/export/vom/status")
+def export_vom_status():
+    return jsonify(VOM_CACHE.status())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+import time
+import threading
+
+# Кэш "тяжёлого" count(*): отдаём последнее посчитанное значение,
+# а пересчитываем в фоне, когда оно устарело (TTL) или его сбросили invalidate().
+# Первый вызов (значения ещё нет) считает синхронно.
+
+
+class CountCache:
+    def __init__(self, fetch, ttl=60.0, name="count"):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._value = None
+        self._updated_at = 0.0
+        self._stale = True
+        self._refreshing = False
+
+    def _refresh(self):
+        try:
+            value = self.fetch()
+            with self._lock:
+                self._value = value
+                self._updated_at = time.monotonic()
+                self._stale = False
+        except Exception as e:
+            print(f"{self.name} refresh failed:", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self):
+        with self._lock:
+            value = self._value
+            expired = self._stale or (time.monotonic() - self._updated_at > self.ttl)
+            start_bg = value is not None and expired and not self._refreshing
+            if start_bg:
+                self._refreshing = True
+
+        if value is None:
+            # холодный старт: считаем в текущем потоке
+            value = self.fetch()
+            with self._lock:
+                self._value = value
+                self._updated_at = time.monotonic()
+                self._stale = False
+            return value
+
+        if start_bg:
+            threading.Thread(target=self._refresh, daemon=True).start()
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+
+    def age(self):
+        with self._lock:
+            if self._value is None:
+                return None
+            return time.monotonic() - self._updated_at
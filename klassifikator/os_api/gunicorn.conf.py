@@ -0,0 +1,16 @@
+import os
+
+# os_api под gunicorn с gthread-воркером: запрос — поток из пула GUNICORN_THREADS.
+# Воркер один: в процессе живут очереди и состояние (REINDEX_JOBS, OS_INDEXER, кэши).
+# Не gevent: сборка ВОМ (openpyxl), gzip ротированных логов и запись в SQLite — CPU без переключений,
+# под gevent они останавливали весь hub (и heartbeat воркера: сборка дольше timeout = kill воркера).
+# Потоки при этом ждут Postgres/OpenSearch параллельно — psycopg2 и сокеты отпускают GIL.
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8010")
+workers = 1
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = None
@@ -0,0 +1,263 @@
+import os
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+from flask import g, request, has_request_context
+from flask.json.provider import DefaultJSONProvider
+
+# Метрики запросов os_api в текстовом формате Prometheus (/metrics), без prometheus_client.
+#   os_api_request_seconds{endpoint,method,status}       — гистограмма времени ответа (до отдачи тела);
+#   os_api_dependency_seconds{dependency,endpoint}        — гистограмма по зависимостям: pg, opensearch, xlsx, json;
+#   os_api_requests_in_flight{endpoint}, os_api_dependency_in_flight{dependency};
+#   os_api_request_errors_total{endpoint,status}          — ответы 5xx и необработанные исключения;
+#   os_api_dependency_errors_total{dependency}            — исключения из зависимостей;
+#   os_api_<stats>{stat}                                  — числовые поля /health/* (пул PG, шлюз поиска, ...).
+# Каждый ответ несёт Server-Timing (pg;dur=..., opensearch;dur=..., total;dur=...) и X-Request-ID
+# (из nginx, иначе свой). Медленные запросы (REQUEST_LOG_SLOW_MS) пишутся в лог вместе с X-Request-ID.
+# Счётчики живут в процессе: gunicorn.conf.py держит один воркер.
+
+REQUEST_LOG = os.getenv("REQUEST_LOG", "slow")                 # slow | all | off
+REQUEST_LOG_SLOW_MS = float(os.getenv("REQUEST_LOG_SLOW_MS", "1000"))
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DEPENDENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# вне запроса (фоновые потоки: CountCache, сборка ВОМ, переиндексация)
+BACKGROUND = "background"
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, v in items:
+            out.extend(self._render_one(labels, v))
+        return out
+
+    def _render_one(self, labels, v):
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, n=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, n=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def dec(self, *labels, n=1):
+        self.inc(*labels, n=-n)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        with self._lock:
+            h = self._values.get(labels)
+            if h is None:
+                # [счётчики по корзинам (не накопительные)..., +Inf], sum
+                h = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            i = 0
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    break
+            else:
+                i = len(self.buckets)
+            h[0][i] += 1
+            h[1] += value
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, (counts, total) in items:
+            acc = 0
+            for b, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, ('le', _num(b)))} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {round(total, 6)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {acc}")
+        return out
+
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    # jsonify/app.json.dumps: сериализация ответа — отдельная зависимость "json"
+    metrics = None
+
+    def dumps(self, obj, **kwargs):
+        with self.metrics.timed("json"):
+            return super().dumps(obj, **kwargs)
+
+
+class RequestMetrics:
+    def __init__(self, app=None, prefix="os_api"):
+        self.prefix = prefix
+        self.requests = Histogram(f"{prefix}_request_seconds", "Request latency until the response is ready.",
+                                  ("endpoint", "method", "status"), REQUEST_BUCKETS)
+        self.in_flight = Gauge(f"{prefix}_requests_in_flight", "Requests being processed.", ("endpoint",))
+        self.errors = Counter(f"{prefix}_request_errors_total", "5xx responses and unhandled exceptions.",
+                              ("endpoint", "status"))
+        self.deps = Histogram(f"{prefix}_dependency_seconds", "Time spent in a dependency call.",
+                              ("dependency", "endpoint"), DEPENDENCY_BUCKETS)
+        self.deps_in_flight = Gauge(f"{prefix}_dependency_in_flight", "Dependency calls in progress.",
+                                    ("dependency",))
+        self.dep_errors = Counter(f"{prefix}_dependency_errors_total", "Dependency calls that raised.",
+                                  ("dependency",))
+        self._metrics = [self.requests, self.in_flight, self.errors, self.deps, self.deps_in_flight, self.dep_errors]
+        self._stats = []            # (имя, функция -> dict) для add_stats
+        if app is not None:
+            self.init_app(app)
+
+    # ---------- подключение ----------
+
+    def init_app(self, app):
+        provider = type("TimedJSONProvider", (_TimedJSONProvider,), {"metrics": self})
+        app.json = provider(app)
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+
+    def add_stats(self, name, fn):
+        """Числовые поля fn() (например PG_POOL.stats) -> gauge <prefix>_<name>{stat="..."}."""
+        self._stats.append((f"{self.prefix}_{name}", fn))
+
+    # ---------- замеры ----------
+
+    @contextmanager
+    def timed(self, dependency):
+        endpoint = _endpoint() if has_request_context() else BACKGROUND
+        self.deps_in_flight.inc(dependency)
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.dep_errors.inc(dependency)
+            raise
+        finally:
+            dt = time.perf_counter() - t0
+            self.deps_in_flight.dec(dependency)
+            self.deps.observe(dt, dependency, endpoint)
+            if has_request_context():
+                t = g.setdefault("_timings", {})
+                dur, n = t.get(dependency, (0.0, 0))
+                t[dependency] = (dur + dt, n + 1)
+
+    def request_id(self):
+        return g.get("_request_id") if has_request_context() else None
+
+    def context(self):
+        # для журналов (slowlog.py): какой запрос и какой маршрут
+        if not has_request_context():
+            return {"request_id": None, "endpoint": BACKGROUND}
+        return {"request_id": g.get("_request_id"), "endpoint": g.get("_endpoint") or _endpoint()}
+
+    # ---------- хуки Flask ----------
+
+    def _before(self):
+        g._t0 = time.perf_counter()
+        g._request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        g._endpoint = _endpoint()
+        self.in_flight.inc(g._endpoint)
+
+    def _after(self, resp):
+        t0 = g.get("_t0")
+        if t0 is None:
+            return resp
+        total = time.perf_counter() - t0
+        endpoint, status = g._endpoint, str(resp.status_code)
+        timings = g.get("_timings") or {}
+        g._recorded = True
+
+        self.requests.observe(total, endpoint, request.method, status)
+        if resp.status_code >= 500:
+            self.errors.inc(endpoint, status)
+
+        parts = [f'{dep};dur={dur * 1000:.1f};desc="{n}x"' for dep, (dur, n) in timings.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        resp.headers["Server-Timing"] = ", ".join(parts)
+        resp.headers["X-Request-ID"] = g._request_id
+
+        ms = total * 1000
+        if REQUEST_LOG == "all" or (REQUEST_LOG == "slow" and ms >= REQUEST_LOG_SLOW_MS):
+            deps = " ".join(f"{dep}={dur * 1000:.1f}ms/{n}" for dep, (dur, n) in timings.items())
+            print(f"request id={g._request_id} {request.method} {request.full_path.rstrip('?')} "
+                  f"status={status} {ms:.1f}ms {deps}".rstrip())
+        return resp
+
+    def _teardown(self, exc):
+        endpoint = g.get("_endpoint")
+        if endpoint is None:
+            return
+        self.in_flight.dec(endpoint)
+        if exc is not None and not g.get("_recorded"):
+            self.errors.inc(endpoint, "exception")
+
+    # ---------- /metrics ----------
+
+    def render(self):
+        out = []
+        for m in self._metrics:
+            out.extend(m.render())
+        for name, fn in self._stats:
+            try:
+                stats = fn()
+            except Exception as e:
+                print(f"metrics: {name} failed:", e)
+                continue
+            out.append(f"# TYPE {name} gauge")
+            for k, v in sorted(stats.items()):
+                if isinstance(v, bool):
+                    v = int(v)
+                if isinstance(v, (int, float)):
+                    out.append(f'{name}{{stat="{_escape(k)}"}} {_num(v)}')
+        return "\n".join(out) + "\n"
+
+
+def _endpoint():
+    # шаблон маршрута, а не путь: /pairs_update/<int:row_id>, иначе метки размножатся
+    rule = request.url_rule
+    return rule.rule if rule is not None else "unmatched"
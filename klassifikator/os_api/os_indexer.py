@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import heapq
+import threading
+from collections import deque
+
+import requests
+
+# Точечная запись документов в OpenSearch (write-through после правок в Postgres).
+# Документы копятся в очереди и уходят одним _bulk раз в flush_ms или по flush_docs штук;
+# повторная правка того же документа до отправки заменяет предыдущую.
+# Неудачные документы (сеть, 429, 5xx) переезжают в очередь повторов с экспоненциальной паузой;
+# остальные ошибки (4xx: mapper_parsing_exception, нет индекса, ...) повтором не лечатся — сразу в dead.
+# Если и повторы кончились — документ остаётся в журнале изменений etl_changes_v1:
+# on_failed(indices) даёт приложению запустить incremental-переиндексацию, она его и доберёт.
+# Каждая правка получает номер (версию); повтор, у ключа которого с тех пор была правка новее
+# (даже уже отправленная), выбрасывается — старый документ не затрёт свежий.
+
+OS_INDEXER_FLUSH_MS = int(os.getenv("OS_INDEXER_FLUSH_MS", "500"))
+OS_INDEXER_FLUSH_DOCS = int(os.getenv("OS_INDEXER_FLUSH_DOCS", "200"))
+OS_INDEXER_MAX_RETRIES = int(os.getenv("OS_INDEXER_MAX_RETRIES", "8"))
+
+def retriable_status(status):
+    return status == 429 or status >= 500
+
+
+class BulkIndexer:
+    def __init__(self, base_url, flush_ms=OS_INDEXER_FLUSH_MS, flush_docs=OS_INDEXER_FLUSH_DOCS,
+                 max_retries=OS_INDEXER_MAX_RETRIES, retry_base=1.0, retry_max=60.0,
+                 timeout=10.0, max_pending=10000, on_indexed=None, on_failed=None):
+        self.base_url = base_url.rstrip("/")
+        self.flush_s = flush_ms / 1000.0
+        self.flush_docs = max(1, flush_docs)
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.on_indexed = on_indexed    # on_indexed(indices) после успешного _bulk (сброс кэшей поиска)
+        self.on_failed = on_failed      # on_failed(indices) — документы ушли в dead, нужна переиндексация
+
+        self._session = requests.Session()
+        self._cond = threading.Condition()
+        self._pending = {}        # (index, id) -> (action, doc, attempts, ver)
+        self._first_at = None     # когда в пустую очередь попал первый документ
+        self._retry = []          # heap: (due, ver, key, action, doc, attempts)
+        self._seq = 0             # номер последней правки (ver)
+        self._latest = {}         # (index, id) -> ver последней правки, пока она не записана / не в dead
+        self._thread = None
+        self._dead = deque(maxlen=100)
+
+        self._stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "indexed": 0,
+            "deleted": 0,
+            "bulk_requests": 0,
+            "retried": 0,
+            "superseded": 0,
+            "failed": 0,
+            "last_error": None,
+            "last_flush_at": None,
+        }
+
+    # ---------- API ----------
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+        return self
+
+    def upsert(self, index, doc_id, doc):
+        self._put(index, doc_id, "index", doc)
+
+    def delete(self, index, doc_id):
+        self._put(index, doc_id, "delete", None)
+
+    def flush(self, timeout=5.0):
+        # дождаться, пока очередь (без повторов) уйдёт в OpenSearch
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._pending:
+                self._first_at = 0.0
+            self._cond.notify_all()
+            while self._pending and time.monotonic() < deadline:
+                self._cond.wait(0.05)
+            return not self._pending
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s.update({
+                "pending": len(self._pending),
+                "retry_queue": len(self._retry),
+                "tracked": len(self._latest),
+                "dead": list(self._dead),
+                "flush_ms": int(self.flush_s * 1000),
+                "flush_docs": self.flush_docs,
+            })
+        return s
+
+    # ---------- очередь ----------
+
+    def _put(self, index, doc_id, action, doc):
+        key = (index, str(doc_id))
+        with self._cond:
+            if key in self._pending:
+                self._stats["coalesced"] += 1
+            elif len(self._pending) >= self.max_pending:
+                raise RuntimeError("os indexer queue is full")
+            self._seq += 1
+            self._latest[key] = self._seq
+            self._pending[key] = (action, doc, 0, self._seq)
+            self._stats["enqueued"] += 1
+            if self._first_at is None:
+                # первый документ в пустой очереди: поток мог уснуть без срока — будим, чтобы завёл flush_ms
+                self._first_at = time.monotonic()
+                self._cond.notify_all()
+            elif len(self._pending) >= self.flush_docs:
+                self._cond.notify_all()
+        if self._thread is None:
+            self.start()
+
+    def _take_batch(self):
+        # под self._cond: ждём flush_docs документов, flush_ms с первого, или срок повтора
+        while True:
+            now = time.monotonic()
+            while self._retry and self._retry[0][0] <= now:
+                _, ver, key, action, doc, attempts = heapq.heappop(self._retry)
+                if self._latest.get(key) != ver:   # более свежая правка (в очереди или уже записана) важнее
+                    self._stats["superseded"] += 1
+                    continue
+                self._pending[key] = (action, doc, attempts, ver)
+                if self._first_at is None:
+                    self._first_at = 0.0
+
+            if self._pending:
+                due = self._first_at + self.flush_s
+                if len(self._pending) >= self.flush_docs or now >= due:
+                    break
+                wait = due - now
+            else:
+                wait = None
+            if self._retry:
+                wait = min(wait if wait is not None else self.retry_max, max(0.0, self._retry[0][0] - now))
+            self._cond.wait(wait)
+
+        keys = list(self._pending)[:self.flush_docs]
+        batch = [(k,) + self._pending.pop(k) for k in keys]
+        self._first_at = time.monotonic() if self._pending else None
+        return batch
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            try:
+                failed, done = self._send(batch)
+            except requests.RequestException as e:
+                # сеть/таймаут: весь пакет на повтор
+                failed, done = [(item, str(e), True) for item in batch], set()
+            except Exception as e:
+                failed, done = [(item, str(e), False) for item in batch], set()
+            dead = set()
+            with self._cond:
+                self._stats["last_flush_at"] = time.time()
+                failed_keys = set()
+                for item, err, retriable in failed:
+                    failed_keys.add(item[0])
+                    if not self._schedule_retry(item, err, retriable):
+                        dead.add(item[0][0])
+                for key, _, _, _, ver in batch:
+                    if key not in failed_keys:
+                        self._forget(key, ver)
+                self._cond.notify_all()
+            if done and self.on_indexed is not None:
+                try:
+                    self.on_indexed(done)
+                except Exception as e:
+                    print("os indexer: on_indexed failed:", e)
+            if dead and self.on_failed is not None:
+                try:
+                    self.on_failed(dead)
+                except Exception as e:
+                    print("os indexer: on_failed failed:", e)
+
+    def _forget(self, key, ver):
+        # под self._cond: версия записана или брошена — если новее правок не было, ключ больше не отслеживаем
+        if self._latest.get(key) == ver:
+            del self._latest[key]
+
+    def _schedule_retry(self, item, err, retriable):
+        # под self._cond; -> False, если документ ушёл в dead (нужна переиндексация)
+        key, action, doc, attempts, ver = item
+        self._stats["last_error"] = err
+        if self._latest.get(key) != ver:
+            # пока пакет был в пути, пришла правка новее — повторять старую незачем
+            self._stats["superseded"] += 1
+            return True
+        if not retriable or attempts + 1 > self.max_retries:
+            self._stats["failed"] += 1
+            self._dead.append({"index": key[0], "id": key[1], "action": action, "error": err, "ts": time.time()})
+            print("os indexer: giving up on", key, err)
+            self._forget(key, ver)
+            return False
+        delay = min(self.retry_max, self.retry_base * (2 ** attempts))
+        heapq.heappush(self._retry, (time.monotonic() + delay, ver, key, action, doc, attempts + 1))
+        self._stats["retried"] += 1
+        return True
+
+    # ---------- _bulk ----------
+
+    def _send(self, batch):
+        """-> (список (item, error, retriable) неудачных документов, индексы с записанными документами)."""
+        lines = []
+        for key, action, doc, _, _ in batch:
+            lines.append(json.dumps({action: {"_index": key[0], "_id": key[1]}}, ensure_ascii=False))
+            if action == "index":
+                lines.append(json.dumps(doc, ensure_ascii=False, default=str))
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+
+        r = self._session.post(
+            f"{self.base_url}/_bulk",
+            data=payload,
+            headers={"Content-Type": "application/x-ndjson"},
+            timeout=self.timeout,
+        )
+        with self._cond:
+            self._stats["bulk_requests"] += 1
+        if r.status_code >= 400:
+            err = f"HTTP {r.status_code}: {r.text[:300]}"
+            return [(item, err, retriable_status(r.status_code)) for item in batch], set()
+
+        failed = []
+        done = set()
+        indexed = deleted = 0
+        for item, res in zip(batch, r.json().get("items") or []):
+            act = list(res.values())[0]
+            status = act.get("status", 200)
+            if act.get("error") is None or (item[1] == "delete" and status == 404):
+                if item[1] == "delete":
+                    deleted += 1
+                else:
+                    indexed += 1
+                done.add(item[0][0])
+                continue
+            err = json.dumps(act.get("error"), ensure_ascii=False)[:500]
+            failed.append((item, err, retriable_status(status)))
+        with self._cond:
+            self._stats["indexed"] += indexed
+            self._stats["deleted"] += deleted
+        return failed, done
@@ -0,0 +1,277 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extras
+
+# Пул соединений к Postgres (Directus DB), общий для os_api и portal_api_edit
+# (файл одинаковый в обоих каталогах: у os_api свой docker build context).
+# Вместо connect/close на каждый запрос держим min..max соединений,
+# проверяем их при выдаче и считаем метрики для /health/pg_pool.
+
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+PG_POOL_WAIT_TIMEOUT = float(os.getenv("PG_POOL_WAIT_TIMEOUT", "10"))
+# соединение, простоявшее без дела дольше этого, проверяем "select 1" перед выдачей
+PG_POOL_CHECK_IDLE = float(os.getenv("PG_POOL_CHECK_IDLE", "30"))
+PG_POOL_MAX_LIFETIME = float(os.getenv("PG_POOL_MAX_LIFETIME", "1800"))
+PG_STATEMENT_TIMEOUT_MS = int(os.getenv("PG_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _Slot:
+    __slots__ = ("conn", "created_at", "released_at")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.released_at = self.created_at
+
+
+class PgPool:
+    def __init__(self, minconn=PG_POOL_MIN, maxconn=PG_POOL_MAX,
+                 wait_timeout=PG_POOL_WAIT_TIMEOUT,
+                 statement_timeout_ms=PG_STATEMENT_TIMEOUT_MS,
+                 check_idle=PG_POOL_CHECK_IDLE,
+                 max_lifetime=PG_POOL_MAX_LIFETIME,
+                 **connect_kwargs):
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.wait_timeout = wait_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+        self.check_idle = check_idle
+        self.max_lifetime = max_lifetime
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = deque()      # свободные _Slot (LIFO: берём самое "тёплое")
+        self._in_use = {}         # id(conn) -> _Slot
+        self._size = 0            # всего открыто (idle + in_use + создаются)
+        self._waiting = 0
+
+        self._stats = {
+            "created": 0,
+            "closed": 0,
+            "checkouts": 0,
+            "checkout_timeouts": 0,
+            "health_check_failures": 0,
+            "wait_count": 0,
+            "wait_time_total_ms": 0.0,
+            "wait_time_max_ms": 0.0,
+        }
+
+    # ---------- соединения ----------
+
+    def _connect(self):
+        kwargs = dict(self.connect_kwargs)
+        if self.statement_timeout_ms > 0:
+            opts = kwargs.get("options") or ""
+            kwargs["options"] = (opts + f" -c statement_timeout={self.statement_timeout_ms}").strip()
+        conn = psycopg2.connect(**kwargs)
+        with self._cond:
+            self._stats["created"] += 1
+        return _Slot(conn)
+
+    def _close(self, slot):
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["closed"] += 1
+            self._cond.notify()
+
+    def _healthy(self, slot):
+        conn = slot.conn
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime > 0 and now - slot.created_at > self.max_lifetime:
+            return False
+        if now - slot.released_at < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("select 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self, timeout=None):
+        timeout = self.wait_timeout if timeout is None else timeout
+        t0 = time.monotonic()
+        deadline = t0 + timeout
+        waited = False
+
+        while True:
+            slot = None
+            create = False
+            with self._cond:
+                while not self._idle and self._size >= self.maxconn:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        self._stats["checkout_timeouts"] += 1
+                        raise PoolTimeout(
+                            f"no free Postgres connection in {timeout:.1f}s (max={self.maxconn})"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(left)
+                    finally:
+                        self._waiting -= 1
+
+                if self._idle:
+                    slot = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    slot = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(slot):
+                with self._cond:
+                    self._stats["health_check_failures"] += 1
+                self._close(slot)
+                continue
+
+            wait_ms = (time.monotonic() - t0) * 1000.0
+            with self._cond:
+                self._in_use[id(slot.conn)] = slot
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["wait_count"] += 1
+                self._stats["wait_time_total_ms"] += wait_ms
+                self._stats["wait_time_max_ms"] = max(self._stats["wait_time_max_ms"], wait_ms)
+            return slot.conn
+
+    def putconn(self, conn, broken=False):
+        with self._cond:
+            slot = self._in_use.pop(id(conn), None)
+        if slot is None:
+            return
+
+        if not broken and not conn.closed:
+            try:
+                # незавершённую транзакцию в пул не возвращаем
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                broken = True
+
+        if broken or conn.closed:
+            self._close(slot)
+            return
+
+        slot.released_at = time.monotonic()
+        with self._cond:
+            self._idle.append(slot)
+            self._cond.notify()
+
+    def fill(self):
+        # прогрев до minconn; ошибки не фатальны — соединения создадутся по требованию
+        while True:
+            with self._cond:
+                if self._size >= self.minconn:
+                    return
+                self._size += 1
+            try:
+                slot = self._connect()
+            except Exception as e:
+                with self._cond:
+                    self._size -= 1
+                print("pg pool warmup failed:", e)
+                return
+            with self._cond:
+                self._idle.append(slot)
+                self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for slot in idle:
+            self._close(slot)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    # ---------- запросы ----------
+
+    def query(self, sql, params=None):
+        with self.connection() as conn:
+            try:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute(sql, params or {})
+                    rows = cur.fetchall() if cur.description is not None else []
+                conn.commit()
+            except Exception:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                raise
+            return [dict(r) for r in rows]
+
+    def stream(self, sql, params=None, batch=2000):
+        # server-side (named) cursor: строки идут пачками, в памяти не больше batch
+        with self.connection() as conn:
+            try:
+                with conn.cursor(name="pg_pool_stream",
+                                 cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.itersize = batch
+                    cur.execute(sql, params or {})
+                    while True:
+                        rows = cur.fetchmany(batch)
+                        if not rows:
+                            break
+                        for r in rows:
+                            yield dict(r)
+                conn.commit()
+            except BaseException:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                raise
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s.update({
+                "min": self.minconn,
+                "max": self.maxconn,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+                "statement_timeout_ms": self.statement_timeout_ms,
+            })
+        s["wait_time_avg_ms"] = (
+            s["wait_time_total_ms"] / s["checkouts"] if s["checkouts"] else 0.0
+        )
+        for k in ("wait_time_total_ms", "wait_time_max_ms", "wait_time_avg_ms"):
+            s[k] = round(s[k], 3)
+        return s
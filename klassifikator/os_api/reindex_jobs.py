@@ -0,0 +1,176 @@
+import os
+import re
+import time
+import signal
+import threading
+import subprocess
+from collections import deque
+
+# Менеджер задач переиндексации (/reindex, /reindex_nomen).
+# На каждый индекс — не больше одного запущенного ETL; повторные POST, пока задача идёт,
+# склеиваются в один отложенный запуск (full поглощает incremental).
+# Прогресс берём из строк "PROGRESS index=<алиас> done=N total=M [generation=<поколение>]" в stdout скрипта.
+
+REINDEX_HISTORY = int(os.getenv("REINDEX_HISTORY", "20"))
+REINDEX_KILL_TIMEOUT = float(os.getenv("REINDEX_KILL_TIMEOUT", "15"))
+
+PROGRESS_RE = re.compile(r"^PROGRESS index=(\S+) done=(\d+) total=(\d+)(?: generation=(\S+))?")
+
+MODE_RANK = {"incremental": 0, "full": 1}
+
+
+class _Run:
+    def __init__(self, mode):
+        self.mode = mode
+        self.proc = None
+        self.started_at = time.time()
+        self.t0 = time.monotonic()
+        self.done = 0
+        self.total = None
+        self.index = None
+        self.generation = None      # поколение, которое строится в режиме swap_alias
+        self.cancelled = False
+        self.tail = deque(maxlen=20)
+
+    def status(self):
+        elapsed = time.monotonic() - self.t0
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total and rate > 0:
+            eta = round(max(0, self.total - self.done) / rate, 1)
+        return {
+            "mode": self.mode,
+            "pid": self.proc.pid if self.proc else None,
+            "started_at": self.started_at,
+            "elapsed_s": round(elapsed, 1),
+            "index": self.index,
+            "generation": self.generation,
+            "rows_done": self.done,
+            "rows_total": self.total,
+            "rows_per_s": round(rate, 1),
+            "eta_s": eta,
+        }
+
+
+class ReindexJob:
+    def __init__(self, name, script, on_done=None):
+        self.name = name
+        self.script = script
+        self.on_done = on_done      # on_done(name, result, mode) после каждого запуска
+
+        self._lock = threading.Lock()
+        self._run = None
+        self._pending = None        # mode отложенного запуска
+        self._last_error = None
+        self._history = deque(maxlen=REINDEX_HISTORY)
+
+    def submit(self, mode):
+        """-> "started" | "queued" (запуск после текущего)."""
+        with self._lock:
+            if self._run is not None:
+                if self._pending is None or MODE_RANK[mode] > MODE_RANK[self._pending]:
+                    self._pending = mode
+                return "queued"
+            self._start(mode)
+            return "started"
+
+    def cancel(self):
+        """Останавливает текущий запуск и сбрасывает отложенный. -> был ли запуск."""
+        with self._lock:
+            self._pending = None
+            run = self._run
+            if run is None or run.proc is None:
+                return False
+            run.cancelled = True
+        try:
+            run.proc.send_signal(signal.SIGTERM)   # ETL по SIGTERM удаляет недостроенное поколение
+        except ProcessLookupError:
+            pass
+        threading.Thread(target=self._kill_after, args=(run.proc,), daemon=True).start()
+        return True
+
+    def _kill_after(self, proc):
+        # ETL, зависший в блокирующем запросе, на SIGTERM может не ответить:
+        # через REINDEX_KILL_TIMEOUT — SIGKILL (stdout закроется, _watch доработает)
+        try:
+            proc.wait(timeout=REINDEX_KILL_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            print(f"reindex {self.name}: no exit {REINDEX_KILL_TIMEOUT:.0f}s after SIGTERM, killing pid {proc.pid}")
+            proc.kill()
+
+    def status(self):
+        with self._lock:
+            return {
+                "job": self.name,
+                "state": "running" if self._run else "idle",
+                "running": self._run.status() if self._run else None,
+                "pending": self._pending,
+                "last_error": self._last_error,
+                "history": list(self._history),
+            }
+
+    # под self._lock
+    def _start(self, mode):
+        run = _Run(mode)
+        run.proc = subprocess.Popen(
+            ["python3", "-u", self.script, "--mode", mode],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        self._run = run
+        threading.Thread(target=self._watch, args=(run,), daemon=True).start()
+
+    def _watch(self, run):
+        proc = run.proc
+        for line in proc.stdout:
+            line = line.rstrip("\n")
+            m = PROGRESS_RE.match(line)
+            if m:
+                with self._lock:
+                    run.index, run.done, run.total = m.group(1), int(m.group(2)), int(m.group(3))
+                    run.generation = m.group(4)
+                continue
+            run.tail.append(line)
+            print(f"[reindex {self.name}] {line}")
+
+        rc = proc.wait()
+
+        if run.cancelled:
+            result, error = "cancelled", None
+        elif rc == 0:
+            result, error = "ok", None
+        else:
+            result = "failed"
+            error = next((l for l in reversed(run.tail) if l.strip()), None) or f"exit code {rc}"
+
+        entry = run.status()
+        entry.update({
+            "finished_at": time.time(),
+            "duration_s": entry.pop("elapsed_s"),
+            "result": result,
+            "exit_code": rc,
+            "error": error,
+        })
+        for k in ("pid", "eta_s"):
+            entry.pop(k)
+
+        with self._lock:
+            self._history.appendleft(entry)
+            if error:
+                self._last_error = {"at": entry["finished_at"], "error": error}
+            self._run = None
+            if self._pending is not None:
+                mode, self._pending = self._pending, None
+                try:
+                    self._start(mode)
+                except Exception as e:
+                    print(f"reindex {self.name}: pending start failed:", e)
+                    self._last_error = {"at": time.time(), "error": str(e)}
+
+        if self.on_done is not None:
+            try:
+                self.on_done(self.name, result, run.mode)
+            except Exception as e:
+                print(f"reindex {self.name}: on_done failed:", e)
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Кэш ответов /api/v1/search: нормализованный (index, q, size) -> готовое JSON-тело.
+# LRU, ограничен по байтам (а не по числу записей) + TTL.
+# У каждого индекса своё поколение: invalidate(index) (переиндексация завершилась,
+# write-through правка ушла в OpenSearch) поднимает его, и все старые записи индекса становятся промахами.
+# Ответ, посчитанный до invalidate, в кэш уже не попадёт (put сверяет поколение на момент get).
+# SEARCH_CACHE_REDIS_URL — общий второй уровень для нескольких процессов (поколения тоже в Redis).
+
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_MB", "64")) * 1024 * 1024
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_REDIS_URL = os.getenv("SEARCH_CACHE_REDIS_URL", "")
+
+# накладные расходы на запись сверх длины тела (ключ, кортеж, узел OrderedDict)
+ENTRY_OVERHEAD = 200
+
+
+def normalize_query(q):
+    # анализатор OpenSearch всё равно приводит к нижнему регистру и режет по пробелам
+    return " ".join((q or "").lower().split())
+
+
+class SearchCache:
+    def __init__(self, max_bytes=SEARCH_CACHE_MAX_BYTES, ttl=SEARCH_CACHE_TTL, redis_url=SEARCH_CACHE_REDIS_URL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (body, size, expires_at, index, gen)
+        self._bytes = 0
+        self._gen = {}                  # index -> поколение (локальное)
+        self._stats = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0, "expired": 0,
+                       "invalidations": 0, "redis_hits": 0, "redis_errors": 0}
+
+        self._redis = None
+        if redis_url:
+            if redis is None:
+                print("search cache: SEARCH_CACHE_REDIS_URL is set but redis package is missing")
+            else:
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    # ---------- API ----------
+
+    def key(self, index, q, size):
+        return (index, normalize_query(q), int(size))
+
+    def get(self, key):
+        """-> (body | None, token). token передать в put() после промаха."""
+        index = key[0]
+        gen = self._generation(index)
+        now = time.monotonic()
+        with self._lock:
+            e = self._entries.get(key)
+            if e is not None:
+                body, size, expires_at, _, e_gen = e
+                if e_gen != gen or now >= expires_at:
+                    self._drop(key)
+                    self._stats["expired"] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return body, (key, gen)
+
+        body = self._redis_get(key, gen)
+        with self._lock:
+            if body is not None:
+                self._stats["hits"] += 1
+                self._stats["redis_hits"] += 1
+                self._store(key, body, gen, now)
+            else:
+                self._stats["misses"] += 1
+        return body, (key, gen)
+
+    def put(self, token, body):
+        key, gen = token
+        if self._generation(key[0]) != gen:
+            return                      # индекс переиндексировали, пока шёл запрос
+        with self._lock:
+            self._store(key, body, gen, time.monotonic())
+            self._stats["puts"] += 1
+        self._redis_put(key, gen, body)
+
+    def invalidate(self, index):
+        with self._lock:
+            self._gen[index] = self._gen.get(index, 0) + 1
+            for k in [k for k, e in self._entries.items() if e[3] == index]:
+                self._drop(k)
+            self._stats["invalidations"] += 1
+        if self._redis is not None:
+            try:
+                self._redis.incr(self._gen_key(index))
+            except Exception as e:
+                self._redis_error(e)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            lookups = s["hits"] + s["misses"]
+            s.update({
+                "hit_ratio": round(s["hits"] / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                "generations": dict(self._gen),
+                "redis": self._redis is not None,
+            })
+        return s
+
+    # ---------- внутреннее ----------
+
+    def _store(self, key, body, gen, now):
+        # под self._lock
+        size = len(body) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (body, size, now + self.ttl, key[0], gen)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            old_key = next(iter(self._entries))
+            self._drop(old_key)
+            self._stats["evictions"] += 1
+
+    def _drop(self, key):
+        e = self._entries.pop(key, None)
+        if e is not None:
+            self._bytes -= e[1]
+
+    def _generation(self, index):
+        if self._redis is not None:
+            try:
+                v = self._redis.get(self._gen_key(index))
+                return int(v) if v is not None else 0
+            except Exception as e:
+                self._redis_error(e)
+        with self._lock:
+            return self._gen.get(index, 0)
+
+    def _gen_key(self, index):
+        return f"search_cache:gen:{index}"
+
+    def _data_key(self, key, gen):
+        h = hashlib.sha1(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return f"search_cache:{key[0]}:{gen}:{h}"
+
+    def _redis_get(self, key, gen):
+        if self._redis is None:
+            return None
+        try:
+            return self._redis.get(self._data_key(key, gen))
+        except Exception as e:
+            self._redis_error(e)
+            return None
+
+    def _redis_put(self, key, gen, body):
+        if self._redis is None:
+            return
+        try:
+            self._redis.set(self._data_key(key, gen), body, ex=max(1, int(self.ttl)))
+        except Exception as e:
+            self._redis_error(e)
+
+    def _redis_error(self, e):
+        with self._lock:
+            self._stats["redis_errors"] += 1
+        print("search cache redis error:", e)
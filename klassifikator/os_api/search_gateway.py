@@ -0,0 +1,118 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Поисковые запросы в OpenSearch (/api/v1/search и др.).
+# Одна Session с ограниченным пулом keep-alive соединений вместо requests.post на каждый запрос:
+# при наборе текста каждая буква раньше открывала новое TCP-соединение.
+# Таймауты — на каждый запрос (connect, read).
+# "Последний выигрывает": запросы с одинаковым ключом клиента (заголовок X-Search-Client)
+# вытесняют предыдущий незавершённый — ему отвечаем SearchCancelled (499), как только он вернётся.
+# Сам поиск в OpenSearch при этом дорабатывает: выбрасывается только ответ.
+# opaque_id уходит в X-Opaque-Id: OpenSearch пишет его в slow log и tasks API (X-Request-ID из nginx).
+
+SEARCH_POOL_SIZE = int(os.getenv("SEARCH_POOL_SIZE", "50"))
+SEARCH_CONNECT_TIMEOUT = float(os.getenv("SEARCH_CONNECT_TIMEOUT", "2"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", os.getenv("HTTP_TIMEOUT", "10")))
+
+
+class SearchCancelled(Exception):
+    """Запрос вытеснен более новым запросом того же клиента."""
+
+
+class _Ticket:
+    __slots__ = ("seq", "cancelled")
+
+    def __init__(self, seq):
+        self.seq = seq
+        self.cancelled = False
+
+
+class SearchGateway:
+    def __init__(self, base_url, pool_size=SEARCH_POOL_SIZE, connect_timeout=SEARCH_CONNECT_TIMEOUT,
+                 timeout=SEARCH_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = max(1, pool_size)
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+
+        self._session = requests.Session()
+        # pool_block: не больше pool_size соединений; остальные ждут свободное, а не открывают лишние
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True, max_retries=0)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._latest = {}           # ключ клиента -> _Ticket текущего запроса
+        self._seq = 0
+        self._stats = {
+            "requests": 0,
+            "errors": 0,
+            "cancelled": 0,
+            "in_flight": 0,
+            "last_error": None,
+        }
+
+    # ---------- API ----------
+
+    def search(self, index, body, client=None, timeout=None, opaque_id=None):
+        """POST /<index>/_search -> requests.Response. SearchCancelled, если вытеснен."""
+        url = f"{self.base_url}/{index}/_search"
+        headers = {"X-Opaque-Id": opaque_id} if opaque_id else None
+        return self._call(url, body, client, timeout, headers)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s["clients"] = len(self._latest)
+        s.update({
+            "pool_size": self.pool_size,
+            "timeout_s": self.timeout,
+            "connect_timeout_s": self.connect_timeout,
+        })
+        return s
+
+    # ---------- внутреннее ----------
+
+    def _post(self, url, body, timeout, headers=None):
+        return self._session.post(url, json=body, headers=headers,
+                                  timeout=(self.connect_timeout, timeout or self.timeout))
+
+    def _call(self, url, body, client, timeout, headers=None):
+        ticket = self._register(client)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["in_flight"] += 1
+        try:
+            r = self._post(url, body, timeout, headers)
+            if ticket is not None and ticket.cancelled:
+                raise SearchCancelled()
+            return r
+        except SearchCancelled:
+            with self._lock:
+                self._stats["cancelled"] += 1
+            raise
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                self._stats["last_error"] = str(e)
+            raise
+        finally:
+            with self._lock:
+                self._stats["in_flight"] -= 1
+                if client and self._latest.get(client) is ticket:
+                    del self._latest[client]
+
+    def _register(self, client):
+        if not client:
+            return None
+        with self._lock:
+            self._seq += 1
+            ticket = _Ticket(self._seq)
+            prev = self._latest.get(client)
+            self._latest[client] = ticket
+        if prev is not None:
+            prev.cancelled = True
+        return ticket
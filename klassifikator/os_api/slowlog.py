@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from queue import Queue, Full
+
+from search_gateway import SearchCancelled
+
+# Журнал медленных запросов os_api (/admin/slowlog, заголовок X-Admin-Token = ADMIN_TOKEN), включается SLOWLOG=1.
+# Запрос к Postgres дольше SLOWLOG_PG_MS: SQL, параметры и план EXPLAIN (ANALYZE, BUFFERS),
+# снятый повторным выполнением в отдельной транзакции, которая откатывается.
+# DML (update/insert/delete) и упавшие запросы (statement_timeout) — только EXPLAIN без ANALYZE.
+# Поиск в OpenSearch дольше SLOWLOG_OS_MS: тело запроса и вывод того же запроса с profile: true.
+# План/профиль снимает фоновый поток — ответ пользователю не ждёт; один и тот же запрос
+# (по тексту SQL / индексу+телу) профилируется не чаще раза в SLOWLOG_CAPTURE_INTERVAL секунд.
+# Хранятся последние SLOWLOG_SIZE записей.
+
+SLOWLOG_ENABLED = os.getenv("SLOWLOG", "0") == "1"
+SLOWLOG_PG_MS = float(os.getenv("SLOWLOG_PG_MS", "500"))
+SLOWLOG_OS_MS = float(os.getenv("SLOWLOG_OS_MS", "500"))
+SLOWLOG_SIZE = int(os.getenv("SLOWLOG_SIZE", "200"))
+SLOWLOG_CAPTURE_INTERVAL = float(os.getenv("SLOWLOG_CAPTURE_INTERVAL", "300"))
+SLOWLOG_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOWLOG_EXPLAIN_TIMEOUT_MS", "60000"))
+SLOWLOG_MAX_PROFILE_BYTES = int(os.getenv("SLOWLOG_MAX_PROFILE_BYTES", "262144"))
+SLOWLOG_MAX_KEYS = int(os.getenv("SLOWLOG_MAX_KEYS", "5000"))
+
+READ_ONLY_PREFIXES = ("select", "with", "values", "table")
+
+
+def normalize_sql(sql):
+    return " ".join(sql.split())
+
+
+def _jsonable(v):
+    try:
+        json.dumps(v)
+        return v
+    except (TypeError, ValueError):
+        if isinstance(v, dict):
+            return {str(k): _jsonable(x) for k, x in v.items()}
+        if isinstance(v, (list, tuple)):
+            return [_jsonable(x) for x in v]
+        return str(v)
+
+
+class SlowLog:
+    def __init__(self, pool, search, context=None, enabled=SLOWLOG_ENABLED, pg_ms=SLOWLOG_PG_MS,
+                 os_ms=SLOWLOG_OS_MS, size=SLOWLOG_SIZE, capture_interval=SLOWLOG_CAPTURE_INTERVAL):
+        self.pool = pool
+        self.search_gw = search
+        self.context = context          # -> dict (request_id, endpoint) текущего запроса
+        self.enabled = enabled
+        self.pg_s = pg_ms / 1000.0
+        self.os_s = os_ms / 1000.0
+        self.capture_interval = capture_interval
+
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=max(1, size))
+        self._seq = 0
+        # ключ запроса -> (monotonic, id записи с планом), по возрастанию времени;
+        # старше capture_interval и сверх SLOWLOG_MAX_KEYS — вытесняются (текст SQL / тело поиска в ключе)
+        self._captured_at = OrderedDict()
+        self._queue = Queue(maxsize=100)
+        self._thread = None
+        self._stats = {"recorded": 0, "captured": 0, "capture_skipped": 0, "capture_dropped": 0,
+                       "capture_errors": 0}
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    # ---------- замер ----------
+
+    def pg(self, sql, params=None):
+        if not self.enabled:
+            return nullcontext()
+        return self._track("pg", self.pg_s, {"sql": sql, "params": params})
+
+    def search(self, index, body):
+        if not self.enabled:
+            return nullcontext()
+        return self._track("opensearch", self.os_s, {"index": index, "body": body})
+
+    @contextmanager
+    def _track(self, kind, threshold_s, query):
+        t0 = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            dt = time.perf_counter() - t0
+            # вытесненный поиск (SearchCancelled) не медленный — его просто отменили
+            if dt >= threshold_s and not isinstance(error, SearchCancelled):
+                self._record(kind, dt, threshold_s, query, error)
+
+    def _record(self, kind, dt, threshold_s, query, error):
+        entry = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "kind": kind,
+            "duration_ms": round(dt * 1000, 1),
+            "threshold_ms": round(threshold_s * 1000, 1),
+            "error": str(error) if error is not None else None,
+        }
+        if self.context is not None:
+            try:
+                entry.update(self.context())
+            except Exception:
+                pass
+        if kind == "pg":
+            entry["sql"] = normalize_sql(query["sql"])
+            entry["params"] = _jsonable(query["params"])
+            key = ("pg", entry["sql"])
+        else:
+            entry["index"] = query["index"]
+            entry["body"] = _jsonable(query["body"])
+            key = ("opensearch", query["index"], json.dumps(entry["body"], sort_keys=True, ensure_ascii=False))
+
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            self._seq += 1
+            entry["id"] = self._seq
+            self._stats["recorded"] += 1
+            prev = self._captured_at.get(key)
+            recent = prev is not None and now - prev[0] < self.capture_interval
+            if recent:
+                entry["capture"] = "skipped"
+                entry["captured_in"] = prev[1]      # id записи, где этот запрос уже разобран
+                self._stats["capture_skipped"] += 1
+            else:
+                entry["capture"] = "pending"
+                self._captured_at[key] = (now, entry["id"])
+                self._captured_at.move_to_end(key)
+                while len(self._captured_at) > SLOWLOG_MAX_KEYS:
+                    self._captured_at.popitem(last=False)
+            self._entries.append(entry)
+        if recent:
+            return
+        try:
+            self._queue.put_nowait((entry, query, key))
+        except Full:
+            with self._lock:
+                entry["capture"] = "dropped"
+                self._captured_at.pop(key, None)
+                self._stats["capture_dropped"] += 1
+
+    # под self._lock
+    def _evict(self, now):
+        while self._captured_at:
+            key, (at, _) = next(iter(self._captured_at.items()))
+            if now - at < self.capture_interval:
+                break
+            self._captured_at.popitem(last=False)
+
+    # ---------- захват плана / профиля (фоновый поток) ----------
+
+    def _loop(self):
+        while True:
+            entry, query, key = self._queue.get()
+            t0 = time.perf_counter()
+            try:
+                if entry["kind"] == "pg":
+                    result = self._explain(query["sql"], query["params"], analyze=entry["error"] is None)
+                else:
+                    result = self._profile(query["index"], query["body"])
+                state = "done"
+                with self._lock:
+                    self._stats["captured"] += 1
+            except Exception as e:
+                result = {"capture_error": str(e)}
+                state = "failed"
+                with self._lock:
+                    self._stats["capture_errors"] += 1
+                    self._captured_at.pop(key, None)    # следующий медленный повтор попробует снова
+            with self._lock:
+                entry.update(result)
+                entry["capture"] = state
+                entry["capture_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+    def _explain(self, sql, params, analyze):
+        analyze = analyze and normalize_sql(sql).lower().startswith(READ_ONLY_PREFIXES)
+        with self.pool.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    if analyze:
+                        # ANALYZE запрос выполняет: volatile-функции в select не должны ничего записать
+                        cur.execute("set transaction read only")
+                    cur.execute(f"set local statement_timeout = {int(SLOWLOG_EXPLAIN_TIMEOUT_MS)}")
+                    cur.execute(("explain (analyze, buffers) " if analyze else "explain ") + sql, params or {})
+                    plan = "\n".join(r[0] for r in cur.fetchall())
+            finally:
+                conn.rollback()
+        return {"plan": plan, "plan_analyzed": analyze}
+
+    def _profile(self, index, body):
+        r = self.search_gw.search(index, dict(body, profile=True))
+        r.raise_for_status()
+        data = r.json()
+        profile = data.get("profile")
+        raw = json.dumps(profile, ensure_ascii=False)
+        if len(raw) > SLOWLOG_MAX_PROFILE_BYTES:
+            # полный профиль по всем шардам бывает на мегабайты: оставляем первый шард
+            shards = (profile or {}).get("shards") or []
+            profile = {"shards": shards[:1], "truncated": True, "shards_total": len(shards)}
+        return {"profile": profile, "profile_took_ms": data.get("took")}
+
+    # ---------- чтение ----------
+
+    def entries(self, kind=None, limit=50, since_id=0):
+        with self._lock:
+            items = [dict(e) for e in reversed(self._entries)
+                     if (kind is None or e["kind"] == kind) and e["id"] > since_id]
+        return items[:max(0, limit)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._captured_at.clear()
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s["entries"] = len(self._entries)
+        s.update({
+            "enabled": self.enabled,
+            "pg_ms": self.pg_s * 1000,
+            "os_ms": self.os_s * 1000,
+            "size": self._entries.maxlen,
+            "capture_interval_s": self.capture_interval,
+            "capture_keys": len(self._captured_at),
+            "queue": self._queue.qsize(),
+        })
+        return s
+
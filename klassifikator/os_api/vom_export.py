@@ -0,0 +1,325 @@
+import os
+import glob
+import time
+import hashlib
+import threading
+from copy import copy
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle
+
+# Выгрузка "Каталог ВОМа" в xlsx в режиме write-only:
+# строки только дописываются в конец (без insert_rows), стиль каждой ячейки —
+# готовый NamedStyle, посчитанный один раз на уровень из строк-образцов шаблона.
+
+# l4_name заменён на item_name — для L4 берём item_name
+VOM_EXPORT_SQL = """
+SELECT DISTINCT
+  level,
+  l1_code, l1_name,
+  l2_code, l2_name,
+  l3_code, l3_name,
+  l4_code,
+  item_name,
+  l1_num, l2_num, l3_num, l4_num
+FROM public.class_tree_nomen_v1
+WHERE level IN (1,2,3,4)
+ORDER BY l1_num, l2_num, l3_num, l4_num, level, l1_code, l2_code, l3_code, l4_code;
+"""
+
+# дешёвый отпечаток содержимого: число строк + сумма хэшей выгружаемых колонок.
+# approved/note в выгрузку не попадают, поэтому их правки кэш не сбрасывают.
+VOM_FINGERPRINT_SQL = """
+SELECT
+  count(*) AS cnt,
+  coalesce(sum(hashtext(concat_ws('|',
+    level, l1_code, l1_name, l2_code, l2_name, l3_code, l3_name, l4_code, item_name,
+    l1_num, l2_num, l3_num, l4_num
+  ))::bigint), 0) AS checksum
+FROM public.class_tree_nomen_v1
+WHERE level IN (1,2,3,4);
+"""
+
+# строки-образцы стилей в шаблоне: level -> номер строки
+TEMPLATE_STYLE_ROWS = {1: 2, 2: 3, 3: 4, 4: 5}
+
+COL_LEVEL, COL_CODE, COL_NAME = 1, 2, 5
+
+LEVEL_FIELDS = {
+    1: ("l1_code", "l1_name"),
+    2: ("l2_code", "l2_name"),
+    3: ("l3_code", "l3_name"),
+    4: ("l4_code", "item_name"),
+}
+
+
+class TemplateError(Exception):
+    pass
+
+
+def _named_style(name, src, wrap_text=False):
+    alignment = copy(src.alignment)
+    if wrap_text:
+        alignment.wrap_text = True
+    return NamedStyle(
+        name=name,
+        font=copy(src.font),
+        fill=copy(src.fill),
+        border=copy(src.border),
+        alignment=alignment,
+        number_format=src.number_format,
+        protection=copy(src.protection),
+    )
+
+
+def _register(wb, ws, style):
+    # NamedStyle регистрируем в книге один раз и запоминаем его StyleArray:
+    # на каждую ячейку дальше копируется готовый массив индексов, без поиска стиля по имени
+    wb.add_named_style(style)
+    proto = WriteOnlyCell(ws)
+    proto.style = style.name
+    return proto._style
+
+
+def build_vom_xlsx(rows, out, template_path, sheet_name):
+    """Пишет xlsx в out (путь или файловый объект), rows — итератор dict-строк VOM_EXPORT_SQL."""
+    tpl = load_workbook(template_path)
+    if sheet_name not in tpl.sheetnames:
+        raise TemplateError(f"sheet not found: {sheet_name}")
+    tws = tpl[sheet_name]
+    max_col = tws.max_column
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+
+    # ширины колонок и закрепление — как в шаблоне (до первой записи строк)
+    for key, dim in tws.column_dimensions.items():
+        if dim.width:
+            ws.column_dimensions[key].width = dim.width
+    ws.freeze_panes = tws.freeze_panes
+
+    # перенос строк по столбцу E сразу в стилях, без второго прохода по листу
+    header_styles = [
+        _register(wb, ws, _named_style(f"vom_h_c{col}", tws.cell(1, col), wrap_text=(col == COL_NAME)))
+        for col in range(1, max_col + 1)
+    ]
+
+    level_styles = {}
+    for level, src_row in TEMPLATE_STYLE_ROWS.items():
+        level_styles[level] = [
+            _register(wb, ws, _named_style(f"vom_l{level}_c{col}", tws.cell(src_row, col),
+                                           wrap_text=(col == COL_NAME)))
+            for col in range(1, max_col + 1)
+        ]
+
+    header = []
+    for col in range(1, max_col + 1):
+        c = WriteOnlyCell(ws, value=tws.cell(1, col).value)
+        c._style = copy(header_styles[col - 1])
+        header.append(c)
+    ws.append(header)
+
+    out_row = 1
+    for r in rows:
+        level = int(r.get("level") or 0)
+        fields = LEVEL_FIELDS.get(level)
+        if fields is None:
+            continue
+
+        values = {COL_LEVEL: level, COL_CODE: r.get(fields[0]), COL_NAME: r.get(fields[1])}
+        styles = level_styles[level]
+        line = []
+        for col in range(1, max_col + 1):
+            c = WriteOnlyCell(ws, value=values.get(col))
+            c._style = copy(styles[col - 1])
+            line.append(c)
+        ws.append(line)
+        out_row += 1
+
+    if tws.auto_filter.ref:
+        first, _, last = tws.auto_filter.ref.partition(":")
+        ws.auto_filter.ref = f"{first}:{(last or first).rstrip('0123456789')}{max(out_row, 2)}"
+
+    wb.save(out)
+    return out_row - 1
+
+
+class ExportNotReady(Exception):
+    pass
+
+
+class VomArtifact:
+    __slots__ = ("path", "fingerprint", "etag", "built_at", "rows", "build_s")
+
+    def __init__(self, path, fingerprint, etag, built_at, rows=None, build_s=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.etag = etag
+        self.built_at = built_at
+        self.rows = rows
+        self.build_s = build_s
+
+
+class VomExportCache:
+    """Последний собранный xlsx на диске, ключ — отпечаток class_tree_nomen_v1 (+ шаблона).
+
+    Сборка идёт в фоновом потоке. Если данные поменялись, запрос сразу получает прежний файл
+    (stale), а новая сборка идёт сама; ждут её только пока собранного файла нет вовсе.
+    """
+
+    def __init__(self, cache_dir, build, fingerprint, fingerprint_ttl=5.0):
+        self.cache_dir = cache_dir
+        self.build = build              # build(out_path) -> rows
+        self.fingerprint = fingerprint  # fingerprint() -> str
+        self.fingerprint_ttl = fingerprint_ttl
+
+        self._lock = threading.Lock()
+        self._artifact = None
+        self._building = None           # (fingerprint, threading.Event)
+        self._error = None
+        self._fp = None
+        self._fp_at = 0.0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, fp):
+        return hashlib.sha1(fp.encode("utf-8")).hexdigest()[:20]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"vom_{key}.xlsx")
+
+    def _current_fingerprint(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._fp is not None and now - self._fp_at < self.fingerprint_ttl:
+                return self._fp
+        fp = self.fingerprint()
+        with self._lock:
+            self._fp, self._fp_at = fp, now
+        return fp
+
+    def _run_build(self, fp, ev):
+        key = self._key(fp)
+        path = self._path(key)
+        tmp_path = path + f".{os.getpid()}.tmp"
+        try:
+            t0 = time.time()
+            rows = self.build(tmp_path)
+            os.replace(tmp_path, path)
+            art = VomArtifact(path, fp, key, time.time(), rows=rows, build_s=round(time.time() - t0, 3))
+            with self._lock:
+                self._artifact, self._error = art, None
+            self._remove_old(path)
+        except Exception as e:
+            print("vom export build failed:", e)
+            with self._lock:
+                self._error = e
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        finally:
+            with self._lock:
+                self._building = None
+            ev.set()
+
+    def _remove_old(self, keep):
+        # файлы прежних отпечатков (в т.ч. от прошлых запусков процесса);
+        # открытые send_file дескрипторы дочитают файл
+        for p in glob.glob(os.path.join(glob.escape(self.cache_dir), "vom_*.xlsx")):
+            if p != keep:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def _ensure_build(self, fp):
+        # вызывается под self._lock; возвращает Event текущей сборки
+        if self._building is not None:
+            return self._building[1]
+        ev = threading.Event()
+        self._building = (fp, ev)
+        threading.Thread(target=self._run_build, args=(fp, ev), daemon=True).start()
+        return ev
+
+    def _adopt_existing(self, fp):
+        # файл от прошлого запуска процесса с тем же отпечатком — используем как есть
+        path = self._path(self._key(fp))
+        if os.path.exists(path):
+            self._artifact = VomArtifact(path, fp, self._key(fp), os.path.getmtime(path))
+            return True
+        return False
+
+    def _adopt_latest(self):
+        # после перезапуска: самый свежий файл прежнего отпечатка — отдавать как stale, пока идёт сборка
+        paths = glob.glob(os.path.join(glob.escape(self.cache_dir), "vom_*.xlsx"))
+        if not paths:
+            return None
+        path = max(paths, key=os.path.getmtime)
+        key = os.path.basename(path)[len("vom_"):-len(".xlsx")]
+        self._artifact = VomArtifact(path, None, key, os.path.getmtime(path))
+        return self._artifact
+
+    def get(self, wait_timeout=60.0):
+        """-> (artifact, stale). stale=True — отдан прежний файл, новая сборка идёт в фоне.
+
+        wait_timeout — сколько ждать первую сборку, когда отдать нечего.
+        """
+        fp = self._current_fingerprint()
+        with self._lock:
+            art = self._artifact
+            if art is not None and art.fingerprint == fp:
+                return art, False
+            if self._adopt_existing(fp):
+                return self._artifact, False
+            ev = self._ensure_build(fp)
+            if art is None:
+                art = self._adopt_latest()
+            if art is not None:
+                return art, True
+
+        ev.wait(wait_timeout)
+        with self._lock:
+            art, err = self._artifact, self._error
+        if art is not None:
+            return art, art.fingerprint != fp
+        if err is not None:
+            raise err
+        raise ExportNotReady("export is being built")
+
+    def refresh_if_changed(self):
+        # для фонового наблюдателя: только запускает сборку, не ждёт
+        fp = self._current_fingerprint()
+        with self._lock:
+            art = self._artifact
+            if art is not None and art.fingerprint == fp:
+                return False
+            if self._adopt_existing(fp):
+                return False
+            self._ensure_build(fp)
+            return True
+
+    def start_watcher(self, interval):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh_if_changed()
+                except Exception as e:
+                    print("vom export watcher failed:", e)
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def status(self):
+        with self._lock:
+            art = self._artifact
+            return {
+                "building": self._building is not None,
+                "fingerprint": self._fp,
+                "etag": art.etag if art else None,
+                "built_at": art.built_at if art else None,
+                "rows": art.rows if art else None,
+                "build_s": art.build_s if art else None,
+                "last_error": str(self._error) if self._error else None,
+            }
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сверка и микробенчмарк normalize_name (etl_nom.py).
+
+1) Сверка: новое ядро должно совпадать байт в байт с прежней реализацией (legacy_normalize_name ниже)
+   на корпусе — сгенерированном (с "неудобными" случаями) и/или из файла (--input, одна строка = одно имя).
+2) Скорость: имён/с для legacy, normalize_name и normalize_names (список целиком), с морфологией и без.
+
+  python3 bench_normalize.py                       # 50k сгенерированных имён
+  python3 bench_normalize.py --input names.txt     # например, выгрузка full_name из Postgres
+"""
+
+import re
+import sys
+import time
+import random
+import argparse
+
+import etl_nom as m
+
+# ====== прежняя реализация (эталон, не менять) ======
+
+def _legacy_strip_edges(token: str) -> str:
+    return re.sub(r"^[^\wА-Яа-яЁё]+|[^\wА-Яа-яЁё]+$", "", token)
+
+def _legacy_lower_first_alpha(token: str) -> str:
+    mm = re.search(r"[A-Za-zА-Яа-яЁё]", token)
+    if not mm:
+        return token
+    i = mm.start()
+    return token[:i] + token[i].lower() + token[i+1:]
+
+def _legacy_norm_caps_token(tok: str) -> str:
+    core = _legacy_strip_edges(tok)
+    if not core:
+        return tok
+    if core.isalpha() and core.upper() == core and len(core) >= 2 and core.upper() not in m.TERMS_UPPER:
+        return tok.replace(core, core.lower())
+    return tok
+
+def _legacy_replace_dim_x(s: str) -> str:
+    s = m.DIM_NUM_RE.sub("х", s)
+    s = re.sub(r"(\d)\s*х\s*(\d)", r"\1х\2", s)
+    return s
+
+def legacy_normalize_name(s: str) -> str:
+    if s is None:
+        return ""
+    s = str(s)
+
+    s = s.replace("\r\n", " ").replace("\n", " ").replace("\r", " ")
+    s = m.WS_RE.sub(" ", s).strip()
+
+    s = s.translate(m.QUOTES_MAP)
+
+    s = m.SERVICE_CODE_RE.sub(" ", s)
+    s = m.WS_RE.sub(" ", s).strip()
+
+    s = _legacy_replace_dim_x(s)
+
+    s = m.TRAIL_PUNCT_RE.sub("", s).strip()
+    s = m.TRAIL_JUNK_RE.sub("", s).strip()
+
+    if not s:
+        return ""
+
+    toks = s.split(" ")
+    toks = [_legacy_norm_caps_token(t) for t in toks]
+
+    if m.MORPH and len(toks) >= 2:
+        max_i = min(m.N_LOOKAHEAD_NOUN, len(toks))
+
+        noun_i = None
+        for i in range(1, max_i):
+            w = _legacy_strip_edges(toks[i])
+            if not w or w.upper() in m.TERMS_UPPER:
+                continue
+            if not re.fullmatch(r"[A-Za-zА-Яа-яЁё-]+", w):
+                continue
+            g = m._grammemes(w)
+            if ("NOUN" in g) or ("NPRO" in g):
+                noun_i = i
+                break
+
+        if noun_i is not None:
+            t0 = toks[noun_i - 1]
+            t1 = toks[noun_i]
+            w0, w1 = _legacy_strip_edges(t0), _legacy_strip_edges(t1)
+
+            if w0 and w1 and w0.isalpha() and w1.isalpha():
+                g0 = m._grammemes(w0)
+                g1 = m._grammemes(w1)
+
+                is_adj0  = ("ADJF" in g0) or ("ADJS" in g0)
+                is_noun1 = ("NOUN" in g1) or ("NPRO" in g1)
+
+                if is_adj0 and is_noun1:
+                    noun_word = m._inflect(w1, frozenset({"sing", "nomn"}))
+
+                    feats = {"sing", "nomn"}
+                    if "masc" in g1: feats.add("masc")
+                    if "femn" in g1: feats.add("femn")
+                    if "neut" in g1: feats.add("neut")
+
+                    adj_word = m._inflect(w0, frozenset(feats))
+
+                    t1_new = re.sub(re.escape(w1), noun_word, t1, count=1)
+                    t0_new = re.sub(re.escape(w0), adj_word, t0, count=1)
+                    t0_new = _legacy_lower_first_alpha(t0_new)
+
+                    rest = toks[:noun_i-1] + toks[noun_i+1:]
+                    toks = [t1_new, t0_new] + rest
+
+    s = " ".join(toks)
+    s = m.WS_RE.sub(" ", s).strip()
+
+    if s:
+        s = s[0].upper() + s[1:]
+    return s
+
+# ====== корпус ======
+
+WORDS = [
+    "Кабель", "кабель", "КАБЕЛЬ", "силовой", "СИЛОВОЙ", "медный", "ВВГнг(А)-LS", "ВВГнг", "ПВХ", "НГ",
+    "Труба", "трубы", "стальная", "стальные", "электросварная", "Провод", "установочный", "Щит",
+    "распределительный", "ЩРН", "Муфта", "соединительная", "Насос", "центробежный", "Шкаф", "управления",
+    "Краска", "огнезащитная", "Лестница", "пожарная", "Светильник", "светодиодный", "IP65", "ГОСТ",
+    "10704-91", "ТУ", "3х2,5", "3x2.5", "25 х 3", "100*50*5", "4×16", "57Х3,5", "DN50", "Ду50", "м2",
+    "«Хомут»", "“Lux”", "'Ёлка'", "ёмкость", "Ёмкость", "№5", "(п.4)", "L=6м", "-", "—", "_", "...",
+    "_х000D_", "_x000D_", "_ х 000D _", "_000A_", "a_b", "ИБП", "UPS", "LAN", "кабель-канал", "Кабель-канал",
+    "тип:", "мод.", "арт.", "шт.", "1/2\"", "к-т", "5%", "\\d", "\\1", "Ω", "²", "½", "١٢", "Ⅻ",
+]
+
+JUNK = ["", " ", "  ", "\t", " ", "\r\n", "\n", "\r", " ", "　", "\x0b", "\x85", " ",
+        ".", "!", ",", ";", ":", "…", ". ", "_", "-", "–", "—", " - ", "__", ";.", "\x1c"]
+
+def make_corpus(n: int, seed: int = 1) -> list:
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        parts = []
+        for _ in range(rnd.randint(1, 8)):
+            parts.append(rnd.choice(WORDS))
+            parts.append(rnd.choice([" "] * 6 + JUNK))
+        s = "".join(parts)
+        if rnd.random() < 0.3:
+            s = rnd.choice(JUNK) + s
+        if rnd.random() < 0.4:
+            s = s + rnd.choice(JUNK) + rnd.choice(JUNK)
+        out.append(s)
+    # краевые случаи
+    out += ["", " ", "\r\n", "...", "_ _", "—", None, "a", "А", "1 х 2 х 3", "1х 2 х3", "2 x 3 x 4",
+            "Кабель _х000D_ силовой _x000d_", "Силовой кабель.", "Стальная труба 57Х3,5 —", "ГОСТ ТУ IP"]
+    return out
+
+# ====== запуск ======
+
+def check(corpus, morph_on: bool) -> int:
+    bad = 0
+    for x in corpus:
+        a, b = legacy_normalize_name(x), m.normalize_name(x)
+        if a != b:
+            bad += 1
+            if bad <= 10:
+                print(f"  MISMATCH morph={morph_on}: {x!r}\n    legacy={a!r}\n    new   ={b!r}")
+    return bad
+
+def bench(fn, corpus, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(corpus)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return len(corpus) / best
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", help="файл с именами, по одному в строке")
+    ap.add_argument("-n", type=int, default=50000, help="сколько имён сгенерировать")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    corpus = make_corpus(args.n)
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            corpus += [line.rstrip("\n") for line in f]
+    uniq = len(set(corpus))
+    print(f"corpus: {len(corpus)} names ({uniq} unique)")
+
+    morph = m.MORPH
+    failed = 0
+    for morph_on in ([True, False] if morph else [False]):
+        m.MORPH = morph if morph_on else None
+        bad = check(corpus, morph_on)            # заодно прогревает кэши морфологии
+        failed += bad
+        print(f"morph={'on ' if morph_on else 'off'}: mismatches={bad}")
+
+        legacy = bench(lambda c: [legacy_normalize_name(x) for x in c], corpus, args.repeat)
+        new = bench(lambda c: [m.normalize_name(x) for x in c], corpus, args.repeat)
+        vec = bench(m.normalize_names, corpus, args.repeat)
+        print(f"  legacy normalize_name : {legacy:10.0f} names/s")
+        print(f"  normalize_name        : {new:10.0f} names/s  (x{new / legacy:.2f})")
+        print(f"  normalize_names (list): {vec:10.0f} names/s  (x{vec / legacy:.2f})")
+    m.MORPH = morph
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный замер поиска os_api: p50/p90/p99 задержки при N одновременных клиентах.
+
+  python3 bench_search_latency.py --url http://localhost:8010/api/v1/search -c 200 -n 5000
+  python3 bench_search_latency.py --url ... --typing          # "набор текста": префиксы с X-Search-Client,
+                                                              # предыдущий запрос клиента отменяется (499)
+
+Заглушка OpenSearch (отвечает на */_search через --fake-delay-ms, считает TCP-соединения) —
+чтобы мерить накладные расходы самого шлюза без кластера:
+
+  python3 bench_search_latency.py --fake-opensearch 9201 --fake-delay-ms 20
+  OPENSEARCH_URL=http://localhost:9201 gunicorn -c gunicorn.conf.py app:app
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+WORDS = ["кабель", "труба", "провод", "щит", "муфта", "насос", "шкаф", "краска", "лестница",
+         "светильник", "задвижка", "клапан", "кронштейн", "изолятор", "датчик", "выключатель"]
+
+
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, math.ceil(p / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+# ====== заглушка OpenSearch ======
+
+def run_fake_opensearch(port, delay_ms):
+    stats = {"connections": 0, "requests": 0}
+    lock = threading.Lock()
+    body = json.dumps({
+        "took": delay_ms,
+        "hits": {"total": {"value": 3}, "hits": [
+            {"_source": {"l4_name": f"Позиция {i}", "path_name": "L1 / L2 / L3", "l4_code": f"1.2.3.{i}"}}
+            for i in range(3)
+        ]},
+    }, ensure_ascii=False).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"       # keep-alive, как у OpenSearch
+        disable_nagle_algorithm = True      # заголовки и тело уходят разными write: без этого +40 мс delayed ACK
+
+        def setup(self):
+            super().setup()
+            with lock:
+                stats["connections"] += 1
+
+        def do_POST(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(n)
+            time.sleep(delay_ms / 1000.0)
+            with lock:
+                stats["requests"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    srv.daemon_threads = True
+    print(f"fake opensearch on :{port}, delay {delay_ms} ms (Ctrl+C — итоги)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"requests={stats['requests']} tcp_connections={stats['connections']}")
+    return 0
+
+
+# ====== клиенты ======
+
+def make_queries(typing):
+    rnd = random.Random(1)
+    while True:
+        w = rnd.choice(WORDS)
+        if typing:
+            # префиксы одного слова подряд, как при наборе в поле поиска
+            yield [w[:i] for i in range(3, len(w) + 1)]
+        else:
+            yield [w]
+
+
+def worker(wid, args, deadline, counter, lock, out):
+    sess = requests.Session()
+    client = f"bench:{wid}"
+    queries = make_queries(args.typing)
+    lat, codes, errors = [], {}, 0
+    while time.monotonic() < deadline:
+        with lock:
+            if counter[0] >= args.requests:
+                break
+            counter[0] += 1
+        burst = next(queries)
+        threads = []
+        for q in burst:
+            def one(q=q):
+                nonlocal errors
+                params = {"q": q, "size": args.size}
+                if args.index:
+                    params["index"] = args.index
+                headers = {"X-Search-Client": client} if args.typing else {}
+                t0 = time.perf_counter()
+                try:
+                    r = sess.get(args.url, params=params, headers=headers, timeout=args.timeout)
+                    dt = (time.perf_counter() - t0) * 1000.0
+                    with lock:
+                        codes[r.status_code] = codes.get(r.status_code, 0) + 1
+                    if r.status_code == 200:
+                        lat.append(dt)
+                except Exception:
+                    with lock:
+                        errors += 1
+            if args.typing:
+                t = threading.Thread(target=one)
+                t.start()
+                threads.append(t)
+                time.sleep(args.keystroke_ms / 1000.0)
+            else:
+                one()
+        for t in threads:
+            t.join()
+    out.append((lat, codes, errors))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8010/api/v1/search")
+    ap.add_argument("--index", default=None)
+    ap.add_argument("--size", type=int, default=20)
+    ap.add_argument("-c", "--concurrency", type=int, default=200)
+    ap.add_argument("-n", "--requests", type=int, default=5000, help="сколько запросов (или серий префиксов)")
+    ap.add_argument("--duration", type=float, default=120.0, help="потолок по времени, с")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--typing", action="store_true")
+    ap.add_argument("--keystroke-ms", type=float, default=80.0)
+    ap.add_argument("--fake-opensearch", type=int, metavar="PORT")
+    ap.add_argument("--fake-delay-ms", type=int, default=20)
+    args = ap.parse_args()
+
+    if args.fake_opensearch:
+        return run_fake_opensearch(args.fake_opensearch, args.fake_delay_ms)
+
+    counter, lock, out = [0], threading.Lock(), []
+    deadline = time.monotonic() + args.duration
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i, args, deadline, counter, lock, out))
+               for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    lat = sorted(x for l, _, _ in out for x in l)
+    codes = {}
+    for _, c, _ in out:
+        for k, v in c.items():
+            codes[k] = codes.get(k, 0) + v
+    errors = sum(e for _, _, e in out)
+    total = sum(codes.values()) + errors
+
+    print(f"url={args.url} concurrency={args.concurrency} typing={args.typing}")
+    print(f"requests={total} ok={len(lat)} codes={dict(sorted(codes.items()))} errors={errors}")
+    print(f"elapsed={elapsed:.1f}s rps={total / elapsed:.0f}")
+    if lat:
+        print("latency ms: p50={:.1f} p90={:.1f} p99={:.1f} max={:.1f}".format(
+            percentile(lat, 50), percentile(lat, 90), percentile(lat, 99), lat[-1]))
+    return 0 if lat else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,12 +15,17 @@ ETL: v_nomenclature_spec_l3_dup_links_v1 -> v_nomenclature_spec_pairs_v1
 Upsert по dup_root_id.
 """
 
+import io
 import os
 import re
+import csv
 import sys
 import time
+import pickle
 import logging
+from collections import OrderedDict
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 from sqlalchemy import create_engine, text
@@ -37,6 +42,20 @@ SRC_READ_VIEW  = "public.v_nomenclature_spec_read_v1"
 DST_TABLE      = "public.v_nomenclature_spec_pairs_v1"
 
 CHUNK_SIZE     = int(os.getenv("CHUNK_SIZE", "50000"))
+# нормализация в пуле процессов: NORM_WORKERS<=1 — по-старому, в текущем процессе
+NORM_WORKERS   = int(os.getenv("NORM_WORKERS", str(os.cpu_count() or 1)))
+NORM_SLICE     = int(os.getenv("NORM_SLICE", "2000"))   # строк на одну задачу воркера
+
+# кэши нормализации: разбор слов, согласование, готовый результат по full_name
+NAME_CACHE_SIZE = int(os.getenv("NAME_CACHE_SIZE", "500000"))
+WORD_CACHE_SIZE = int(os.getenv("WORD_CACHE_SIZE", "200000"))
+# файл для кэшей между запусками; пусто — не сохранять
+NORM_CACHE_FILE = os.getenv("NORM_CACHE_FILE", "")
+# поднимать при любой правке правил normalize_name: сохранённый кэш со старой версией игнорируется,
+# а отпечатки src_fp всех строк меняются — следующий запуск перенормализует всё
+NORMALIZER_VERSION = "1"
+# 1 — нормализовать и переписать все dup_root_id, не глядя на src_fp
+FORCE_ALL = os.getenv("FORCE_ALL", "0") == "1"
 N_LOOKAHEAD_NOUN = 10
 
 # аббревиатуры/термины, которые НЕ трогаем регистром и НЕ используем как слова для морфологии
@@ -78,6 +97,127 @@ except Exception as e:
     MORPH = None
     log.warning("pymorphy3: NOT AVAILABLE (%s) — перестановка/согласование отключены", str(e))
 
+# ====== КЭШИ ======
+_MISS = object()
+
+class LRUCache:
+    """Ограниченный по числу ключей кэш с вытеснением давно не использованных."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.track_new = False   # в воркере: копим новые ключи, чтобы вернуть их в главный процесс
+        self.new = {}
+
+    def get(self, key, default=_MISS):
+        try:
+            v = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return v
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+        if self.track_new:
+            self.new[key] = value
+
+    def update(self, items):
+        for k, v in items:
+            self.data[k] = v
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def drain_new(self):
+        out, self.new = self.new, {}
+        return out
+
+TAG_CACHE     = LRUCache(WORD_CACHE_SIZE)   # слово -> frozenset граммем MORPH.parse(w)[0].tag
+INFLECT_CACHE = LRUCache(WORD_CACHE_SIZE)   # (слово, граммемы) -> p.inflect(...).word / p.word
+NAME_CACHE    = LRUCache(NAME_CACHE_SIZE)   # full_name -> normalize_name(full_name)
+
+# счётчики попаданий за весь запуск (с учётом воркеров)
+CACHE_STATS = {"name_hits": 0, "name_misses": 0, "tag_hits": 0, "tag_misses": 0,
+               "inflect_hits": 0, "inflect_misses": 0}
+
+def _grammemes(w: str) -> frozenset:
+    g = TAG_CACHE.get(w)
+    if g is _MISS:
+        g = frozenset(re.split(r"[ ,]", str(MORPH.parse(w)[0].tag)))
+        TAG_CACHE.put(w, g)
+    return g
+
+def _inflect(w: str, feats: frozenset) -> str:
+    key = (w, feats)
+    out = INFLECT_CACHE.get(key)
+    if out is _MISS:
+        p = MORPH.parse(w)[0]
+        inf = p.inflect(set(feats))
+        out = inf.word if inf else p.word
+        INFLECT_CACHE.put(key, out)
+    return out
+
+def _cache_version() -> str:
+    try:
+        import pymorphy3
+        morph_ver = getattr(pymorphy3, "__version__", "?")
+    except Exception:
+        morph_ver = "-"
+    return f"{NORMALIZER_VERSION}/pymorphy3-{morph_ver}/morph={'on' if MORPH else 'off'}"
+
+def load_caches():
+    if not NORM_CACHE_FILE or not os.path.exists(NORM_CACHE_FILE):
+        return
+    try:
+        with open(NORM_CACHE_FILE, "rb") as f:
+            data = pickle.load(f)
+    except Exception as e:
+        log.warning("norm cache: не удалось прочитать %s (%s)", NORM_CACHE_FILE, e)
+        return
+    if data.get("version") != _cache_version():
+        log.info("norm cache: версия %s != %s — начинаем с пустого", data.get("version"), _cache_version())
+        return
+    NAME_CACHE.update(data.get("names") or [])
+    TAG_CACHE.update(data.get("tags") or [])
+    INFLECT_CACHE.update(data.get("inflect") or [])
+    log.info("norm cache: loaded names=%d tags=%d inflect=%d from %s",
+             len(NAME_CACHE.data), len(TAG_CACHE.data), len(INFLECT_CACHE.data), NORM_CACHE_FILE)
+
+def save_caches():
+    if not NORM_CACHE_FILE:
+        return
+    data = {
+        "version": _cache_version(),
+        "names": list(NAME_CACHE.data.items()),
+        "tags": list(TAG_CACHE.data.items()),
+        "inflect": list(INFLECT_CACHE.data.items()),
+    }
+    tmp = f"{NORM_CACHE_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, NORM_CACHE_FILE)
+        log.info("norm cache: saved names=%d tags=%d inflect=%d to %s",
+                 len(NAME_CACHE.data), len(TAG_CACHE.data), len(INFLECT_CACHE.data), NORM_CACHE_FILE)
+    except Exception as e:
+        log.warning("norm cache: не удалось сохранить %s (%s)", NORM_CACHE_FILE, e)
+
+def _word_counters():
+    return (TAG_CACHE.hits, TAG_CACHE.misses, INFLECT_CACHE.hits, INFLECT_CACHE.misses)
+
+def log_cache_stats(prefix: str):
+    st = CACHE_STATS
+    log.info("%s: cache names hit=%d miss=%d | tags hit=%d miss=%d | inflect hit=%d miss=%d",
+             prefix, st["name_hits"], st["name_misses"], st["tag_hits"], st["tag_misses"],
+             st["inflect_hits"], st["inflect_misses"])
+
 # ====== REGEX / MAPS ======
 WS_RE            = re.compile(r"[ \t\u00A0]+")
 TRAIL_PUNCT_RE   = re.compile(r"[ \t\u00A0]*[\.!,;:…]+[ \t\u00A0]*$")
@@ -99,11 +239,29 @@ QUOTES_MAP = str.maketrans({
     "Ё": "Е", "ё": "е",
 })
 
+# для быстрого ядра: всё скомпилировано заранее, проходы склеены/пропускаются по дешёвым проверкам
+# (эталон прежней реализации и сверка — py_scripts/bench_normalize.py)
+LINE_WS_RE       = re.compile(r"[\r\n \t\u00A0]+")       # переносы строк + WS_RE за один проход
+DIM_X_RE         = re.compile(r"(\d)\s*х\s*(\d)")
+DIGIT_RE         = re.compile(r"\d")
+EDGES_RE         = re.compile(r"^[^\wА-Яа-яЁё]+|[^\wА-Яа-яЁё]+$")
+FIRST_ALPHA_RE   = re.compile(r"[A-Za-zА-Яа-яЁё]")
+MORPH_WORD_RE    = re.compile(r"[A-Za-zА-Яа-яЁё-]+")
+TRAIL_PUNCT_CHARS = ".!,;:…"
+TRAIL_JUNK_CHARS  = "_-–—"
+NOUN_FEATS        = frozenset({"sing", "nomn"})
+
+def _is_word_char(c: str) -> bool:
+    # то же, что \w в re для str
+    return c.isalnum() or c == "_"
+
 def _strip_edges(token: str) -> str:
-    return re.sub(r"^[^\wА-Яа-яЁё]+|[^\wА-Яа-яЁё]+$", "", token)
+    if token and _is_word_char(token[0]) and _is_word_char(token[-1]):
+        return token
+    return EDGES_RE.sub("", token)
 
 def _lower_first_alpha(token: str) -> str:
-    m = re.search(r"[A-Za-zА-Яа-яЁё]", token)
+    m = FIRST_ALPHA_RE.search(token)
     if not m:
         return token
     i = m.start()
@@ -122,39 +280,46 @@ def _norm_caps_token(tok: str) -> str:
 
 def _replace_dim_x(s: str) -> str:
     # 34x34 -> 34х34 (БЕЗ ПРОБЕЛОВ вокруг х)
+    if not DIGIT_RE.search(s):
+        return s
     s = DIM_NUM_RE.sub("х", s)
     # если вдруг где-то появились пробелы вокруг "х" между цифрами — добиваем
-    s = re.sub(r"(\d)\s*х\s*(\d)", r"\1х\2", s)
+    if "х" in s:
+        s = DIM_X_RE.sub(r"\1х\2", s)
     return s
 
-def normalize_name(s: str) -> str:
-    if s is None:
-        return ""
-    s = str(s)
-
+def _clean_text(s: str) -> str:
     # переносы + один пробел
-    s = s.replace("\r\n", " ").replace("\n", " ").replace("\r", " ")
-    s = WS_RE.sub(" ", s).strip()
+    s = LINE_WS_RE.sub(" ", s).strip()
 
     # кавычки + ё->е
     s = s.translate(QUOTES_MAP)
 
     # вырезаем служебные коды
-    s = SERVICE_CODE_RE.sub(" ", s)
-    s = WS_RE.sub(" ", s).strip()
+    if "_" in s:
+        s, n = SERVICE_CODE_RE.subn(" ", s)
+        if n:
+            s = WS_RE.sub(" ", s).strip()
 
     # размерности
     s = _replace_dim_x(s)
 
-    # убрать пунктуацию в конце + хвост мусора
-    s = TRAIL_PUNCT_RE.sub("", s).strip()
-    s = TRAIL_JUNK_RE.sub("", s).strip()
+    # убрать пунктуацию в конце + хвост мусора (строка уже без пробелов по краям)
+    if s and s[-1] in TRAIL_PUNCT_CHARS:
+        s = TRAIL_PUNCT_RE.sub("", s).strip()
+    if s and s[-1] in TRAIL_JUNK_CHARS:
+        s = TRAIL_JUNK_RE.sub("", s).strip()
+    return s
+
+def normalize_name(s: str) -> str:
+    if s is None:
+        return ""
+    s = _clean_text(str(s))
 
     if not s:
         return ""
 
-    toks = s.split(" ")
-    toks = [_norm_caps_token(t) for t in toks]
+    toks = [_norm_caps_token(t) for t in s.split(" ")]
 
     # перестановка: ищем существительное в первых 10 словах
     if MORPH and len(toks) >= 2:
@@ -165,10 +330,10 @@ def normalize_name(s: str) -> str:
             w = _strip_edges(toks[i])
             if not w or w.upper() in TERMS_UPPER:
                 continue
-            if not re.fullmatch(r"[A-Za-zА-Яа-яЁё-]+", w):
+            if not MORPH_WORD_RE.fullmatch(w):
                 continue
-            p = MORPH.parse(w)[0]
-            if ("NOUN" in p.tag) or ("NPRO" in p.tag):
+            g = _grammemes(w)
+            if ("NOUN" in g) or ("NPRO" in g):
                 noun_i = i
                 break
 
@@ -178,41 +343,129 @@ def normalize_name(s: str) -> str:
             w0, w1 = _strip_edges(t0), _strip_edges(t1)
 
             if w0 and w1 and w0.isalpha() and w1.isalpha():
-                p0 = MORPH.parse(w0)[0]
-                p1 = MORPH.parse(w1)[0]
+                g0 = _grammemes(w0)
+                g1 = _grammemes(w1)
 
-                is_adj0  = ("ADJF" in p0.tag) or ("ADJS" in p0.tag)
-                is_noun1 = ("NOUN" in p1.tag) or ("NPRO" in p1.tag)
+                is_adj0  = ("ADJF" in g0) or ("ADJS" in g0)
+                is_noun1 = ("NOUN" in g1) or ("NPRO" in g1)
 
                 if is_adj0 and is_noun1:
                     # существительное: ед.ч., им.п.
-                    noun_inf = p1.inflect({"sing", "nomn"})
-                    noun_word = noun_inf.word if noun_inf else p1.word
+                    noun_word = _inflect(w1, NOUN_FEATS)
 
                     # прилагательное: согласовать с существительным (ед.ч., им.п. + род если есть)
                     feats = {"sing", "nomn"}
-                    if "masc" in p1.tag: feats.add("masc")
-                    if "femn" in p1.tag: feats.add("femn")
-                    if "neut" in p1.tag: feats.add("neut")
+                    if "masc" in g1: feats.add("masc")
+                    if "femn" in g1: feats.add("femn")
+                    if "neut" in g1: feats.add("neut")
 
-                    adj_inf = p0.inflect(feats)
-                    adj_word = adj_inf.word if adj_inf else p0.word
+                    adj_word = _inflect(w0, frozenset(feats))
 
-                    t1_new = re.sub(re.escape(w1), noun_word, t1, count=1)
-                    t0_new = re.sub(re.escape(w0), adj_word, t0, count=1)
-                    t0_new = _lower_first_alpha(t0_new)
+                    # слова из pymorphy — только буквы, так что replace == re.sub(re.escape(...), count=1)
+                    t1_new = t1.replace(w1, noun_word, 1)
+                    t0_new = _lower_first_alpha(t0.replace(w0, adj_word, 1))
 
                     rest = toks[:noun_i-1] + toks[noun_i+1:]
                     toks = [t1_new, t0_new] + rest
 
-    s = " ".join(toks)
-    s = WS_RE.sub(" ", s).strip()
+    # токены непустые и без пробелов внутри: после join остаётся только strip
+    s = " ".join(toks).strip()
 
     # первая буква заглавная
     if s:
         s = s[0].upper() + s[1:]
     return s
 
+def normalize_names(values) -> list:
+    """normalize_name для списка/pandas.Series: каждое уникальное значение считается один раз."""
+    done = {}
+    out = []
+    for v in values:
+        r = done.get(v, _MISS)
+        if r is _MISS:
+            r = done[v] = normalize_name(v)
+        out.append(r)
+    return out
+
+# ====== ПАРАЛЛЕЛЬНАЯ НОРМАЛИЗАЦИЯ ======
+def _init_worker():
+    # свой MorphAnalyzer на процесс, создаётся один раз при старте воркера;
+    # кэши слов достаются от главного процесса (fork) уже прогретыми
+    global MORPH
+    try:
+        import pymorphy3
+        MORPH = pymorphy3.MorphAnalyzer()
+    except Exception:
+        MORPH = None
+    TAG_CACHE.track_new = INFLECT_CACHE.track_new = bool(NORM_CACHE_FILE)
+
+def _normalize_slice(names):
+    """-> (результаты, приращение счётчиков кэша слов, новые ключи кэшей слов)."""
+    before = _word_counters()
+    out = normalize_names(names)
+    delta = tuple(a - b for a, b in zip(_word_counters(), before))
+    return out, delta, (TAG_CACHE.drain_new(), INFLECT_CACHE.drain_new())
+
+def _merge_slice(delta, new):
+    for key, d in zip(("tag_hits", "tag_misses", "inflect_hits", "inflect_misses"), delta):
+        CACHE_STATS[key] += d
+    tags, infl = new
+    if tags:
+        TAG_CACHE.update(tags.items())
+    if infl:
+        INFLECT_CACHE.update(infl.items())
+
+def make_pool():
+    if NORM_WORKERS <= 1:
+        return None
+    log.info("normalize: %d worker processes, slice=%d", NORM_WORKERS, NORM_SLICE)
+    return ProcessPoolExecutor(max_workers=NORM_WORKERS, initializer=_init_worker)
+
+class NormalizeTask:
+    """Нормализация одного чанка: в пуле — запущена в фоне, result() собирает срезы по порядку.
+
+    Повторяющиеся и уже виденные (NAME_CACHE) full_name в воркеры не отправляются.
+    """
+
+    def __init__(self, pool, names):
+        self.t0 = time.time()
+        self.names = names
+        self.known = {}
+        todo = []
+        for x in dict.fromkeys(names):
+            v = NAME_CACHE.get(x)
+            if v is _MISS:
+                todo.append(x)
+            else:
+                self.known[x] = v
+        CACHE_STATS["name_hits"] += len(self.known)
+        CACHE_STATS["name_misses"] += len(todo)
+        self.todo = todo
+
+        if pool is None:
+            self._futures = None
+            self._parts = [_normalize_slice(todo)]
+        else:
+            self._futures = [
+                pool.submit(_normalize_slice, todo[i:i + NORM_SLICE])
+                for i in range(0, len(todo), NORM_SLICE)
+            ]
+
+    def result(self):
+        if self._futures is not None:
+            self._parts = [f.result() for f in self._futures]
+            self._futures = None
+        if self._parts is not None:
+            done = []
+            for out, delta, new in self._parts:
+                done.extend(out)
+                _merge_slice(delta, new)
+            for x, v in zip(self.todo, done):
+                NAME_CACHE.put(x, v)
+                self.known[x] = v
+            self._parts = None
+        return [self.known[x] for x in self.names]
+
 # ====== SQL ======
 SQL_SELECT = f"""
 WITH roots AS (
@@ -232,10 +485,16 @@ read_one AS (
 SELECT
   r.dup_root_id,
   r.item_name,
-  r.type_mark
+  r.type_mark,
+  -- отпечаток входа: если не изменился, строку не нормализуем и не пишем
+  md5(concat_ws(chr(31), coalesce(r.item_name, ''), coalesce(r.type_mark, ''), :ver)) AS src_fp,
+  p.src_fp AS old_fp,
+  (p.dup_root_id IS NULL) AS is_new
 FROM roots x
 JOIN read_one r
   ON r.dup_root_id = x.dup_root_id
+LEFT JOIN {DST_TABLE} p
+  ON p.dup_root_id = r.dup_root_id
 ORDER BY r.dup_root_id;
 """
 
@@ -261,62 +520,136 @@ def main() -> int:
             CREATE UNIQUE INDEX IF NOT EXISTS ux_pairs_dup_root_id
             ON {DST_TABLE} (dup_root_id);
         """))
+        c.execute(text(f"ALTER TABLE {DST_TABLE} ADD COLUMN IF NOT EXISTS src_fp text;"))
 
     total_rows = 0
     total_upserted = 0
-
-    # читаем чанками, чтобы не уронить память
-    for chunk_idx, df in enumerate(pd.read_sql_query(SQL_SELECT, engine, chunksize=CHUNK_SIZE), start=1):
-        n = len(df)
-        total_rows += n
-        log.info("Chunk %d: loaded %d rows", chunk_idx, n)
-
-        df["item_name"] = df["item_name"].fillna("").astype(str)
-        df["type_mark"] = df["type_mark"].fillna("").astype(str)
-
-        # full name = item_name + (type_mark)
-        df["full_name"] = (df["item_name"].str.strip() + " " + df["type_mark"].str.strip()).str.strip()
-        df["name_tep_korr"] = df["full_name"].map(normalize_name)
+    counts = {"new": 0, "changed": 0, "skipped": 0}
+
+    def write_chunk(chunk_idx, df, task):
+        nonlocal total_upserted
+        df["name_tep_korr"] = task.result()
+        dt_norm = time.time() - task.t0
+        log.info("Chunk %d: normalized %d rows in %.1fs (%.0f rows/s)",
+                 chunk_idx, len(df), dt_norm, len(df) / max(dt_norm, 1e-9))
+        log_cache_stats(f"Chunk {chunk_idx}")
         df["name_tek"] = df["name_tep_korr"].map(lambda x: x[:150] if len(x) > 150 else x)
 
-        out = df[["dup_root_id", "name_tep_korr", "name_tek"]].copy()
-
-        # staging -> upsert
-        staging = f"stg_pairs_{os.getpid()}_{chunk_idx}"
-
-        with engine.begin() as c:
-            c.execute(text(f"DROP TABLE IF EXISTS public.{staging};"))
-            c.execute(text(f"""
-                CREATE TEMP TABLE {staging} (
-                  dup_root_id   bigint,
-                  name_tep_korr text,
-                  name_tek      text
-                ) ON COMMIT DROP;
-            """))
-
-        out.to_sql(staging, engine, if_exists="append", index=False, method="multi", chunksize=5000)
-
-        with engine.begin() as c:
-            res = c.execute(text(f"""
-                INSERT INTO {DST_TABLE} (dup_root_id, name_tep_korr, name_tek)
-                SELECT dup_root_id, name_tep_korr, name_tek
-                FROM {staging}
-                WHERE dup_root_id IS NOT NULL
-                ON CONFLICT (dup_root_id) DO UPDATE
-                SET
-                  name_tep_korr = EXCLUDED.name_tep_korr,
-                  name_tek      = EXCLUDED.name_tek;
-            """))
-            # rowcount для INSERT..ON CONFLICT в psycopg2 бывает "не точный", но как индикатор годится
-            upc = int(getattr(res, "rowcount", 0) or 0)
-            total_upserted += max(upc, 0)
+        out = df[["dup_root_id", "name_tep_korr", "name_tek", "src_fp"]]
+
+        # staging (COPY) -> upsert: одно соединение и одна транзакция,
+        # TEMP ... ON COMMIT DROP живёт ровно до commit после upsert
+        buf = io.StringIO()
+        w = csv.writer(buf, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+        # QUOTE_NONNUMERIC: пустая строка уходит как "" (а не NULL, как пустое поле в CSV)
+        w.writerows(zip(out["dup_root_id"].astype("int64").tolist(),
+                        out["name_tep_korr"].tolist(), out["name_tek"].tolist(), out["src_fp"].tolist()))
+        buf.seek(0)
+
+        raw = engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE stg_pairs (
+                      dup_root_id   bigint,
+                      name_tep_korr text,
+                      name_tek      text,
+                      src_fp        text
+                    ) ON COMMIT DROP;
+                """)
+                t_copy = time.time()
+                cur.copy_expert(
+                    "COPY stg_pairs (dup_root_id, name_tep_korr, name_tek, src_fp) FROM STDIN WITH (FORMAT csv)",
+                    buf,
+                )
+                dt_copy = time.time() - t_copy
+
+                t_up = time.time()
+                cur.execute(f"""
+                    INSERT INTO {DST_TABLE} AS d (dup_root_id, name_tep_korr, name_tek, src_fp)
+                    SELECT dup_root_id, name_tep_korr, name_tek, src_fp
+                    FROM stg_pairs
+                    WHERE dup_root_id IS NOT NULL
+                    ON CONFLICT (dup_root_id) DO UPDATE
+                    SET
+                      name_tep_korr = EXCLUDED.name_tep_korr,
+                      name_tek      = EXCLUDED.name_tek,
+                      src_fp        = EXCLUDED.src_fp
+                    -- без no-op апдейтов (мёртвых версий строк и лишних событий для OpenSearch)
+                    WHERE d.name_tep_korr IS DISTINCT FROM EXCLUDED.name_tep_korr
+                       OR d.name_tek      IS DISTINCT FROM EXCLUDED.name_tek
+                       OR d.src_fp        IS DISTINCT FROM EXCLUDED.src_fp;
+                """)
+                upc = max(int(cur.rowcount or 0), 0)
+                dt_up = time.time() - t_up
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+        total_upserted += upc
+
+        n = len(out)
+        log.info("Chunk %d: copy %d rows %.2fs (%.0f rows/s), upsert %.2fs (%.0f rows/s)",
+                 chunk_idx, n, dt_copy, n / max(dt_copy, 1e-9), dt_up, n / max(dt_up, 1e-9))
 
         # краткая диагностика
         bad = (out["name_tep_korr"].str.len() == 0).sum()
         log.info("Chunk %d: upserted~%d, empty_names=%d", chunk_idx, upc, int(bad))
 
+    load_caches()
+    pool = make_pool()
+    try:
+        # конвейер: чанк N+1 нормализуется в пуле, пока чанк N пишется в БД
+        pending = None
+        # читаем чанками, чтобы не уронить память
+        chunks = pd.read_sql_query(text(SQL_SELECT), engine, params={"ver": NORMALIZER_VERSION},
+                                   chunksize=CHUNK_SIZE)
+        t_read = time.time()
+        for chunk_idx, df in enumerate(chunks, start=1):
+            n = len(df)
+            total_rows += n
+            dt_read = time.time() - t_read
+            log.info("Chunk %d: loaded %d rows in %.1fs (%.0f rows/s)", chunk_idx, n, dt_read, n / max(dt_read, 1e-9))
+
+            is_new = df["is_new"].astype(bool)
+            todo = is_new | (df["old_fp"] != df["src_fp"]) | FORCE_ALL
+            n_new = int(is_new.sum())
+            n_changed = int((todo & ~is_new).sum())
+            counts["new"] += n_new
+            counts["changed"] += n_changed
+            counts["skipped"] += n - n_new - n_changed
+            log.info("Chunk %d: new=%d changed=%d skipped=%d", chunk_idx, n_new, n_changed, n - n_new - n_changed)
+            df = df[todo].copy()
+            if df.empty:
+                t_read = time.time()
+                continue
+
+            df["item_name"] = df["item_name"].fillna("").astype(str)
+            df["type_mark"] = df["type_mark"].fillna("").astype(str)
+
+            # full name = item_name + (type_mark)
+            df["full_name"] = (df["item_name"].str.strip() + " " + df["type_mark"].str.strip()).str.strip()
+            task = NormalizeTask(pool, df["full_name"].tolist())
+
+            if pending is not None:
+                write_chunk(*pending)
+            pending = (chunk_idx, df, task)
+            t_read = time.time()
+
+        if pending is not None:
+            write_chunk(*pending)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    save_caches()
+
     dt = time.time() - t0
-    log.info("DONE. rows=%d, upserted~%d, time=%.1fs", total_rows, total_upserted, dt)
+    log.info("DONE. rows=%d, new=%d, changed=%d, skipped=%d, upserted~%d, time=%.1fs",
+             total_rows, counts["new"], counts["changed"], counts["skipped"], total_upserted, dt)
+    log_cache_stats("DONE")
     return 0
 
 if __name__ == "__main__":
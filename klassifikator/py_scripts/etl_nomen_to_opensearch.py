@@ -1,6 +1,10 @@
 import os
+import re
+import sys
 import json
 import time
+import signal
+import argparse
 import logging
 import requests
 import psycopg2
@@ -16,14 +20,18 @@ JOBS = [
         "table": "class_tree_nomen_v1",
         "index": "class_tree_nomen_v1",
         "id_col": "id",
+        "id_type": "text",           # тип id в Postgres (для инкрементальной выборки по журналу)
         "fields": ["id", "item_name"],
         "order_by": "id",
         "recreate_index": False,   # True = удалить индекс и создать заново
         "truncate_index": True,    # True = очистить документы (DELETE BY QUERY match_all)
+        "swap_alias": True,        # True = собрать новое поколение <index>_<ts> и переключить alias <index>
+        "keep_generations": 2,     # сколько поколений оставлять (текущее + предыдущие для отката)
         "settings": {"number_of_shards": 1, "number_of_replicas": 0},
+        # как в portal_api_edit/scripts/create_class_tree_nomen_index.py: id текстовый ('L1:…', 'DR:…')
         "mappings": {
-            "id": {"type": "long"},
-            "item_name": {"type": "text"},
+            "id": {"type": "keyword"},
+            "item_name": {"type": "text", "analyzer": "russian"},
         }
     },
 ]
@@ -42,6 +50,10 @@ PG_PASS = os.getenv("PG_PASS", "directus")
 BATCH = int(os.getenv("BATCH", "2000"))
 HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
 
+# incremental = только строки из журнала public.etl_changes_v1 (14_etl_changes_v1.sql),
+# full = полная пересборка индекса. Переопределяется флагом --mode.
+ETL_MODE = os.getenv("ETL_MODE", "incremental")
+
 # =========================
 # Helpers
 # =========================
@@ -80,6 +92,55 @@ def pg_stream(sql):
     finally:
         conn.close()
 
+def pg_query(sql, params=None):
+    conn = pg_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(sql, params or {})
+            rows = cur.fetchall() if cur.description is not None else []
+        conn.commit()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+def count_rows(schema, table):
+    return pg_query(f"select count(*) as cnt from {schema}.{table}")[0]["cnt"]
+
+def progress(index, done, total, generation=None):
+    # машиночитаемая строка для менеджера задач os_api (reindex_jobs.py);
+    # index — имя, под которым индекс ищут (алиас), generation — строящееся поколение в режиме swap_alias
+    gen = f" generation={generation}" if generation else ""
+    print(f"PROGRESS index={index} done={done} total={total}{gen}", flush=True)
+
+def changes_horizon():
+    # xmin текущего снимка: все транзакции с xid ниже него завершены, их изменения журнала видны.
+    # Не max(change_id): незакоммиченная транзакция могла получить меньший change_id и закоммитить его позже.
+    # None = журнал изменений не установлен
+    if not pg_query("select to_regclass('public.etl_changes_v1') is not null as ok")[0]["ok"]:
+        return None
+    return pg_query("select pg_snapshot_xmin(pg_current_snapshot())::text::bigint as hi")[0]["hi"]
+
+def get_watermark(job_name):
+    rows = pg_query(
+        "select last_xmin from public.etl_watermark_v1 where job = %(job)s",
+        {"job": job_name},
+    )
+    return rows[0]["last_xmin"] if rows else None
+
+def set_watermark(job_name, table, xmin):
+    pg_query("""
+insert into public.etl_watermark_v1 (job, last_xmin, updated_at)
+values (%(job)s, %(xmin)s, now())
+on conflict (job) do update
+set last_xmin  = excluded.last_xmin,
+    updated_at = excluded.updated_at
+    """, {"job": job_name, "xmin": xmin})
+    # обработанный хвост журнала больше не нужен: только транзакции ниже горизонта
+    pg_query(
+        "delete from public.etl_changes_v1 where tbl = %(tbl)s and xid < %(xmin)s::text::xid8",
+        {"tbl": table, "xmin": xmin},
+    )
+
 def os_req(method, path, **kwargs):
     url = f"{OPENSEARCH_URL}{path}"
     logger.debug("OpenSearch request %s %s", method, url)
@@ -139,6 +200,60 @@ def truncate_index(index):
         logger.exception("Failed to truncate index: %s", index)
         raise
 
+def put_index_settings(index, settings):
+    try:
+        r = os_req("PUT", f"/{index}/_settings", json={"index": settings})
+        r.raise_for_status()
+    except Exception:
+        logger.exception("Failed to update settings of index: %s", index)
+        raise
+
+def refresh_index(index):
+    r = os_req("POST", f"/{index}/_refresh")
+    r.raise_for_status()
+
+def alias_targets(alias):
+    r = os_req("GET", f"/_alias/{alias}")
+    if r.status_code == 404:
+        return []
+    r.raise_for_status()
+    return list(r.json().keys())
+
+def list_generations(alias):
+    # поколения: <alias>_YYYYmmddHHMMSS
+    r = os_req("GET", f"/_cat/indices/{alias}_*?format=json&h=index")
+    if r.status_code == 404:
+        return []
+    r.raise_for_status()
+    pat = re.compile(rf"^{re.escape(alias)}_\d{{14}}$")
+    return sorted(x["index"] for x in r.json() if pat.match(x.get("index") or ""))
+
+def swap_alias(alias, new_index):
+    # одно атомарное _aliases: поиск никогда не видит пустой/частичный индекс
+    old = alias_targets(alias)
+    actions = [{"remove": {"index": o, "alias": alias}} for o in old if o != new_index]
+    actions.append({"add": {"index": new_index, "alias": alias}})
+    if not old and index_exists(alias):
+        # миграция: раньше alias был обычным индексом с тем же именем
+        actions.append({"remove_index": {"index": alias}})
+    try:
+        r = os_req("POST", "/_aliases", json={"actions": actions})
+        r.raise_for_status()
+    except Exception:
+        logger.exception("Alias swap failed: %s -> %s", alias, new_index)
+        raise
+    return old
+
+def gc_generations(alias, keep):
+    current = set(alias_targets(alias))
+    gens = [g for g in list_generations(alias) if g not in current]
+    # самые новые (keep - 1) оставляем для отката
+    drop = gens[:max(0, len(gens) - max(0, keep - 1))]
+    for g in drop:
+        print(f"gc: deleting old generation {g}")
+        delete_index(g)
+    return drop
+
 def bulk_index(index, id_col, rows):
     lines = []
     for r in rows:
@@ -168,12 +283,58 @@ def bulk_index(index, id_col, rows):
         logger.error("Bulk index errors (first 3): %s", bad)
         raise RuntimeError(f"Bulk errors (first 3): {bad}")
 
+def bulk_delete(index, ids):
+    lines = [json.dumps({"delete": {"_index": index, "_id": _id}}, ensure_ascii=False) for _id in ids]
+    if not lines:
+        return
+    payload = "\n".join(lines) + "\n"
+    r = os_req(
+        "POST", "/_bulk",
+        data=payload.encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    r.raise_for_status()
+    # not_found при удалении — не ошибка (документа уже нет)
+    data = r.json()
+    if data.get("errors"):
+        bad = [list(it.values())[0].get("error") for it in data.get("items") or []]
+        bad = [b for b in bad if b][:3]
+        if bad:
+            raise RuntimeError(f"Bulk delete errors (first 3): {bad}")
+
 def job_sql(schema, table, fields, order_by):
     cols = ", ".join(fields)
     ob = order_by or fields[0]
     return f"select {cols} from {schema}.{table} order by {ob}"
 
-def run_job(job):
+def run_job(job, mode=ETL_MODE):
+    schema = job["schema"]
+    table = job["table"]
+    index = job["index"]
+    id_col = job["id_col"]
+    fields = job["fields"]
+
+    print("="*80)
+    print(f"JOB: {schema}.{table}  ->  {index}")
+    print(f"fields={fields}, id_col={id_col}, batch={BATCH}, mode={mode}")
+
+    if mode == "incremental":
+        if run_job_incremental(job):
+            return
+        print("→ full rebuild")
+
+    # транзакции, не завершённые к этой точке, доберёт следующий incremental
+    hi = changes_horizon()
+
+    if job.get("swap_alias"):
+        run_job_swap(job)
+    else:
+        run_job_inplace(job)
+
+    if hi is not None:
+        set_watermark(index, table, hi)
+
+def run_job_inplace(job):
     schema = job["schema"]
     table = job["table"]
     index = job["index"]
@@ -186,10 +347,6 @@ def run_job(job):
     settings = job.get("settings") or {"number_of_shards": 1, "number_of_replicas": 0}
     mappings = job.get("mappings") or {}
 
-    print("="*80)
-    print(f"JOB: {schema}.{table}  ->  {index}")
-    print(f"fields={fields}, id_col={id_col}, batch={BATCH}")
-
     try:
         if recreate:
             print("recreate_index=True → deleting index (if exists) ...")
@@ -211,12 +368,14 @@ def run_job(job):
         raise
 
     sql = job_sql(schema, table, fields, order_by)
+    expected = count_rows(schema, table)
     total = 0
     t0 = time.time()
     try:
         for batch in pg_stream(sql):
             bulk_index(index, id_col, batch)
             total += len(batch)
+            progress(index, total, expected)
             if total % (BATCH * 5) == 0:
                 dt = time.time() - t0
                 print(f"indexed: {total}  ({total/dt:.1f} rows/s)")
@@ -226,7 +385,121 @@ def run_job(job):
     dt = time.time() - t0
     print(f"DONE: {total} rows in {dt:.1f}s ({total/dt:.1f} rows/s)")
 
+def run_job_incremental(job):
+    # True — изменения применены; False — нужна полная пересборка
+    schema = job["schema"]
+    table = job["table"]
+    index = job["index"]
+    id_col = job["id_col"]
+    id_type = job.get("id_type") or "bigint"
+    fields = job["fields"]
+
+    hi = changes_horizon()
+    if hi is None:
+        print("incremental: журнал public.etl_changes_v1 не найден")
+        return False
+    wm = get_watermark(index)
+    if wm is None:
+        print("incremental: watermark нет (первый запуск)")
+        return False
+    if not index_exists(index):
+        print(f"incremental: индекса {index} нет")
+        return False
+
+    # изменения транзакций, завершившихся между прошлым и текущим горизонтом
+    changes = pg_query("""
+select row_id, op
+from public.etl_changes_v1
+where tbl = %(tbl)s and xid >= %(lo)s::text::xid8 and xid < %(hi)s::text::xid8
+    """, {"tbl": table, "lo": wm, "hi": hi})
+    if not changes:
+        if hi > wm:
+            set_watermark(index, table, hi)
+        print(f"incremental: изменений нет (xmin {wm} → {hi})")
+        return True
+    if any(c["op"] == "T" for c in changes):
+        print("incremental: в журнале TRUNCATE")
+        return False
+
+    ids = sorted({c["row_id"] for c in changes if c["row_id"] is not None})
+    cols = ", ".join(fields)
+    sql = f"select {cols} from {schema}.{table} where {id_col} = any(%(ids)s::{id_type}[])"
+
+    t0 = time.time()
+    upserted = deleted = 0
+    for i in range(0, len(ids), BATCH):
+        part = ids[i:i + BATCH]
+        rows = pg_query(sql, {"ids": part})
+        found = {str(r[id_col]) for r in rows}
+        gone = [x for x in part if x not in found]
+        if rows:
+            bulk_index(index, id_col, rows)
+        if gone:
+            bulk_delete(index, gone)
+        upserted += len(rows)
+        deleted += len(gone)
+        progress(index, min(i + BATCH, len(ids)), len(ids))
+
+    set_watermark(index, table, hi)
+    dt = time.time() - t0
+    print(f"DONE (incremental): changes={len(changes)} upserted={upserted} deleted={deleted} "
+          f"xmin {wm} → {hi} in {dt:.1f}s")
+    return True
+
+def run_job_swap(job):
+    # build-then-swap: грузим в новое поколение, живой индекс не трогаем до переключения alias
+    schema = job["schema"]
+    table = job["table"]
+    alias = job["index"]
+    id_col = job["id_col"]
+    fields = job["fields"]
+    order_by = job.get("order_by") or id_col
+    settings = job.get("settings") or {"number_of_shards": 1, "number_of_replicas": 0}
+    mappings = job.get("mappings") or {}
+    keep = int(job.get("keep_generations") or 2)
+
+    gen = f"{alias}_{time.strftime('%Y%m%d%H%M%S')}"
+    print(f"swap_alias=True → building generation {gen}")
+
+    # на время заливки: без реплик и без refresh
+    load_settings = dict(settings, number_of_replicas=0, refresh_interval="-1")
+    create_index(gen, load_settings, mappings)
+
+    sql = job_sql(schema, table, fields, order_by)
+    expected = count_rows(schema, table)
+    total = 0
+    t0 = time.time()
+    try:
+        for batch in pg_stream(sql):
+            bulk_index(gen, id_col, batch)
+            total += len(batch)
+            progress(alias, total, expected, generation=gen)
+            if total % (BATCH * 5) == 0:
+                dt = time.time() - t0
+                print(f"indexed: {total}  ({total/dt:.1f} rows/s)")
+
+        put_index_settings(gen, {
+            "number_of_replicas": settings.get("number_of_replicas", 0),
+            "refresh_interval": settings.get("refresh_interval", "1s"),
+        })
+        refresh_index(gen)
+    except BaseException:   # в т.ч. SystemExit по SIGTERM (отмена задачи)
+        logger.exception("Generation build failed, dropping %s", gen)
+        delete_index(gen)
+        raise
+
+    old = swap_alias(alias, gen)
+    print(f"alias {alias}: {old or '-'} → {gen}")
+    gc_generations(alias, keep)
+
+    dt = time.time() - t0
+    print(f"DONE: {total} rows in {dt:.1f}s ({total/max(dt, 1e-9):.1f} rows/s)")
+
 def main():
+    args = parse_args()
+    # отмена из os_api (terminate) → SystemExit, чтобы отработали finally/очистка поколения
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(143))
+
     # быстрый health-check OS
     try:
         r = os_req("GET", "/")
@@ -246,7 +519,13 @@ def main():
         raise
 
     for job in JOBS:
-        run_job(job)
+        run_job(job, mode=args.mode)
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--mode", choices=["incremental", "full"], default=ETL_MODE,
+                   help="incremental (по журналу изменений) или full (полная пересборка)")
+    return p.parse_args()
 
 if __name__ == "__main__":
     main()
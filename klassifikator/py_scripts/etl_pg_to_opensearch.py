@@ -1,7 +1,15 @@
 import os
+import re
+import sys
 import json
 import time
+import queue
+import random
+import signal
+import argparse
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import psycopg2
 import psycopg2.extras
 
@@ -16,10 +24,13 @@ JOBS = [
         "table": "v_nomenclature_spec_pairs_v1",
         "index": "v_nomenclature_spec_pairs_v1",
         "id_col": "id",
+        "id_type": "bigint",           # тип id в Postgres (для инкрементальной выборки по журналу)
         "fields": ["id", "name_tek", "name_tep_korr"],
         "order_by": "id",
         "recreate_index": False,   # True = удалить индекс и создать заново
         "truncate_index": True,    # True = очистить документы (DELETE BY QUERY match_all)
+        "swap_alias": True,        # True = собрать новое поколение <index>_<ts> и переключить alias <index>
+        "keep_generations": 2,     # сколько поколений оставлять (текущее + предыдущие для отката)
         "settings": {"number_of_shards": 1, "number_of_replicas": 0},
         "mappings": {
             "id": {"type": "integer"},
@@ -38,6 +49,7 @@ JOBS = [
     #   "order_by":"id",
     #   "recreate_index": False,
     #   "truncate_index": True,
+    #   "swap_alias": True,
     #   "settings": {"number_of_shards": 1, "number_of_replicas": 0},
     #   "mappings": { ... }
     # },
@@ -57,6 +69,22 @@ PG_PASS = os.getenv("PG_PASS", "directus")
 BATCH = int(os.getenv("BATCH", "2000"))
 HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
 
+# полная заливка — конвейер: чтение PG -> кодирование JSON -> BULK_SENDERS параллельных _bulk
+BULK_SENDERS = int(os.getenv("BULK_SENDERS", "4"))
+BULK_BYTES = int(os.getenv("BULK_BYTES", str(5 * 1024 * 1024)))        # целевой размер одного _bulk
+BULK_MIN_BYTES = int(os.getenv("BULK_MIN_BYTES", str(256 * 1024)))
+BULK_MAX_DOCS = int(os.getenv("BULK_MAX_DOCS", "20000"))
+BULK_RETRIES = int(os.getenv("BULK_RETRIES", "8"))
+BULK_BACKOFF = float(os.getenv("BULK_BACKOFF", "0.5"))
+BULK_BACKOFF_MAX = float(os.getenv("BULK_BACKOFF_MAX", "30"))
+PIPE_QUEUE = int(os.getenv("PIPE_QUEUE", "8"))                          # глубина очередей между стадиями
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# incremental = только строки из журнала public.etl_changes_v1 (14_etl_changes_v1.sql),
+# full = полная пересборка индекса. Переопределяется флагом --mode.
+ETL_MODE = os.getenv("ETL_MODE", "incremental")
+
 # =========================
 # Helpers
 # =========================
@@ -81,9 +109,63 @@ def pg_stream(sql):
     finally:
         conn.close()
 
+def pg_query(sql, params=None):
+    conn = pg_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(sql, params or {})
+            rows = cur.fetchall() if cur.description is not None else []
+        conn.commit()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+def count_rows(schema, table):
+    return pg_query(f"select count(*) as cnt from {schema}.{table}")[0]["cnt"]
+
+def progress(index, done, total, generation=None):
+    # машиночитаемая строка для менеджера задач os_api (reindex_jobs.py);
+    # index — имя, под которым индекс ищут (алиас), generation — строящееся поколение в режиме swap_alias
+    gen = f" generation={generation}" if generation else ""
+    print(f"PROGRESS index={index} done={done} total={total}{gen}", flush=True)
+
+def changes_horizon():
+    # xmin текущего снимка: все транзакции с xid ниже него завершены, их изменения журнала видны.
+    # Не max(change_id): незакоммиченная транзакция могла получить меньший change_id и закоммитить его позже.
+    # None = журнал изменений не установлен
+    if not pg_query("select to_regclass('public.etl_changes_v1') is not null as ok")[0]["ok"]:
+        return None
+    return pg_query("select pg_snapshot_xmin(pg_current_snapshot())::text::bigint as hi")[0]["hi"]
+
+def get_watermark(job_name):
+    rows = pg_query(
+        "select last_xmin from public.etl_watermark_v1 where job = %(job)s",
+        {"job": job_name},
+    )
+    return rows[0]["last_xmin"] if rows else None
+
+def set_watermark(job_name, table, xmin):
+    pg_query("""
+insert into public.etl_watermark_v1 (job, last_xmin, updated_at)
+values (%(job)s, %(xmin)s, now())
+on conflict (job) do update
+set last_xmin  = excluded.last_xmin,
+    updated_at = excluded.updated_at
+    """, {"job": job_name, "xmin": xmin})
+    # обработанный хвост журнала больше не нужен: только транзакции ниже горизонта
+    pg_query(
+        "delete from public.etl_changes_v1 where tbl = %(tbl)s and xid < %(xmin)s::text::xid8",
+        {"tbl": table, "xmin": xmin},
+    )
+
+# keep-alive: одно HTTP-соединение на отправителя вместо нового на каждый запрос
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=BULK_SENDERS + 2))
+SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=BULK_SENDERS + 2))
+
 def os_req(method, path, **kwargs):
     url = f"{OPENSEARCH_URL}{path}"
-    return requests.request(method, url, timeout=HTTP_TIMEOUT, **kwargs)
+    return SESSION.request(method, url, timeout=HTTP_TIMEOUT, **kwargs)
 
 def index_exists(index):
     r = os_req("GET", f"/{index}")
@@ -108,6 +190,52 @@ def truncate_index(index):
     r = os_req("POST", f"/{index}/_delete_by_query?conflicts=proceed&refresh=true", json=body)
     r.raise_for_status()
 
+def put_index_settings(index, settings):
+    r = os_req("PUT", f"/{index}/_settings", json={"index": settings})
+    r.raise_for_status()
+
+def refresh_index(index):
+    r = os_req("POST", f"/{index}/_refresh")
+    r.raise_for_status()
+
+def alias_targets(alias):
+    r = os_req("GET", f"/_alias/{alias}")
+    if r.status_code == 404:
+        return []
+    r.raise_for_status()
+    return list(r.json().keys())
+
+def list_generations(alias):
+    # поколения: <alias>_YYYYmmddHHMMSS
+    r = os_req("GET", f"/_cat/indices/{alias}_*?format=json&h=index")
+    if r.status_code == 404:
+        return []
+    r.raise_for_status()
+    pat = re.compile(rf"^{re.escape(alias)}_\d{{14}}$")
+    return sorted(x["index"] for x in r.json() if pat.match(x.get("index") or ""))
+
+def swap_alias(alias, new_index):
+    # одно атомарное _aliases: поиск никогда не видит пустой/частичный индекс
+    old = alias_targets(alias)
+    actions = [{"remove": {"index": o, "alias": alias}} for o in old if o != new_index]
+    actions.append({"add": {"index": new_index, "alias": alias}})
+    if not old and index_exists(alias):
+        # миграция: раньше alias был обычным индексом с тем же именем
+        actions.append({"remove_index": {"index": alias}})
+    r = os_req("POST", "/_aliases", json={"actions": actions})
+    r.raise_for_status()
+    return old
+
+def gc_generations(alias, keep):
+    current = set(alias_targets(alias))
+    gens = [g for g in list_generations(alias) if g not in current]
+    # самые новые (keep - 1) оставляем для отката
+    drop = gens[:max(0, len(gens) - max(0, keep - 1))]
+    for g in drop:
+        print(f"gc: deleting old generation {g}")
+        delete_index(g)
+    return drop
+
 def bulk_index(index, id_col, rows):
     lines = []
     for r in rows:
@@ -136,12 +264,297 @@ def bulk_index(index, id_col, rows):
                 break
         raise RuntimeError(f"Bulk errors (first 3): {bad}")
 
+def bulk_delete(index, ids):
+    lines = [json.dumps({"delete": {"_index": index, "_id": _id}}, ensure_ascii=False) for _id in ids]
+    if not lines:
+        return
+    payload = "\n".join(lines) + "\n"
+    r = os_req(
+        "POST", "/_bulk",
+        data=payload.encode("utf-8"),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    r.raise_for_status()
+    # not_found при удалении — не ошибка (документа уже нет)
+    data = r.json()
+    if data.get("errors"):
+        bad = [list(it.values())[0].get("error") for it in data.get("items") or []]
+        bad = [b for b in bad if b][:3]
+        if bad:
+            raise RuntimeError(f"Bulk delete errors (first 3): {bad}")
+
+# =========================
+# Конвейерная заливка
+# =========================
+
+class BatchSizer:
+    # целевой размер _bulk в байтах: 429/413 — вдвое меньше, серия успешных — на 25% больше
+    def __init__(self, target, lo=BULK_MIN_BYTES, hi=None):
+        self.hi = hi or target
+        self.lo = min(lo, self.hi)
+        self.target = target
+        self._ok = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        return self.target
+
+    def shrink(self):
+        with self._lock:
+            self._ok = 0
+            self.target = max(self.lo, self.target // 2)
+
+    def ok(self):
+        with self._lock:
+            self._ok += 1
+            if self._ok >= 10 and self.target < self.hi:
+                self._ok = 0
+                self.target = min(self.hi, int(self.target * 1.25))
+
+def _backoff(attempt):
+    return min(BULK_BACKOFF_MAX, BULK_BACKOFF * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+def send_bulk(docs, sizer, stat):
+    """docs — список пар строк (action, source) в bytes; повторяет 429/5xx, -> число документов."""
+    attempt = 0
+    sent = 0
+    while docs:
+        payload = b"".join(a + d for a, d in docs)
+        try:
+            r = SESSION.post(
+                f"{OPENSEARCH_URL}/_bulk",
+                data=payload,
+                headers={"Content-Type": "application/x-ndjson"},
+                timeout=HTTP_TIMEOUT,
+            )
+            status, err = r.status_code, f"HTTP {r.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            status, err = None, str(e)
+        stat["requests"] += 1
+
+        if status == 413 and len(docs) > 1:
+            # запрос больше http.max_content_length: уменьшаем цель и делим пачку
+            sizer.shrink()
+            half = len(docs) // 2
+            return send_bulk(docs[:half], sizer, stat) + send_bulk(docs[half:], sizer, stat)
+
+        if status is None or status in RETRY_STATUSES:
+            if status == 429:
+                sizer.shrink()
+        else:
+            r.raise_for_status()
+            items = r.json().get("items") or []
+            again, bad = [], []
+            for doc, it in zip(docs, items):
+                act = list(it.values())[0]
+                if act.get("error") is None:
+                    sent += 1
+                elif act.get("status") in RETRY_STATUSES:
+                    again.append(doc)
+                elif len(bad) < 3:
+                    bad.append(act.get("error"))
+            if bad:
+                raise RuntimeError(f"Bulk errors (first 3): {bad}")
+            if not again:
+                sizer.ok()
+                return sent
+            # часть документов отклонена (очередь записи переполнена) — досылаем только их
+            docs, err = again, f"{len(again)} docs rejected with 429"
+            sizer.shrink()
+
+        if attempt >= BULK_RETRIES:
+            raise RuntimeError(f"_bulk failed after {attempt} retries: {err}")
+        stat["retries"] += 1
+        time.sleep(_backoff(attempt))
+        attempt += 1
+    return sent
+
+def bulk_load(index, id_col, sql, expected=None, alias=None):
+    """Заливка sql в index конвейером reader -> encoder -> N senders, -> число документов.
+    alias — при заливке нового поколения: прогресс отчитывается по алиасу."""
+    stop = threading.Event()
+    errors = []
+    lock = threading.Lock()
+    rows_q = queue.Queue(maxsize=PIPE_QUEUE)
+    bulk_q = queue.Queue(maxsize=PIPE_QUEUE)
+    sizer = BatchSizer(BULK_BYTES)
+    stats = {
+        name: {"items": 0, "bytes": 0, "busy": 0.0, "wait": 0.0, "requests": 0, "retries": 0}
+        for name in ("reader", "encoder", "sender")
+    }
+
+    def fail(e):
+        with lock:
+            errors.append(e)
+        stop.set()
+
+    def put(q, item, stat):
+        t = time.perf_counter()
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                break
+            except queue.Full:
+                pass
+        stat["wait"] += time.perf_counter() - t
+
+    def get(q, stat):
+        t = time.perf_counter()
+        try:
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.2)
+                except queue.Empty:
+                    pass
+            return None
+        finally:
+            stat["wait"] += time.perf_counter() - t
+
+    def reader():
+        stat = stats["reader"]
+        it = pg_stream(sql)
+        try:
+            while not stop.is_set():
+                t = time.perf_counter()
+                batch = next(it, None)
+                stat["busy"] += time.perf_counter() - t
+                if batch is None:
+                    break
+                stat["items"] += len(batch)
+                put(rows_q, batch, stat)
+        except Exception as e:
+            fail(e)
+        finally:
+            put(rows_q, None, stat)
+            it.close()    # закрывает server-side курсор и соединение
+
+    def encoder():
+        stat = stats["encoder"]
+        docs, size = [], 0
+        try:
+            while True:
+                batch = get(rows_q, stat)
+                if batch is None:
+                    break
+                t = time.perf_counter()
+                out = []
+                for r in batch:
+                    _id = r.get(id_col)
+                    if _id is None:
+                        continue
+                    a = (json.dumps({"index": {"_index": index, "_id": _id}}, ensure_ascii=False) + "\n").encode("utf-8")
+                    d = (json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8")
+                    docs.append((a, d))
+                    size += len(a) + len(d)
+                    if size >= sizer.get() or len(docs) >= BULK_MAX_DOCS:
+                        out.append(docs)
+                        stat["items"] += len(docs)
+                        stat["bytes"] += size
+                        docs, size = [], 0
+                stat["busy"] += time.perf_counter() - t
+                for chunk in out:
+                    put(bulk_q, chunk, stat)
+            if docs and not stop.is_set():
+                stat["items"] += len(docs)
+                stat["bytes"] += size
+                put(bulk_q, docs, stat)
+        except Exception as e:
+            fail(e)
+        finally:
+            for _ in range(BULK_SENDERS):
+                put(bulk_q, None, stat)
+
+    def sender():
+        local = {"busy": 0.0, "wait": 0.0, "requests": 0, "retries": 0}
+        try:
+            while True:
+                docs = get(bulk_q, local)
+                if docs is None:
+                    break
+                t = time.perf_counter()
+                n = send_bulk(docs, sizer, local)
+                local["busy"] += time.perf_counter() - t
+                with lock:
+                    stats["sender"]["items"] += n    # живой счётчик для прогресса
+        except Exception as e:
+            fail(e)
+        finally:
+            with lock:
+                for k in ("busy", "wait", "requests", "retries"):
+                    stats["sender"][k] += local[k]
+
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=encoder, daemon=True)]
+    threads += [threading.Thread(target=sender, daemon=True) for _ in range(max(1, BULK_SENDERS))]
+    t0 = time.time()
+    for th in threads:
+        th.start()
+
+    last_print = t0
+    try:
+        while any(th.is_alive() for th in threads):
+            time.sleep(0.5)
+            done = stats["sender"]["items"]
+            progress(alias or index, done, expected, generation=index if alias else None)
+            if time.time() - last_print >= 10:
+                last_print = time.time()
+                dt = last_print - t0
+                print(f"indexed: {done}  ({done/dt:.1f} rows/s, bulk target {sizer.get() // 1024} KB)")
+    except BaseException:
+        stop.set()
+        raise
+
+    if errors:
+        raise errors[0]
+
+    dt = max(time.time() - t0, 1e-9)
+    total = stats["sender"]["items"]
+    progress(alias or index, total, expected, generation=index if alias else None)
+    for name in ("reader", "encoder", "sender"):
+        st = stats[name]
+        busy = st["busy"] / (BULK_SENDERS if name == "sender" else 1)
+        line = (f"stage {name:<7}: {st['items']} rows, busy {busy:.1f}s "
+                f"({st['items']/max(busy, 1e-9):.0f} rows/s), waited {st['wait']:.1f}s")
+        if name == "encoder":
+            line += f", {st['bytes'] / 1048576:.1f} MB"
+        if name == "sender":
+            line += f", x{BULK_SENDERS}, requests {st['requests']}, retries {st['retries']}"
+        print(line)
+    print(f"pipeline: {total} rows in {dt:.1f}s ({total/dt:.1f} rows/s)")
+    return total
+
 def job_sql(schema, table, fields, order_by):
     cols = ", ".join(fields)
     ob = order_by or fields[0]
     return f"select {cols} from {schema}.{table} order by {ob}"
 
-def run_job(job):
+def run_job(job, mode=ETL_MODE):
+    schema = job["schema"]
+    table = job["table"]
+    index = job["index"]
+    id_col = job["id_col"]
+    fields = job["fields"]
+
+    print("="*80)
+    print(f"JOB: {schema}.{table}  ->  {index}")
+    print(f"fields={fields}, id_col={id_col}, batch={BATCH}, mode={mode}")
+
+    if mode == "incremental":
+        if run_job_incremental(job):
+            return
+        print("→ full rebuild")
+
+    # транзакции, не завершённые к этой точке, доберёт следующий incremental
+    hi = changes_horizon()
+
+    if job.get("swap_alias"):
+        run_job_swap(job)
+    else:
+        run_job_inplace(job)
+
+    if hi is not None:
+        set_watermark(index, table, hi)
+
+def run_job_inplace(job):
     schema = job["schema"]
     table = job["table"]
     index = job["index"]
@@ -154,10 +567,6 @@ def run_job(job):
     settings = job.get("settings") or {"number_of_shards": 1, "number_of_replicas": 0}
     mappings = job.get("mappings") or {}
 
-    print("="*80)
-    print(f"JOB: {schema}.{table}  ->  {index}")
-    print(f"fields={fields}, id_col={id_col}, batch={BATCH}")
-
     if recreate:
         print("recreate_index=True → deleting index (if exists) ...")
         delete_index(index)
@@ -175,18 +584,120 @@ def run_job(job):
         print("cleared.")
 
     sql = job_sql(schema, table, fields, order_by)
-    total = 0
+    expected = count_rows(schema, table)
     t0 = time.time()
-    for batch in pg_stream(sql):
-        bulk_index(index, id_col, batch)
-        total += len(batch)
-        if total % (BATCH * 5) == 0:
-            dt = time.time() - t0
-            print(f"indexed: {total}  ({total/dt:.1f} rows/s)")
+    total = bulk_load(index, id_col, sql, expected)
     dt = time.time() - t0
     print(f"DONE: {total} rows in {dt:.1f}s ({total/dt:.1f} rows/s)")
 
+def run_job_incremental(job):
+    # True — изменения применены; False — нужна полная пересборка
+    schema = job["schema"]
+    table = job["table"]
+    index = job["index"]
+    id_col = job["id_col"]
+    id_type = job.get("id_type") or "bigint"
+    fields = job["fields"]
+
+    hi = changes_horizon()
+    if hi is None:
+        print("incremental: журнал public.etl_changes_v1 не найден")
+        return False
+    wm = get_watermark(index)
+    if wm is None:
+        print("incremental: watermark нет (первый запуск)")
+        return False
+    if not index_exists(index):
+        print(f"incremental: индекса {index} нет")
+        return False
+
+    # изменения транзакций, завершившихся между прошлым и текущим горизонтом
+    changes = pg_query("""
+select row_id, op
+from public.etl_changes_v1
+where tbl = %(tbl)s and xid >= %(lo)s::text::xid8 and xid < %(hi)s::text::xid8
+    """, {"tbl": table, "lo": wm, "hi": hi})
+    if not changes:
+        if hi > wm:
+            set_watermark(index, table, hi)
+        print(f"incremental: изменений нет (xmin {wm} → {hi})")
+        return True
+    if any(c["op"] == "T" for c in changes):
+        print("incremental: в журнале TRUNCATE")
+        return False
+
+    ids = sorted({c["row_id"] for c in changes if c["row_id"] is not None})
+    cols = ", ".join(fields)
+    sql = f"select {cols} from {schema}.{table} where {id_col} = any(%(ids)s::{id_type}[])"
+
+    t0 = time.time()
+    upserted = deleted = 0
+    for i in range(0, len(ids), BATCH):
+        part = ids[i:i + BATCH]
+        rows = pg_query(sql, {"ids": part})
+        found = {str(r[id_col]) for r in rows}
+        gone = [x for x in part if x not in found]
+        if rows:
+            bulk_index(index, id_col, rows)
+        if gone:
+            bulk_delete(index, gone)
+        upserted += len(rows)
+        deleted += len(gone)
+        progress(index, min(i + BATCH, len(ids)), len(ids))
+
+    set_watermark(index, table, hi)
+    dt = time.time() - t0
+    print(f"DONE (incremental): changes={len(changes)} upserted={upserted} deleted={deleted} "
+          f"xmin {wm} → {hi} in {dt:.1f}s")
+    return True
+
+def run_job_swap(job):
+    # build-then-swap: грузим в новое поколение, живой индекс не трогаем до переключения alias
+    schema = job["schema"]
+    table = job["table"]
+    alias = job["index"]
+    id_col = job["id_col"]
+    fields = job["fields"]
+    order_by = job.get("order_by") or id_col
+    settings = job.get("settings") or {"number_of_shards": 1, "number_of_replicas": 0}
+    mappings = job.get("mappings") or {}
+    keep = int(job.get("keep_generations") or 2)
+
+    gen = f"{alias}_{time.strftime('%Y%m%d%H%M%S')}"
+    print(f"swap_alias=True → building generation {gen}")
+
+    # на время заливки: без реплик и без refresh
+    load_settings = dict(settings, number_of_replicas=0, refresh_interval="-1")
+    create_index(gen, load_settings, mappings)
+
+    sql = job_sql(schema, table, fields, order_by)
+    expected = count_rows(schema, table)
+    t0 = time.time()
+    try:
+        total = bulk_load(gen, id_col, sql, expected, alias=alias)
+
+        put_index_settings(gen, {
+            "number_of_replicas": settings.get("number_of_replicas", 0),
+            "refresh_interval": settings.get("refresh_interval", "1s"),
+        })
+        refresh_index(gen)
+    except BaseException:   # в т.ч. SystemExit по SIGTERM (отмена задачи)
+        print(f"generation build failed → deleting {gen}")
+        delete_index(gen)
+        raise
+
+    old = swap_alias(alias, gen)
+    print(f"alias {alias}: {old or '-'} → {gen}")
+    gc_generations(alias, keep)
+
+    dt = time.time() - t0
+    print(f"DONE: {total} rows in {dt:.1f}s ({total/max(dt, 1e-9):.1f} rows/s)")
+
 def main():
+    args = parse_args()
+    # отмена из os_api (terminate) → SystemExit, чтобы отработали finally/очистка поколения
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(143))
+
     # быстрый health-check OS
     r = os_req("GET", "/")
     r.raise_for_status()
@@ -198,7 +709,13 @@ def main():
     print(f"Postgres: {PG_HOST}:{PG_PORT}/{PG_DB} OK")
 
     for job in JOBS:
-        run_job(job)
+        run_job(job, mode=args.mode)
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--mode", choices=["incremental", "full"], default=ETL_MODE,
+                   help="incremental (по журналу изменений) или full (полная пересборка)")
+    return p.parse_args()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
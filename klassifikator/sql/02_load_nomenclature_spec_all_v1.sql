@@ -12,4 +12,14 @@ alter table public.nomenclature_spec_all_v1
 
 alter table public.nomenclature_spec_all_v1
   add constraint fk_nomenclature_spec_all_v1_class_l3
-  foreign key (class_l3_id) references public.class_l3(id);
\ No newline at end of file
+  foreign key (class_l3_id) references public.class_l3(id);
+
+-- сводка по объектам (18_report_object_summary_v1.sql): DROP унёс её триггеры, 03_/04_*.sql пойдут через них
+do $$
+begin
+  -- при первом развёртывании по номерам функции ещё нет: сводку и триггеры построит сам 18_*.sql
+  if to_regprocedure('public.report_object_summary_v1_rebuild()') is not null then
+    perform public.report_object_summary_v1_rebuild();
+  end if;
+end;
+$$;
\ No newline at end of file
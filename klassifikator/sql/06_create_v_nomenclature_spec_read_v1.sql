@@ -1,27 +1,7 @@
-DROP TABLE IF EXISTS public.v_nomenclature_spec_read_v1;
+-- Полная пересборка v_nomenclature_spec_read_v1 через реестр корней дублей
+-- (функции в 17_nomenclature_dup_registry_v1.sql). Прежний вариант считал
+-- MIN(id_nom) OVER (PARTITION BY dup_key) по всей номенклатуре.
+-- После загрузки нового объекта достаточно дозагрузки:
+--   SELECT * FROM public.nomenclature_dup_registry_v1_append();
 
-CREATE TABLE public.v_nomenclature_spec_read_v1 AS
-WITH src AS (
-SELECT
-object_id,
-id AS id_nom,
-item_name,
-type_mark,
-false_condition,
-lower(translate(coalesce(item_name,'') || coalesce(type_mark,''), ' ' || chr(9) || chr(10) || chr(13), '')) AS dup_key
-FROM public.nomenclature_spec_all_v1
-),
-roots AS (
-SELECT
-*,
-MIN(id_nom) OVER (PARTITION BY dup_key) AS dup_root_id
-FROM src
-)
-SELECT
-object_id,
-id_nom,
-item_name,
-type_mark,
-false_condition,
-dup_root_id
-FROM roots;
\ No newline at end of file
+SELECT * FROM public.nomenclature_dup_registry_v1_rebuild();
\ No newline at end of file
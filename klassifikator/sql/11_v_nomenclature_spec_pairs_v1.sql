@@ -4,7 +4,8 @@ CREATE TABLE public.v_nomenclature_spec_pairs_v1 (
 id bigserial PRIMARY KEY,
 dup_root_id bigint,-- public.v_nomenclatuer_spec_read_v1.dup_root_id
 name_tep_korr text,-- доп. поле (пока пустое)
-name_tek text-- доп. поле (пока пустое)
+name_tek text,-- доп. поле (пока пустое)
+src_fp text-- отпечаток входа etl_nom.py: md5(item_name, type_mark, версия нормализатора)
 );
 
 -- 2) индексы под быстрый фильтр/джойны
@@ -0,0 +1,123 @@
+-- Журнал изменений для инкрементальной индексации OpenSearch
+-- (py_scripts/etl_pg_to_opensearch.py, etl_nomen_to_opensearch.py, режим --mode incremental).
+-- Триггеры пишут id изменённых строк и xid своей транзакции.
+-- Граница для ETL — не max(change_id): change_id выдаётся до commit, и транзакция, которая ещё идёт
+-- (чанк etl_nom, /pairs_update), закоммитит строку с меньшим change_id позже. ETL берёт только строки
+-- транзакций ниже pg_snapshot_xmin(pg_current_snapshot()) — все они уже завершены — и watermark
+-- (etl_watermark_v1.last_xmin) двигает до этого xmin; чистит журнал тоже только ниже него.
+-- Запускать после 11_*.sql и class_tree_nomen_v1.sql: при пересоздании таблиц триггеры пропадают.
+
+create table if not exists public.etl_changes_v1 (
+  change_id  bigserial primary key,
+  tbl        text        not null,          -- имя таблицы-источника
+  row_id     text        null,              -- id строки (null для TRUNCATE)
+  op         char(1)     not null,          -- I / U / D / T(runcate)
+  changed_at timestamptz not null default now(),
+  xid        xid8        not null default pg_current_xact_id()   -- транзакция, записавшая изменение
+);
+
+-- журнал, созданный до колонки xid: старые строки получат xid этого alter (будут переиндексированы ещё раз)
+alter table public.etl_changes_v1
+  add column if not exists xid xid8 not null default pg_current_xact_id();
+
+create index if not exists ix_etl_changes_v1_tbl_change_id
+on public.etl_changes_v1 (tbl, change_id);
+
+create index if not exists ix_etl_changes_v1_tbl_xid
+on public.etl_changes_v1 (tbl, xid);
+
+-- до какой транзакции job уже проиндексирован: все изменения транзакций с xid < last_xmin
+create table if not exists public.etl_watermark_v1 (
+  job            text primary key,          -- имя индекса/alias
+  last_change_id bigint      not null default 0,   -- прежний watermark, не используется
+  updated_at     timestamptz not null default now(),
+  last_xmin      bigint      null
+);
+
+-- null = watermark по change_id из старой версии: ETL сделает одну полную пересборку
+alter table public.etl_watermark_v1
+  add column if not exists last_xmin bigint null;
+
+
+create or replace function public.etl_changes_v1_row()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op = 'DELETE' then
+    insert into public.etl_changes_v1 (tbl, row_id, op) values (tg_table_name, old.id::text, 'D');
+    return old;
+  end if;
+
+  if tg_op = 'UPDATE' and new.id is distinct from old.id then
+    insert into public.etl_changes_v1 (tbl, row_id, op) values (tg_table_name, old.id::text, 'D');
+  end if;
+
+  insert into public.etl_changes_v1 (tbl, row_id, op) values (tg_table_name, new.id::text, left(tg_op, 1));
+  return new;
+end;
+$$;
+
+-- TRUNCATE: построчных событий нет, ETL увидит 'T' и сделает полную пересборку
+create or replace function public.etl_changes_v1_truncate()
+returns trigger
+language plpgsql
+as $$
+begin
+  insert into public.etl_changes_v1 (tbl, row_id, op) values (tg_table_name, null, 'T');
+  return null;
+end;
+$$;
+
+
+-- pairs -> индекс v_nomenclature_spec_pairs_v1 (поля id, name_tek, name_tep_korr)
+drop trigger if exists trg_etl_changes_ins on public.v_nomenclature_spec_pairs_v1;
+drop trigger if exists trg_etl_changes_upd on public.v_nomenclature_spec_pairs_v1;
+drop trigger if exists trg_etl_changes_del on public.v_nomenclature_spec_pairs_v1;
+drop trigger if exists trg_etl_changes_trunc on public.v_nomenclature_spec_pairs_v1;
+
+create trigger trg_etl_changes_ins
+after insert on public.v_nomenclature_spec_pairs_v1
+for each row execute function public.etl_changes_v1_row();
+
+create trigger trg_etl_changes_upd
+after update of id, name_tek, name_tep_korr on public.v_nomenclature_spec_pairs_v1
+for each row
+when (old.id is distinct from new.id
+   or old.name_tek is distinct from new.name_tek
+   or old.name_tep_korr is distinct from new.name_tep_korr)
+execute function public.etl_changes_v1_row();
+
+create trigger trg_etl_changes_del
+after delete on public.v_nomenclature_spec_pairs_v1
+for each row execute function public.etl_changes_v1_row();
+
+create trigger trg_etl_changes_trunc
+after truncate on public.v_nomenclature_spec_pairs_v1
+for each statement execute function public.etl_changes_v1_truncate();
+
+
+-- class_tree_nomen_v1 -> индекс class_tree_nomen_v1 (поля id, item_name)
+drop trigger if exists trg_etl_changes_ins on public.class_tree_nomen_v1;
+drop trigger if exists trg_etl_changes_upd on public.class_tree_nomen_v1;
+drop trigger if exists trg_etl_changes_del on public.class_tree_nomen_v1;
+drop trigger if exists trg_etl_changes_trunc on public.class_tree_nomen_v1;
+
+create trigger trg_etl_changes_ins
+after insert on public.class_tree_nomen_v1
+for each row execute function public.etl_changes_v1_row();
+
+create trigger trg_etl_changes_upd
+after update of id, item_name on public.class_tree_nomen_v1
+for each row
+when (old.id is distinct from new.id
+   or old.item_name is distinct from new.item_name)
+execute function public.etl_changes_v1_row();
+
+create trigger trg_etl_changes_del
+after delete on public.class_tree_nomen_v1
+for each row execute function public.etl_changes_v1_row();
+
+create trigger trg_etl_changes_trunc
+after truncate on public.class_tree_nomen_v1
+for each statement execute function public.etl_changes_v1_truncate();
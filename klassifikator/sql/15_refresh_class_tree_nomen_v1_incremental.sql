@@ -0,0 +1,327 @@
+-- 15_refresh_class_tree_nomen_v1_incremental.sql
+-- Инкрементальное обновление class_tree_nomen_v1 (вместо truncate + полной пересборки).
+-- Желаемый набор L4 считается той же логикой, что раньше была в 12_refresh_class_tree_nomen_v1.sql,
+-- и сравнивается с тем, что лежит в таблице: вставляются/обновляются/удаляются только отличающиеся L4.
+-- approved/note (правки редактора) у существующих L4 не трогаются.
+-- pending_cnt узлов меняют триггеры на L4 (16_class_tree_nomen_v1_rollup.sql) — только по цепочке родителей;
+-- узлы L1-L3 появляются/исчезают вместе с первым/последним L4 под ними; у существующих узлов
+-- имена/коды/номера/родитель подтягиваются из class_tree_v1 (без p_dup_root_ids — по всему дереву).
+--
+--   select * from public.refresh_class_tree_nomen_v1_incremental();             -- сверить всё дерево
+--   select * from public.refresh_class_tree_nomen_v1_incremental(array[1,2,3]); -- только эти dup_root_id
+
+drop function if exists public.refresh_class_tree_nomen_v1_incremental(bigint[]);
+
+create or replace function public.refresh_class_tree_nomen_v1_incremental(p_dup_root_ids bigint[] default null)
+returns table (l4_inserted int, l4_updated int, l4_deleted int,
+               nodes_inserted int, nodes_updated int, nodes_deleted int)
+language plpgsql
+as $$
+declare
+  v_ins       int := 0;
+  v_upd       int := 0;
+  v_del       int := 0;
+  v_nodes_ins int := 0;
+  v_nodes_upd int := 0;
+  v_nodes_del int := 0;
+  n           int;
+  r           record;
+begin
+  drop table if exists _ctn_l4;
+  drop table if exists _ctn_changed;
+  drop table if exists _ctn_paths;
+  drop table if exists _ctn_moved;
+
+  -- 1) желаемые L4 (одна строка на dup_root_id; приоритет: где есть unit, потом по имени)
+  create temp table _ctn_l4 on commit drop as
+  with l4_raw as (
+    select
+      ld.dup_root_id,
+      ('DR:' || ld.dup_root_id::text) as id,
+      ('L3:' || l3.code)              as parent_id,
+
+      l1.code as l1_code, l1.name as l1_name,
+      l2.code as l2_code, l2.name as l2_name,
+      l3.code as l3_code, l3.name as l3_name,
+
+      p.name_tep_korr as item_name,
+      s.uom           as unit,
+
+      coalesce(split_part(l1.code, '.', 1), '0')::int as l1_num,
+      coalesce(split_part(l2.code, '.', 2), '0')::int as l2_num,
+      coalesce(split_part(l3.code, '.', 3), '0')::int as l3_num,
+      ld.dup_root_id as l4_num
+    from (
+      select distinct on (dup_root_id) dup_root_id, l3_id
+      from public.v_nomenclature_spec_l3_dup_links_v1
+      where dup_root_id is not null and l3_id is not null
+        and (p_dup_root_ids is null or dup_root_id = any(p_dup_root_ids))
+      order by dup_root_id, l3_id
+    ) ld
+    join public.class_l3 l3 on l3.id = ld.l3_id
+    join public.class_l2 l2 on l2.id = l3.parent_id_l2
+    join public.class_l1 l1 on l1.id = l2.parent_id_l1
+
+    join public.v_nomenclature_spec_pairs_v1 p
+      on p.dup_root_id = ld.dup_root_id
+     and p.name_tep_korr is not null
+     and lower(p.name_tep_korr) not like '%удалить%'
+
+    left join public.v_nomenclature_spec_read_v1 r
+      on r.dup_root_id = ld.dup_root_id
+
+    left join public.v_nomenclature_spec_v1 s
+      on s.id = r.id_nom
+  )
+  select distinct on (dup_root_id) *
+  from l4_raw
+  order by dup_root_id,
+           (unit is not null) desc,
+           item_name;
+
+  create unique index on _ctn_l4 (id);
+  analyze _ctn_l4;
+
+  -- 2) что поменялось: D — L4 больше не нужен, U — другие данные/родитель, I — новый
+  create temp table _ctn_changed (
+    id         text primary key,
+    op         char(1) not null,
+    old_parent text null,
+    new_parent text null
+  ) on commit drop;
+
+  insert into _ctn_changed (id, op, old_parent)
+  select t.id, 'D', t.parent_id
+  from public.class_tree_nomen_v1 t
+  where t.level = 4
+    and (p_dup_root_ids is null or t.dup_root_id = any(p_dup_root_ids))
+    and not exists (select 1 from _ctn_l4 d where d.id = t.id);
+
+  insert into _ctn_changed (id, op, old_parent, new_parent)
+  select d.id, 'U', t.parent_id, d.parent_id
+  from _ctn_l4 d
+  join public.class_tree_nomen_v1 t on t.id = d.id
+  where (t.parent_id, t.l1_code, t.l1_name, t.l2_code, t.l2_name, t.l3_code, t.l3_name,
+         t.dup_root_id, t.item_name, t.unit, t.l1_num, t.l2_num, t.l3_num, t.l4_num)
+        is distinct from
+        (d.parent_id, d.l1_code, d.l1_name, d.l2_code, d.l2_name, d.l3_code, d.l3_name,
+         d.dup_root_id, d.item_name, d.unit, d.l1_num, d.l2_num, d.l3_num, d.l4_num);
+
+  insert into _ctn_changed (id, op, new_parent)
+  select d.id, 'I', d.parent_id
+  from _ctn_l4 d
+  where not exists (select 1 from public.class_tree_nomen_v1 t where t.id = d.id);
+
+  -- 3) пути L3 -> L2 -> L1 затронутых строк (и по классификатору, и по уже лежащим узлам)
+  create temp table _ctn_paths on commit drop as
+  with l3_ids as (
+    select old_parent as l3_id from _ctn_changed where old_parent is not null
+    union
+    select new_parent from _ctn_changed where new_parent is not null
+  )
+  select ('L3:' || ct.l3_code) as l3_id, ('L2:' || ct.l2_code) as l2_id, ('L1:' || ct.l1_code) as l1_id
+  from public.class_tree_v1 ct
+  join l3_ids x on x.l3_id = ('L3:' || ct.l3_code)
+  where ct.level = 3
+  union
+  select n3.id, n3.parent_id, n2.parent_id
+  from public.class_tree_nomen_v1 n3
+  join l3_ids x on x.l3_id = n3.id
+  left join public.class_tree_nomen_v1 n2 on n2.id = n3.parent_id;
+
+  -- 4) недостающие узлы L1-L3 на путях новых/переехавших L4
+  insert into public.class_tree_nomen_v1 (
+    id, parent_id, level,
+    l1_code, l1_name,
+    l2_code, l2_name,
+    l3_code, l3_name,
+    l4_code, l4_name,
+    dup_root_id, item_name, unit,
+    approved, note,
+    pending_cnt,
+    l1_num, l2_num, l3_num, l4_num
+  )
+  select
+    x.id,
+    case
+      when ct.level = 1 then null::text
+      when ct.level = 2 then ('L1:' || ct.l1_code)
+      when ct.level = 3 then ('L2:' || ct.l2_code)
+    end,
+    ct.level,
+    ct.l1_code, ct.l1_name,
+    ct.l2_code, ct.l2_name,
+    ct.l3_code, ct.l3_name,
+    null::text, null::text,
+    null::int, null::text, null::text,
+    false, null::text,
+    0,
+    coalesce(ct.l1_num,0), coalesce(ct.l2_num,0), coalesce(ct.l3_num,0), 0
+  from public.class_tree_v1 ct
+  cross join lateral (
+    select case
+      when ct.level = 1 then ('L1:' || ct.l1_code)
+      when ct.level = 2 then ('L2:' || ct.l2_code)
+      when ct.level = 3 then ('L3:' || ct.l3_code)
+    end as id
+  ) x
+  where ct.level in (1,2,3)
+    and x.id in (
+      select p.l1_id from _ctn_paths p join _ctn_changed c on c.new_parent = p.l3_id
+      union
+      select p.l2_id from _ctn_paths p join _ctn_changed c on c.new_parent = p.l3_id
+      union
+      select p.l3_id from _ctn_paths p join _ctn_changed c on c.new_parent = p.l3_id
+    )
+    and not exists (select 1 from public.class_tree_nomen_v1 t where t.id = x.id);
+  get diagnostics v_nodes_ins = row_count;
+
+  -- 4b) уже лежащие узлы L1-L3: переименования, смена кодов/номеров и перенос в class_tree_v1.
+  --     Без p_dup_root_ids сверяется всё дерево, иначе — узлы на путях затронутых L4.
+  --     Старые значения (o) — снимок до update: из него родитель, который мог опустеть, и pending_cnt узла.
+  create temp table _ctn_moved (
+    id          text not null,
+    old_parent  text null,
+    old_grand   text null,
+    new_parent  text null,
+    pending_cnt int  not null
+  ) on commit drop;
+
+  with src as (
+    select
+      ct.id,
+      case
+        when ct.level = 2 then ('L1:' || ct.l1_code)
+        when ct.level = 3 then ('L2:' || ct.l2_code)
+      end as parent_id,
+      ct.l1_code, ct.l1_name,
+      ct.l2_code, ct.l2_name,
+      ct.l3_code, ct.l3_name,
+      coalesce(ct.l1_num,0) as l1_num, coalesce(ct.l2_num,0) as l2_num, coalesce(ct.l3_num,0) as l3_num
+    from public.class_tree_v1 ct
+    where ct.level in (1,2,3)
+      and (p_dup_root_ids is null
+           or ct.id in (select l1_id from _ctn_paths
+                        union select l2_id from _ctn_paths
+                        union select l3_id from _ctn_paths))
+  ),
+  upd as (
+    update public.class_tree_nomen_v1 t
+    set parent_id = s.parent_id,
+        l1_code   = s.l1_code,
+        l1_name   = s.l1_name,
+        l2_code   = s.l2_code,
+        l2_name   = s.l2_name,
+        l3_code   = s.l3_code,
+        l3_name   = s.l3_name,
+        l1_num    = s.l1_num,
+        l2_num    = s.l2_num,
+        l3_num    = s.l3_num
+    from src s
+    join public.class_tree_nomen_v1 o on o.id = s.id
+    left join public.class_tree_nomen_v1 op on op.id = o.parent_id
+    where t.id = s.id
+      and t.level in (1,2,3)
+      and (o.parent_id, o.l1_code, o.l1_name, o.l2_code, o.l2_name, o.l3_code, o.l3_name,
+           o.l1_num, o.l2_num, o.l3_num)
+          is distinct from
+          (s.parent_id, s.l1_code, s.l1_name, s.l2_code, s.l2_name, s.l3_code, s.l3_name,
+           s.l1_num, s.l2_num, s.l3_num)
+    returning t.id, o.parent_id as old_parent, op.parent_id as old_grand, t.parent_id as new_parent,
+              coalesce(o.pending_cnt, 0) as pending_cnt
+  )
+  insert into _ctn_moved (id, old_parent, old_grand, new_parent, pending_cnt)
+  select id, old_parent, old_grand, new_parent, pending_cnt from upd;
+  get diagnostics v_nodes_upd = row_count;
+
+  -- перенос узла: триггеры 16_*.sql считают только L4, его pending_cnt переносим по цепочкам сами
+  for r in
+    select old_parent, new_parent, pending_cnt
+    from _ctn_moved
+    where old_parent is distinct from new_parent and pending_cnt <> 0
+  loop
+    perform public.class_tree_nomen_v1_bump(r.old_parent, -r.pending_cnt);
+    perform public.class_tree_nomen_v1_bump(r.new_parent, r.pending_cnt);
+  end loop;
+
+  -- 5) сами L4
+  delete from public.class_tree_nomen_v1 t
+  using _ctn_changed c
+  where c.op = 'D' and t.id = c.id;
+  get diagnostics v_del = row_count;
+
+  update public.class_tree_nomen_v1 t
+  set parent_id   = d.parent_id,
+      l1_code     = d.l1_code,
+      l1_name     = d.l1_name,
+      l2_code     = d.l2_code,
+      l2_name     = d.l2_name,
+      l3_code     = d.l3_code,
+      l3_name     = d.l3_name,
+      dup_root_id = d.dup_root_id,
+      item_name   = d.item_name,
+      unit        = d.unit,
+      l1_num      = d.l1_num,
+      l2_num      = d.l2_num,
+      l3_num      = d.l3_num,
+      l4_num      = d.l4_num
+  from _ctn_changed c
+  join _ctn_l4 d on d.id = c.id
+  where c.op = 'U' and t.id = c.id;
+  get diagnostics v_upd = row_count;
+
+  insert into public.class_tree_nomen_v1 (
+    id, parent_id, level,
+    l1_code, l1_name,
+    l2_code, l2_name,
+    l3_code, l3_name,
+    l4_code, l4_name,
+    dup_root_id, item_name, unit,
+    approved, note,
+    pending_cnt,
+    l1_num, l2_num, l3_num, l4_num
+  )
+  select
+    d.id, d.parent_id, 4,
+    d.l1_code, d.l1_name,
+    d.l2_code, d.l2_name,
+    d.l3_code, d.l3_name,
+    null::text, null::text,
+    d.dup_root_id, d.item_name, d.unit,
+    false, null::text,
+    0,
+    d.l1_num, d.l2_num, d.l3_num, d.l4_num
+  from _ctn_changed c
+  join _ctn_l4 d on d.id = c.id
+  where c.op = 'I';
+  get diagnostics v_ins = row_count;
+
+  -- 6) pending_cnt на L1-L3 поддерживают триггеры на L4 (16_class_tree_nomen_v1_rollup.sql);
+  --    здесь только убираем опустевшие узлы, снизу вверх
+  delete from public.class_tree_nomen_v1 t
+  where t.level = 3
+    and t.id in (select l3_id from _ctn_paths)
+    and not exists (select 1 from public.class_tree_nomen_v1 c where c.parent_id = t.id);
+  get diagnostics n = row_count;
+  v_nodes_del := v_nodes_del + n;
+
+  delete from public.class_tree_nomen_v1 t
+  where t.level = 2
+    and (t.id in (select l2_id from _ctn_paths)
+         or t.id in (select old_parent from _ctn_moved where old_parent is distinct from new_parent))
+    and not exists (select 1 from public.class_tree_nomen_v1 c where c.parent_id = t.id);
+  get diagnostics n = row_count;
+  v_nodes_del := v_nodes_del + n;
+
+  delete from public.class_tree_nomen_v1 t
+  where t.level = 1
+    and (t.id in (select l1_id from _ctn_paths)
+         or t.id in (select old_parent from _ctn_moved where old_parent is distinct from new_parent)
+         or t.id in (select old_grand from _ctn_moved where old_parent is distinct from new_parent))
+    and not exists (select 1 from public.class_tree_nomen_v1 c where c.parent_id = t.id);
+  get diagnostics n = row_count;
+  v_nodes_del := v_nodes_del + n;
+
+  return query select v_ins, v_upd, v_del, v_nodes_ins, v_nodes_upd, v_nodes_del;
+end;
+$$;
@@ -0,0 +1,257 @@
+-- 16_class_tree_nomen_v1_rollup.sql
+-- pending_cnt узлов L1-L3 в class_tree_nomen_v1 поддерживается триггерами, без пересчёта всего дерева:
+--   * вставка/удаление/перенос L4 -> +-1 по цепочке родителей L3 -> L2 -> L1 (O(глубины) на родителя);
+--   * изменения связей v_nomenclature_spec_l3_dup_links_v1 и пар v_nomenclature_spec_pairs_v1
+--     -> refresh_class_tree_nomen_v1_incremental(затронутые dup_root_id), а он уже двигает L4.
+-- Проверка: select * from public.verify_class_tree_nomen_v1_counts();       -- расхождения с полным пересчётом
+--           select * from public.verify_class_tree_nomen_v1_counts(true);   -- и сразу исправить
+--
+-- Запускать после 15_*.sql, а также после каждого пересоздания class_tree_nomen_v1 / 10_*.sql / 11_*.sql
+-- (DROP TABLE уносит триггеры). Для массовой перезаливки связей/пар триггеры можно приглушить:
+--   set local class_tree_nomen_v1.sync = 'off';  ... ;  select * from public.refresh_class_tree_nomen_v1_incremental();
+
+
+-- ====== счётчики по цепочке родителей ======
+
+create or replace function public.class_tree_nomen_v1_bump(p_parent_id text, p_delta int)
+returns void
+language plpgsql
+as $$
+declare
+  v_id text := p_parent_id;
+begin
+  while v_id is not null and p_delta <> 0 loop
+    update public.class_tree_nomen_v1
+    set pending_cnt = coalesce(pending_cnt, 0) + p_delta
+    where id = v_id
+    returning parent_id into v_id;
+
+    exit when not found;
+  end loop;
+end;
+$$;
+
+-- statement-триггеры: дельты сначала сворачиваются по parent_id, потом идут вверх
+create or replace function public.class_tree_nomen_v1_rollup()
+returns trigger
+language plpgsql
+as $$
+declare
+  r record;
+begin
+  if tg_op = 'INSERT' then
+    for r in
+      select parent_id, count(*)::int as d
+      from new_rows where level = 4 and parent_id is not null
+      group by parent_id
+    loop
+      perform public.class_tree_nomen_v1_bump(r.parent_id, r.d);
+    end loop;
+
+  elsif tg_op = 'DELETE' then
+    for r in
+      select parent_id, -count(*)::int as d
+      from old_rows where level = 4 and parent_id is not null
+      group by parent_id
+    loop
+      perform public.class_tree_nomen_v1_bump(r.parent_id, r.d);
+    end loop;
+
+  else
+    for r in
+      select parent_id, sum(d)::int as d
+      from (
+        select parent_id, -1 as d from old_rows where level = 4 and parent_id is not null
+        union all
+        select parent_id,  1 as d from new_rows where level = 4 and parent_id is not null
+      ) x
+      group by parent_id
+      having sum(d) <> 0
+    loop
+      perform public.class_tree_nomen_v1_bump(r.parent_id, r.d);
+    end loop;
+  end if;
+
+  return null;
+end;
+$$;
+
+drop trigger if exists trg_ctn_rollup_ins on public.class_tree_nomen_v1;
+drop trigger if exists trg_ctn_rollup_upd on public.class_tree_nomen_v1;
+drop trigger if exists trg_ctn_rollup_del on public.class_tree_nomen_v1;
+
+create trigger trg_ctn_rollup_ins
+after insert on public.class_tree_nomen_v1
+referencing new table as new_rows
+for each statement execute function public.class_tree_nomen_v1_rollup();
+
+create trigger trg_ctn_rollup_upd
+after update on public.class_tree_nomen_v1
+referencing old table as old_rows new table as new_rows
+for each statement execute function public.class_tree_nomen_v1_rollup();
+
+create trigger trg_ctn_rollup_del
+after delete on public.class_tree_nomen_v1
+referencing old table as old_rows
+for each statement execute function public.class_tree_nomen_v1_rollup();
+
+
+-- ====== связи и пары -> точечный refresh ======
+
+create or replace function public.class_tree_nomen_v1_sync()
+returns trigger
+language plpgsql
+as $$
+declare
+  v_ids bigint[];
+begin
+  if current_setting('class_tree_nomen_v1.sync', true) = 'off' then
+    return null;
+  end if;
+
+  if tg_op = 'TRUNCATE' then
+    perform public.refresh_class_tree_nomen_v1_incremental();
+    return null;
+  end if;
+
+  if tg_op = 'INSERT' then
+    select array_agg(distinct dup_root_id) into v_ids
+    from new_rows where dup_root_id is not null;
+
+  elsif tg_op = 'DELETE' then
+    select array_agg(distinct dup_root_id) into v_ids
+    from old_rows where dup_root_id is not null;
+
+  elsif tg_table_name = 'v_nomenclature_spec_pairs_v1' then
+    -- у пар на дерево влияют только dup_root_id и name_tep_korr
+    select array_agg(distinct x.dup_root_id) into v_ids
+    from (
+      select o.dup_root_id, n.dup_root_id as dup_root_id_new
+      from old_rows o
+      join new_rows n on n.id = o.id
+      where (o.dup_root_id, o.name_tep_korr) is distinct from (n.dup_root_id, n.name_tep_korr)
+    ) c
+    cross join lateral (values (c.dup_root_id), (c.dup_root_id_new)) x(dup_root_id)
+    where x.dup_root_id is not null;
+
+  else
+    select array_agg(distinct dup_root_id) into v_ids
+    from (
+      select dup_root_id from old_rows
+      union
+      select dup_root_id from new_rows
+    ) x
+    where dup_root_id is not null;
+  end if;
+
+  if v_ids is not null then
+    perform public.refresh_class_tree_nomen_v1_incremental(v_ids);
+  end if;
+  return null;
+end;
+$$;
+
+drop trigger if exists trg_ctn_sync_ins on public.v_nomenclature_spec_l3_dup_links_v1;
+drop trigger if exists trg_ctn_sync_upd on public.v_nomenclature_spec_l3_dup_links_v1;
+drop trigger if exists trg_ctn_sync_del on public.v_nomenclature_spec_l3_dup_links_v1;
+drop trigger if exists trg_ctn_sync_trunc on public.v_nomenclature_spec_l3_dup_links_v1;
+
+create trigger trg_ctn_sync_ins
+after insert on public.v_nomenclature_spec_l3_dup_links_v1
+referencing new table as new_rows
+for each statement execute function public.class_tree_nomen_v1_sync();
+
+create trigger trg_ctn_sync_upd
+after update on public.v_nomenclature_spec_l3_dup_links_v1
+referencing old table as old_rows new table as new_rows
+for each statement execute function public.class_tree_nomen_v1_sync();
+
+create trigger trg_ctn_sync_del
+after delete on public.v_nomenclature_spec_l3_dup_links_v1
+referencing old table as old_rows
+for each statement execute function public.class_tree_nomen_v1_sync();
+
+create trigger trg_ctn_sync_trunc
+after truncate on public.v_nomenclature_spec_l3_dup_links_v1
+for each statement execute function public.class_tree_nomen_v1_sync();
+
+drop trigger if exists trg_ctn_sync_ins on public.v_nomenclature_spec_pairs_v1;
+drop trigger if exists trg_ctn_sync_upd on public.v_nomenclature_spec_pairs_v1;
+drop trigger if exists trg_ctn_sync_del on public.v_nomenclature_spec_pairs_v1;
+drop trigger if exists trg_ctn_sync_trunc on public.v_nomenclature_spec_pairs_v1;
+
+create trigger trg_ctn_sync_ins
+after insert on public.v_nomenclature_spec_pairs_v1
+referencing new table as new_rows
+for each statement execute function public.class_tree_nomen_v1_sync();
+
+create trigger trg_ctn_sync_upd
+after update on public.v_nomenclature_spec_pairs_v1
+referencing old table as old_rows new table as new_rows
+for each statement execute function public.class_tree_nomen_v1_sync();
+
+create trigger trg_ctn_sync_del
+after delete on public.v_nomenclature_spec_pairs_v1
+referencing old table as old_rows
+for each statement execute function public.class_tree_nomen_v1_sync();
+
+create trigger trg_ctn_sync_trunc
+after truncate on public.v_nomenclature_spec_pairs_v1
+for each statement execute function public.class_tree_nomen_v1_sync();
+
+
+-- ====== проверка: поддерживаемые счётчики против полного пересчёта ======
+
+create or replace function public.verify_class_tree_nomen_v1_counts(p_fix boolean default false)
+returns table (id text, level int, stored int, actual int)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+  drop table if exists _ctn_verify;
+
+  create temp table _ctn_verify on commit drop as
+  with l3 as (
+    select n.id, n.parent_id,
+           (select count(*) from public.class_tree_nomen_v1 c
+            where c.parent_id = n.id and c.level = 4)::int as cnt
+    from public.class_tree_nomen_v1 n
+    where n.level = 3
+  ),
+  l2 as (
+    select n.id, n.parent_id, coalesce(sum(l3.cnt), 0)::int as cnt
+    from public.class_tree_nomen_v1 n
+    left join l3 on l3.parent_id = n.id
+    where n.level = 2
+    group by n.id, n.parent_id
+  ),
+  l1 as (
+    select n.id, coalesce(sum(l2.cnt), 0)::int as cnt
+    from public.class_tree_nomen_v1 n
+    left join l2 on l2.parent_id = n.id
+    where n.level = 1
+    group by n.id
+  ),
+  actual as (
+    select l3.id, l3.cnt from l3
+    union all
+    select l2.id, l2.cnt from l2
+    union all
+    select l1.id, l1.cnt from l1
+  )
+  select t.id, t.level, t.pending_cnt as stored, a.cnt as actual
+  from public.class_tree_nomen_v1 t
+  join actual a on a.id = t.id
+  where t.pending_cnt is distinct from a.cnt;
+
+  if p_fix then
+    update public.class_tree_nomen_v1 t
+    set pending_cnt = v.actual
+    from _ctn_verify v
+    where t.id = v.id;
+  end if;
+
+  return query select v.id, v.level, v.stored, v.actual from _ctn_verify v order by v.level, v.id;
+  drop table _ctn_verify;
+end;
+$$;
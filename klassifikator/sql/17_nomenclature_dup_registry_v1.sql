@@ -0,0 +1,170 @@
+-- 17_nomenclature_dup_registry_v1.sql
+-- Реестр корней дублей для v_nomenclature_spec_read_v1 вместо MIN(id) OVER (PARTITION BY dup_key)
+-- по всей nomenclature_spec_all_v1 (сортировка всей номенклатуры на каждую загрузку объекта).
+--
+-- dup_key -> dup_root_id хранится в nomenclature_dup_registry_v1. Ключ поиска — dup_hash = md5(dup_key)::uuid
+-- (hash-партиции и PK по нему): сам dup_key — склеенные item_name+type_mark, бывает длиннее предела строки btree,
+-- поэтому хранится рядом без индекса.
+-- Новые строки (id > уже разобранного max(id_nom)) ищут свой корень по индексу; новый ключ получает
+-- корнем свой min(id) — он больше всех старых id, поэтому MIN по всей таблице не меняется.
+--
+-- После загрузки нового объекта (03_/04_*.sql):
+--   select * from public.nomenclature_dup_registry_v1_append();
+-- Полная пересборка (правили item_name/type_mark у старых строк, перезаливали nomenclature_spec_all_v1):
+--   select * from public.nomenclature_dup_registry_v1_rebuild();   -- её же вызывает 06_*.sql
+-- Функции создать один раз, до 06_*.sql.
+
+-- тот же ключ, что был в 06_*.sql
+create or replace function public.nomenclature_dup_key_v1(p_item_name text, p_type_mark text)
+returns text
+language sql
+immutable
+parallel safe
+as $$
+  select lower(translate(coalesce(p_item_name,'') || coalesce(p_type_mark,''), ' ' || chr(9) || chr(10) || chr(13), ''))
+$$;
+
+create or replace function public.nomenclature_dup_hash_v1(p_dup_key text)
+returns uuid
+language sql
+immutable
+parallel safe
+as $$
+  select md5(p_dup_key)::uuid
+$$;
+
+-- реестр прежней версии (PK по тексту dup_key) пересоздаётся; после этого — select * from ..._rebuild();
+do $$
+begin
+  if to_regclass('public.nomenclature_dup_registry_v1') is not null
+     and not exists (
+       select 1 from information_schema.columns
+       where table_schema = 'public' and table_name = 'nomenclature_dup_registry_v1' and column_name = 'dup_hash'
+     ) then
+    drop table public.nomenclature_dup_registry_v1;
+    raise notice 'nomenclature_dup_registry_v1 recreated with dup_hash key: run nomenclature_dup_registry_v1_rebuild()';
+  end if;
+end;
+$$;
+
+create table if not exists public.nomenclature_dup_registry_v1 (
+  dup_hash    uuid   not null,
+  dup_key     text   not null,
+  dup_root_id bigint not null,
+  primary key (dup_hash)
+) partition by hash (dup_hash);
+
+create table if not exists public.nomenclature_dup_registry_v1_p0 partition of public.nomenclature_dup_registry_v1 for values with (modulus 8, remainder 0);
+create table if not exists public.nomenclature_dup_registry_v1_p1 partition of public.nomenclature_dup_registry_v1 for values with (modulus 8, remainder 1);
+create table if not exists public.nomenclature_dup_registry_v1_p2 partition of public.nomenclature_dup_registry_v1 for values with (modulus 8, remainder 2);
+create table if not exists public.nomenclature_dup_registry_v1_p3 partition of public.nomenclature_dup_registry_v1 for values with (modulus 8, remainder 3);
+create table if not exists public.nomenclature_dup_registry_v1_p4 partition of public.nomenclature_dup_registry_v1 for values with (modulus 8, remainder 4);
+create table if not exists public.nomenclature_dup_registry_v1_p5 partition of public.nomenclature_dup_registry_v1 for values with (modulus 8, remainder 5);
+create table if not exists public.nomenclature_dup_registry_v1_p6 partition of public.nomenclature_dup_registry_v1 for values with (modulus 8, remainder 6);
+create table if not exists public.nomenclature_dup_registry_v1_p7 partition of public.nomenclature_dup_registry_v1 for values with (modulus 8, remainder 7);
+
+create index if not exists ix_nomenclature_dup_registry_v1_dup_root_id
+on public.nomenclature_dup_registry_v1 (dup_root_id);
+
+
+-- ====== дозагрузка: только строки, которых ещё нет в v_nomenclature_spec_read_v1 ======
+
+create or replace function public.nomenclature_dup_registry_v1_append()
+returns table (rows_added bigint, roots_added bigint)
+language plpgsql
+as $$
+declare
+  v_max_id bigint;
+  v_rows   bigint := 0;
+  v_roots  bigint := 0;
+begin
+  select coalesce(max(id_nom), 0) into v_max_id from public.v_nomenclature_spec_read_v1;
+
+  drop table if exists _ndr_new;
+  create temp table _ndr_new on commit drop as
+  select
+    object_id,
+    id as id_nom,
+    item_name,
+    type_mark,
+    false_condition,
+    public.nomenclature_dup_key_v1(item_name, type_mark) as dup_key,
+    public.nomenclature_dup_hash_v1(public.nomenclature_dup_key_v1(item_name, type_mark)) as dup_hash
+  from public.nomenclature_spec_all_v1
+  where id > v_max_id;
+
+  -- новые ключи: корень = min(id) среди новых строк (старые id все меньше — ключ был бы уже в реестре)
+  insert into public.nomenclature_dup_registry_v1 (dup_hash, dup_key, dup_root_id)
+  select dup_hash, min(dup_key), min(id_nom)
+  from _ndr_new
+  group by dup_hash
+  on conflict (dup_hash) do nothing;
+  get diagnostics v_roots = row_count;
+
+  insert into public.v_nomenclature_spec_read_v1 (object_id, id_nom, item_name, type_mark, false_condition, dup_root_id)
+  select n.object_id, n.id_nom, n.item_name, n.type_mark, n.false_condition, g.dup_root_id
+  from _ndr_new n
+  join public.nomenclature_dup_registry_v1 g on g.dup_hash = n.dup_hash;
+  get diagnostics v_rows = row_count;
+
+  -- 07_*.sql: distinct (dup_root_id, false_condition)
+  if to_regclass('public.v_nomenclature_spec_dup_roots_v1') is not null then
+    insert into public.v_nomenclature_spec_dup_roots_v1 (dup_root_id, false_condition)
+    select distinct g.dup_root_id, (n.false_condition)::boolean
+    from _ndr_new n
+    join public.nomenclature_dup_registry_v1 g on g.dup_hash = n.dup_hash
+    where not exists (
+      select 1 from public.v_nomenclature_spec_dup_roots_v1 d
+      where d.dup_root_id = g.dup_root_id
+        and d.false_condition is not distinct from (n.false_condition)::boolean
+    );
+  end if;
+
+  drop table _ndr_new;
+  return query select v_rows, v_roots;
+end;
+$$;
+
+
+-- ====== полная пересборка (бывший 06_*.sql): group by вместо оконной сортировки ======
+
+create or replace function public.nomenclature_dup_registry_v1_rebuild()
+returns table (rows_added bigint, roots_added bigint)
+language plpgsql
+as $$
+declare
+  v_rows  bigint := 0;
+  v_roots bigint := 0;
+begin
+  truncate public.nomenclature_dup_registry_v1;
+
+  insert into public.nomenclature_dup_registry_v1 (dup_hash, dup_key, dup_root_id)
+  select public.nomenclature_dup_hash_v1(k.dup_key), min(k.dup_key), min(k.id)
+  from (
+    select id, public.nomenclature_dup_key_v1(item_name, type_mark) as dup_key
+    from public.nomenclature_spec_all_v1
+  ) k
+  group by 1;
+  get diagnostics v_roots = row_count;
+
+  -- структура как у прежнего CREATE TABLE AS; индексы 06_1_*.sql переживают truncate
+  create table if not exists public.v_nomenclature_spec_read_v1 as
+  select object_id, id as id_nom, item_name, type_mark, false_condition, id as dup_root_id
+  from public.nomenclature_spec_all_v1
+  with no data;
+
+  truncate public.v_nomenclature_spec_read_v1;
+
+  insert into public.v_nomenclature_spec_read_v1 (object_id, id_nom, item_name, type_mark, false_condition, dup_root_id)
+  select s.object_id, s.id, s.item_name, s.type_mark, s.false_condition, g.dup_root_id
+  from public.nomenclature_spec_all_v1 s
+  join public.nomenclature_dup_registry_v1 g
+    on g.dup_hash = public.nomenclature_dup_hash_v1(public.nomenclature_dup_key_v1(s.item_name, s.type_mark));
+  get diagnostics v_rows = row_count;
+
+  analyze public.nomenclature_dup_registry_v1;
+  analyze public.v_nomenclature_spec_read_v1;
+
+  return query select v_rows, v_roots;
+end;
+$$;
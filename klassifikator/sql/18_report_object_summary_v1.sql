@@ -0,0 +1,181 @@
+-- 18_report_object_summary_v1.sql
+-- Сводка номенклатуры по объектам для /reports/nomenclature_by_object и v_stats_object_classification_v1
+-- вместо count(*) ... group by по всей nomenclature_spec_all_v1 на каждый запрос.
+--
+-- report_object_summary_v1: (object_id, object_code, object_name) -> total_positions, classified_positions.
+-- Поддерживается statement-триггерами на nomenclature_spec_all_v1: вставка/удаление/правка строк
+-- (в т.ч. class_l3_id из Directus) сворачиваются в дельты по объекту и прибавляются к сводке.
+-- Загрузка объекта (03_/04_*.sql) — один insert, одна пачка дельт.
+--
+-- 01_/02_*.sql / nomenclature_spec_all_v1.sql пересоздают таблицу (DROP уносит триггеры) и в конце вызывают
+--   select * from public.report_object_summary_v1_rebuild();   -- полный пересчёт + триггеры заново
+-- (только если функция уже есть: при первом развёртывании по номерам сводку строит этот файл, последней строкой).
+-- Проверка: select * from public.verify_report_object_summary_v1();   -- расхождения с полным пересчётом
+
+
+-- ====== сводка ======
+
+create or replace function public.report_object_summary_v1_create()
+returns void
+language plpgsql
+as $$
+begin
+  -- типы ключа — как в nomenclature_spec_all_v1 (create or replace view v_stats_* их не меняет)
+  create table if not exists public.report_object_summary_v1 as
+  select object_id, object_code, object_name,
+         0::bigint as total_positions,
+         0::bigint as classified_positions
+  from public.nomenclature_spec_all_v1
+  with no data;
+
+  create unique index if not exists ux_report_object_summary_v1
+  on public.report_object_summary_v1 (object_id, object_code, object_name) nulls not distinct;
+end;
+$$;
+
+
+-- ====== дельты из переходных таблиц ======
+
+create or replace function public.report_object_summary_v1_apply()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op = 'TRUNCATE' then
+    truncate public.report_object_summary_v1;
+    return null;
+  end if;
+
+  if tg_op = 'INSERT' then
+    insert into public.report_object_summary_v1 as s
+      (object_id, object_code, object_name, total_positions, classified_positions)
+    select object_id, object_code, object_name, count(*), count(class_l3_id)
+    from new_rows
+    group by 1, 2, 3
+    on conflict (object_id, object_code, object_name) do update
+    set total_positions      = s.total_positions + excluded.total_positions,
+        classified_positions = s.classified_positions + excluded.classified_positions;
+
+  elsif tg_op = 'DELETE' then
+    insert into public.report_object_summary_v1 as s
+      (object_id, object_code, object_name, total_positions, classified_positions)
+    select object_id, object_code, object_name, -count(*), -count(class_l3_id)
+    from old_rows
+    group by 1, 2, 3
+    on conflict (object_id, object_code, object_name) do update
+    set total_positions      = s.total_positions + excluded.total_positions,
+        classified_positions = s.classified_positions + excluded.classified_positions;
+
+  else
+    -- правка: строки без изменений ключа/классификации дают нулевую дельту и отсекаются
+    insert into public.report_object_summary_v1 as s
+      (object_id, object_code, object_name, total_positions, classified_positions)
+    select object_id, object_code, object_name, sum(dt), sum(dc)
+    from (
+      select object_id, object_code, object_name, -1 as dt, -(class_l3_id is not null)::int as dc from old_rows
+      union all
+      select object_id, object_code, object_name,  1 as dt,  (class_l3_id is not null)::int as dc from new_rows
+    ) x
+    group by 1, 2, 3
+    having sum(dt) <> 0 or sum(dc) <> 0
+    on conflict (object_id, object_code, object_name) do update
+    set total_positions      = s.total_positions + excluded.total_positions,
+        classified_positions = s.classified_positions + excluded.classified_positions;
+  end if;
+
+  if tg_op <> 'INSERT' then
+    delete from public.report_object_summary_v1 where total_positions <= 0;
+  end if;
+  return null;
+end;
+$$;
+
+create or replace function public.report_object_summary_v1_attach()
+returns void
+language plpgsql
+as $$
+begin
+  drop trigger if exists trg_report_object_summary_ins on public.nomenclature_spec_all_v1;
+  drop trigger if exists trg_report_object_summary_upd on public.nomenclature_spec_all_v1;
+  drop trigger if exists trg_report_object_summary_del on public.nomenclature_spec_all_v1;
+  drop trigger if exists trg_report_object_summary_trunc on public.nomenclature_spec_all_v1;
+
+  create trigger trg_report_object_summary_ins
+  after insert on public.nomenclature_spec_all_v1
+  referencing new table as new_rows
+  for each statement execute function public.report_object_summary_v1_apply();
+
+  create trigger trg_report_object_summary_upd
+  after update on public.nomenclature_spec_all_v1
+  referencing old table as old_rows new table as new_rows
+  for each statement execute function public.report_object_summary_v1_apply();
+
+  create trigger trg_report_object_summary_del
+  after delete on public.nomenclature_spec_all_v1
+  referencing old table as old_rows
+  for each statement execute function public.report_object_summary_v1_apply();
+
+  create trigger trg_report_object_summary_trunc
+  after truncate on public.nomenclature_spec_all_v1
+  for each statement execute function public.report_object_summary_v1_apply();
+end;
+$$;
+
+
+-- ====== полный пересчёт ======
+
+create or replace function public.report_object_summary_v1_rebuild()
+returns table (objects bigint, positions bigint)
+language plpgsql
+as $$
+declare
+  v_objects bigint := 0;
+begin
+  perform public.report_object_summary_v1_create();
+  perform public.report_object_summary_v1_attach();
+
+  -- под блокировкой: правки из Directus не проскочат между пересчётом и триггерами
+  lock table public.nomenclature_spec_all_v1 in share row exclusive mode;
+
+  truncate public.report_object_summary_v1;
+
+  insert into public.report_object_summary_v1
+    (object_id, object_code, object_name, total_positions, classified_positions)
+  select object_id, object_code, object_name, count(*), count(class_l3_id)
+  from public.nomenclature_spec_all_v1
+  group by 1, 2, 3;
+  get diagnostics v_objects = row_count;
+
+  analyze public.report_object_summary_v1;
+
+  return query
+  select v_objects, coalesce(sum(total_positions), 0)::bigint from public.report_object_summary_v1;
+end;
+$$;
+
+create or replace function public.verify_report_object_summary_v1()
+returns table (object_id bigint, object_name text, expected_total bigint, actual_total bigint,
+               expected_classified bigint, actual_classified bigint)
+language sql
+stable
+as $$
+  with f as (
+    select n.object_id, n.object_code, n.object_name, count(*) as total, count(n.class_l3_id) as classified
+    from public.nomenclature_spec_all_v1 n
+    group by 1, 2, 3
+  )
+  select coalesce(f.object_id, s.object_id)::bigint,
+         coalesce(f.object_name, s.object_name)::text,
+         coalesce(f.total, 0), coalesce(s.total_positions, 0),
+         coalesce(f.classified, 0), coalesce(s.classified_positions, 0)
+  from f
+  full join public.report_object_summary_v1 s
+    on  s.object_id   is not distinct from f.object_id
+    and s.object_code is not distinct from f.object_code
+    and s.object_name is not distinct from f.object_name
+  where coalesce(f.total, 0) <> coalesce(s.total_positions, 0)
+     or coalesce(f.classified, 0) <> coalesce(s.classified_positions, 0)
+$$;
+
+
+select * from public.report_object_summary_v1_rebuild();
@@ -27,4 +27,14 @@ alter table public.nomenclature_spec_all_v1
 
 -- Индексы
 create index if not exists ix_nomenclature_all_object_id on public.nomenclature_spec_all_v1 (object_id);
-create index if not exists ix_nomenclature_all_class_l3_id on public.nomenclature_spec_all_v1 (class_l3_id);
\ No newline at end of file
+create index if not exists ix_nomenclature_all_class_l3_id on public.nomenclature_spec_all_v1 (class_l3_id);
+
+-- сводка по объектам (18_report_object_summary_v1.sql): DROP унёс её триггеры, 03_/04_*.sql пойдут через них
+do $$
+begin
+  -- при первом развёртывании по номерам функции ещё нет: сводку и триггеры построит сам 18_*.sql
+  if to_regprocedure('public.report_object_summary_v1_rebuild()') is not null then
+    perform public.report_object_summary_v1_rebuild();
+  end if;
+end;
+$$;
\ No newline at end of file
@@ -8,8 +8,8 @@ function apiUrl(path, params) {
   return url.toString();
 }
 
-async function apiGet(path, params) {
-  const r = await fetch(apiUrl(path, params), { headers: { "Accept": "application/json" } });
+async function apiGet(path, params, { signal, headers } = {}) {
+  const r = await fetch(apiUrl(path, params), { headers: { "Accept": "application/json", ...headers }, signal });
   const text = await r.text();
   let data;
   try { data = JSON.parse(text); } catch { data = { _raw: text }; }
@@ -17,6 +17,30 @@ async function apiGet(path, params) {
   return data;
 }
 
+// "Последний выигрывает": новый запрос по тому же каналу (поле поиска) обрывает предыдущий.
+// Браузер закрывает соединение, а X-Search-Client даёт серверу отменить и свой запрос в OpenSearch.
+// Отменённый вызов бросает AbortError — страницы его просто игнорируют.
+const SEARCH_CLIENT_ID = Math.random().toString(36).slice(2) + Date.now().toString(36);
+const inflight = new Map();
+
+function isAbortError(e) {
+  return e?.name === "AbortError";
+}
+
+async function apiGetLatest(channel, path, params) {
+  inflight.get(channel)?.abort();
+  const ctrl = new AbortController();
+  inflight.set(channel, ctrl);
+  try {
+    return await apiGet(path, params, {
+      signal: ctrl.signal,
+      headers: { "X-Search-Client": `${SEARCH_CLIENT_ID}:${channel}` },
+    });
+  } finally {
+    if (inflight.get(channel) === ctrl) inflight.delete(channel);
+  }
+}
+
 // ---------- Directus ----------
 function directusUrl(path, params) {
   const base = PORTAL_CONFIG?.directusBase || "/directus";
@@ -69,12 +93,12 @@ async function searchOpenSearch(q, { index = null, size = null } = {}) {
   if (q != null) params.q = q;
   if (index) params.index = index;
   if (size != null) params.size = String(size);
-  return apiGet("/v1/search", params);
+  return apiGetLatest(`v1/search:${index || ""}`, "/v1/search", params);
 }
 
 // Экспортируем то, что нужно страницам
 export { // fixed import/export
-  apiUrl, apiGet,
+  apiUrl, apiGet, apiGetLatest, isAbortError,
   directusUrl, directusGet,
   directusReadItems,
   directusReadIteгms,
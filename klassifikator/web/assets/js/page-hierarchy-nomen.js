@@ -1,42 +1,50 @@
 // /assets/js/page-hierarchy-nomen.js
-import { directusReadItems, directusUpdateItem } from "./api.js";
+import { apiGet, directusUpdateItem } from "./api.js";
 
 const COLLECTION = "class_tree_nomen_v1";
-const LIMIT = 2000;
+// сколько parent_id отправлять в одном запросе /tree/nomen
+const PARENTS_PER_REQUEST = 200;
 
 const elBody = document.getElementById("treeBody");
 const elStat = document.getElementById("stat");
 const btnReload = document.getElementById("btnReload");
 const btnToggleAll = document.getElementById("btnToggleAll");
 
-btnToggleAll?.addEventListener("click", () => {
-  const branchIds = state.rows
-    .filter(r => {
-      const lvl = Number(r.level);
-      return lvl >= 1 && lvl <= 3;
-    })
-    .map(r => r.id);
-
-  const allOpened = branchIds.every(id => state.open.has(id));
+btnToggleAll?.addEventListener("click", async () => {
+  const branchIds = state.rows.filter(isBranch).map(r => r.id);
+  const allOpened = branchIds.length > 0 && branchIds.every(id => state.open.has(id));
 
   if (allOpened) {
     // свернуть всё: оставим открытыми только L1 (чтобы не был пустой экран)
     state.open.clear();
     for (const r of state.rows) if (Number(r.level) === 1) state.open.add(r.id);
     btnToggleAll.textContent = "Развернуть всё";
-  } else {
-    // развернуть всё
-    for (const id of branchIds) state.open.add(id);
-    btnToggleAll.textContent = "Свернуть всё";
+    render();
+    return;
   }
 
-  render();
+  // развернуть всё: догружаем уровни по очереди (L2, L3, затем L4)
+  btnToggleAll.disabled = true;
+  try {
+    for (let lvl = 1; lvl <= 3; lvl++) {
+      const ids = state.rows.filter(r => Number(r.level) === lvl).map(r => r.id);
+      await loadChildren(ids);
+      for (const id of ids) state.open.add(id);
+    }
+    btnToggleAll.textContent = "Свернуть всё";
+    render();
+  } catch (e) {
+    console.error(e);
+    alert("Не удалось загрузить дерево (см. консоль).");
+  } finally {
+    btnToggleAll.disabled = false;
+  }
 });
 
 const state = {
   rows: [],
   byId: new Map(),
-  children: new Map(),
+  children: new Map(),   // parent_id -> [id], только для уже загруженных узлов
   open: new Set(),
   loading: false
 };
@@ -44,19 +52,11 @@ const state = {
 btnReload?.addEventListener("click", () => loadAndRender());
 
 function nodeCode(row) {
-  const lvl = Number(row.level);
-  if (lvl === 1) return row.l1_code || "";
-  if (lvl === 2) return row.l2_code || "";
-  if (lvl === 3) return row.l3_code || "";
-  return row.l4_code || (row.dup_root_id != null ? String(row.dup_root_id) : "");
+  return row.code || "";
 }
 
 function nodeTitle(row) {
-  const lvl = Number(row.level);
-  if (lvl === 1) return row.l1_name || "";
-  if (lvl === 2) return row.l2_name || "";
-  if (lvl === 3) return row.l3_name || "";
-  return row.item_name || row.l4_name || "";
+  return row.name || "";
 }
 
 function isBranch(row) {
@@ -64,27 +64,62 @@ function isBranch(row) {
   return lvl >= 1 && lvl <= 3;
 }
 
-function buildTree(rows) {
-  state.byId.clear();
-  state.children.clear();
-
-  // ВАЖНО: порядок детей будет таким, как пришёл из Directus (уже отсортирован)
-  for (const r of rows) state.byId.set(r.id, r);
+// ответ /tree/nomen: { columns:[...], rows:[[...], ...] }
+function unpackRows(resp) {
+  const cols = resp?.columns || [];
+  return (resp?.rows || []).map(arr => {
+    const row = {};
+    cols.forEach((c, i) => { row[c] = arr[i]; });
+    return row;
+  });
+}
 
+function addRows(rows) {
   for (const r of rows) {
+    if (!state.byId.has(r.id)) state.rows.push(r);
+    state.byId.set(r.id, r);
     const pid = r.parent_id || "__root__";
     if (!state.children.has(pid)) state.children.set(pid, []);
     state.children.get(pid).push(r.id);
   }
+}
+
+// ВАЖНО: порядок детей такой, как пришёл из os_api (уже отсортирован)
+async function loadChildren(parentIds) {
+  const todo = parentIds.filter(id => !state.children.has(id));
+  for (let i = 0; i < todo.length; i += PARENTS_PER_REQUEST) {
+    const part = todo.slice(i, i + PARENTS_PER_REQUEST);
+    const rows = unpackRows(await apiGet("/tree/nomen", { parent_id: part.join(",") }));
+    for (const id of part) state.children.set(id, []);
+    addRows(rows);
+  }
+}
+
+async function loadRoots() {
+  state.rows = [];
+  state.byId.clear();
+  state.children.clear();
+
+  const roots = unpackRows(await apiGet("/tree/nomen"));
+  state.children.set("__root__", []);
+  addRows(roots);
 
   // раскрыть L1 по умолчанию
   if (state.open.size === 0) {
-    for (const r of rows) if (Number(r.level) === 1) state.open.add(r.id);
+    for (const r of roots) state.open.add(r.id);
+  }
+  // открытые узлы (L1 или оставшиеся после "Обновить") догружаем сразу
+  await loadChildren(roots.map(r => r.id).filter(id => state.open.has(id)));
+  for (let lvl = 2; lvl <= 3; lvl++) {
+    const ids = state.rows.filter(r => Number(r.level) === lvl && state.open.has(r.id)).map(r => r.id);
+    await loadChildren(ids);
   }
 }
 
-function hasChildren(id) {
-  return (state.children.get(id) || []).length > 0;
+function hasChildren(row) {
+  // незагруженная ветка считается непустой (узлы L1-L3 есть только там, где есть L4)
+  if (!state.children.has(row.id)) return Number(row.pending_cnt) > 0;
+  return state.children.get(row.id).length > 0;
 }
 
 function flattenVisible() {
@@ -118,7 +153,8 @@ function render() {
   const visible = flattenVisible();
 
   // stat
-	const l4Count = state.rows.reduce((acc, r) => acc + (Number(r.level) === 4 ? 1 : 0), 0);
+	const l4Count = (state.children.get("__root__") || [])
+	  .reduce((acc, id) => acc + (Number(state.byId.get(id)?.pending_cnt) || 0), 0);
 	elStat.textContent = `на согласовании: ${l4Count}`
 
   if (!visible.length) {
@@ -149,16 +185,29 @@ function render() {
     indent.style.width = `${depth * 18}px`;
     tdName.appendChild(indent);
 
-    if (isBranch(row) && hasChildren(row.id)) {
+    if (isBranch(row) && hasChildren(row)) {
       const btn = document.createElement("button");
       btn.className = "btn";
       btn.style.padding = "4px 8px";
       btn.style.marginRight = "8px";
       btn.textContent = state.open.has(row.id) ? "–" : "+";
-      btn.addEventListener("click", (e) => {
+      btn.addEventListener("click", async (e) => {
         e.preventDefault();
-        if (state.open.has(row.id)) state.open.delete(row.id);
-        else state.open.add(row.id);
+        if (state.open.has(row.id)) {
+          state.open.delete(row.id);
+          render();
+          return;
+        }
+        btn.disabled = true;
+        try {
+          await loadChildren([row.id]);
+          state.open.add(row.id);
+        } catch (err) {
+          console.error(err);
+          alert("Не удалось загрузить ветку (см. консоль).");
+        } finally {
+          btn.disabled = false;
+        }
         render();
       });
       tdName.appendChild(btn);
@@ -256,49 +305,13 @@ function render() {
   elBody.appendChild(frag);
 }
 
-async function loadAllRows() {
-  // directusReadItems использует offset, значит пагинация offset-ами
-  const fields = [
-    "id","parent_id","level",
-    "l1_code","l1_name",
-    "l2_code","l2_name",
-    "l3_code","l3_name",
-    "l4_code","l4_name",
-    "dup_root_id",
-    "item_name","unit","approved","note",
-    "pending_cnt",
-    "l1_num","l2_num","l3_num","l4_num"
-  ];
-
-  let all = [];
-  let offset = 0;
-
-  while (true) {
-    const resp = await directusReadItems(COLLECTION, {
-      fields,
-      limit: LIMIT,
-      offset,
-      sort: "l1_num,l2_num,l3_num,l4_num,level"
-    });
-
-    const data = resp?.data ?? [];
-    all = all.concat(data);
-
-    if (data.length < LIMIT) break;
-    offset += LIMIT;
-  }
-
-  return all;
-}
-
 async function loadAndRender() {
   if (state.loading) return;
   state.loading = true;
   elBody.innerHTML = `<tr><td colspan="7" class="muted" style="padding:14px;">Загрузка…</td></tr>`;
 
   try {
-    state.rows = await loadAllRows();
-    buildTree(state.rows);
+    await loadRoots();
     render();
 	if (btnToggleAll) btnToggleAll.textContent = "Развернуть всё";
   } catch (e) {
@@ -8,6 +8,10 @@
   let lastRows = [];
   let lastQ = "";
 
+  // новый поиск обрывает предыдущий: fetch в браузере и (по X-Search-Client) запрос сервера в OpenSearch
+  const SEARCH_CLIENT = "pairs-edit:" + Math.random().toString(36).slice(2);
+  let searchCtrl = null;
+
   function escapeHtml(s){
     return String(s ?? "")
       .replaceAll("&","&amp;")
@@ -110,6 +114,17 @@
   }
 
   async function loadFiltered(q){
+    searchCtrl?.abort();
+    const ctrl = searchCtrl = new AbortController();
+    try{
+      return await loadFilteredNow(q, ctrl.signal);
+    }catch(e){
+      if(e.name === "AbortError") return;
+      throw e;
+    }
+  }
+
+  async function loadFilteredNow(q, signal){
     const size = parseInt(el("size").value, 10) || 100;
 
     lastQ = q;
@@ -117,7 +132,7 @@
 
   // 1) OpenSearch -> получить кандидатов (id)
     const urlOS = `/api/pairs_search?index=${encodeURIComponent(INDEX)}&q=${encodeURIComponent(q)}&size=${encodeURIComponent(size)}`;
-    const resOS = await fetch(urlOS, { headers: { "Accept":"application/json" }});
+    const resOS = await fetch(urlOS, { headers: { "Accept":"application/json", "X-Search-Client": SEARCH_CLIENT }, signal });
 
     if(!resOS.ok){
       const t = await resOS.text();
@@ -142,7 +157,7 @@
   // 2) Postgres -> взять реальные строки из базы по ids
     setStatus("Загрузка из базы…");
     const urlPG = `/api/pairs_rows?ids=${encodeURIComponent(ids.join(","))}`;
-    const resPG = await fetch(urlPG, { headers: { "Accept":"application/json" }});
+    const resPG = await fetch(urlPG, { headers: { "Accept":"application/json" }, signal });
 
     if(!resPG.ok){
       const t = await resPG.text();
@@ -173,6 +188,7 @@
       // он должен:
       // 1) записать name_tep_korr как пришло
       // 2) записать name_tek = left(name_tep_korr, 150)
+      // 3) поставить документ в очередь индексации OpenSearch (полный /reindex не нужен)
       const res = await fetch(`/api/pairs_update/${encodeURIComponent(id)}`, {
         method: "PATCH",
         headers: { "Content-Type":"application/json", "Accept":"application/json" },
@@ -200,7 +216,6 @@
       tr.classList.remove("dirty");
       tr.classList.add("ok");
       setStatus(`Сохранено id=${id}`);
-	  fetch("/api/reindex", { method: "POST" }).catch(()=>{});
       setTimeout(()=> tr.classList.remove("ok"), 800);
 
     }catch(err){
@@ -1,4 +1,4 @@
-import { searchOpenSearch } from "./api.js";
+import { searchOpenSearch, isAbortError } from "./api.js";
 
 const el = (id) => document.getElementById(id);
 
@@ -82,6 +82,7 @@ async function runSearch(){
     renderRows(rows);
     setStatus(`Найдено строк: ${total}`);
   } catch (err) {
+    if (isAbortError(err)) return;   // вытеснен более новым запросом
     console.error(err);
     if (tableBody) {
       tableBody.innerHTML = `<tr><td colspan="2" class="muted">Ошибка: ${escapeHtml(err.message)}</td></tr>`;
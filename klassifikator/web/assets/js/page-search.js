@@ -1,4 +1,4 @@
-import { apiGet } from "./api.js"; // fixed import/export
+import { apiGet, apiGetLatest, isAbortError } from "./api.js"; // fixed import/export
 
 function el(id){ return document.getElementById(id); }
 
@@ -19,7 +19,7 @@ async function runHealth(){
 async function runSearch(q){
   el("out").textContent = "ищу: " + q + " ...";
   try{
-    const j = await apiGet("/search", { q, size: "10" });
+    const j = await apiGetLatest("search", "/search", { q, size: "10" });
 
     // ожидаем структуру вида { hits: { total, hits:[...] } } или что-то близкое
     const total =
@@ -39,6 +39,7 @@ async function runSearch(q){
       (top.length ? top.map(x => `• ${x.code} — ${x.name} (score ${x.score})`).join("\n") : "Пусто (нет hits)");
 
   }catch(e){
+    if (isAbortError(e)) return;
     el("out").textContent = "ERR ❌ " + (e.data ? JSON.stringify(e.data) : e.message);
   }
 }
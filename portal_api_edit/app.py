@@ -6,13 +6,15 @@ from copy import copy
 from flask_cors import CORS
 import tempfile
 
-import psycopg2
-import psycopg2.extras
+from pg_pool import PgPool
+from os_indexer import BulkIndexer
+from search_gateway import SearchGateway, SearchCancelled
 import subprocess
 import threading
 
 OPENSEARCH_URL = os.getenv("OPENSEARCH_URL", "http://opensearch:9200").rstrip("/")
 DEFAULT_INDEX  = os.getenv("OPENSEARCH_INDEX", "class_tree_v1")
+PAIRS_INDEX    = os.getenv("PAIRS_INDEX", "v_nomenclature_spec_pairs_v1")
 SEARCH_FIELDS  = os.getenv(
     "SEARCH_FIELDS",
     "l4_name^3,l3_name^2,l2_name^2,l1_name,path_name^2,l4_code,path_code"
@@ -34,22 +36,44 @@ app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 
+PG_POOL = PgPool(
+    host=PG_HOST,
+    port=PG_PORT,
+    dbname=PG_DB,
+    user=PG_USER,
+    password=PG_PASS
+)
+PG_POOL.fill()
+
+_REPAIR_LOCK = threading.Lock()
+
+
+def os_indexer_failed(indices):
+    # документы не записались и после повторов: их правки лежат в etl_changes_v1 — добирает incremental;
+    # идущий уже запуск не дублируем
+    if not _REPAIR_LOCK.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            print("os indexer: dead documents in", sorted(indices), "- running incremental reindex")
+            subprocess.run(["python3", "/scripts/etl_pg_to_opensearch.py", "--mode", "incremental"], check=True)
+        except Exception as e:
+            print("repair reindex failed:", e)
+        finally:
+            _REPAIR_LOCK.release()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+OS_INDEXER = BulkIndexer(OPENSEARCH_URL, timeout=TIMEOUT, on_failed=os_indexer_failed).start()
+
+# поиск: общий пул keep-alive соединений к OpenSearch, отмена вытесненных запросов, см. search_gateway.py
+SEARCH = SearchGateway(OPENSEARCH_URL)
+
+
 def pg_query(sql, params=None):
-    conn = psycopg2.connect(
-        host=PG_HOST,
-        port=PG_PORT,
-        dbname=PG_DB,
-        user=PG_USER,
-        password=PG_PASS
-    )
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute(sql, params or {})
-            rows = cur.fetchall()
-            conn.commit()
-            return [dict(r) for r in rows]
-    finally:
-        conn.close()
+    return PG_POOL.query(sql, params)
 
 
 @app.get("/health")
@@ -61,6 +85,31 @@ def health():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
+@app.get("/health/pg_pool")
+def health_pg_pool():
+    return jsonify(PG_POOL.stats())
+
+
+@app.get("/health/os_indexer")
+def health_os_indexer():
+    return jsonify(OS_INDEXER.stats())
+
+
+@app.get("/health/search")
+def health_search():
+    return jsonify(SEARCH.stats())
+
+
+def os_search(index, body):
+    # X-Search-Client: новый запрос того же поля ввода отменяет предыдущий
+    return SEARCH.search(index, body, client=request.headers.get("X-Search-Client"))
+
+
+@app.errorhandler(SearchCancelled)
+def search_cancelled(e):
+    return jsonify({"cancelled": True, "total": 0, "rows": []}), 499
+
+
 @app.get("/search")
 def search():
     q = (request.args.get("q") or "").strip()
@@ -87,8 +136,7 @@ def search():
         }
     }
 
-    url = f"{OPENSEARCH_URL}/{index}/_search"
-    r = requests.post(url, json=body, timeout=TIMEOUT)
+    r = os_search(index, body)
     return (r.text, r.status_code, {"Content-Type": "application/json"})
 
 @app.get("/nomen_search_exact")
@@ -113,8 +161,7 @@ def nomen_search_exact():
         }
     }
 
-    url = f"{OPENSEARCH_URL}/{index}/_search"
-    r = requests.post(url, json=body, timeout=TIMEOUT)
+    r = os_search(index, body)
 
     if r.status_code >= 300:
         return (r.text, r.status_code, {"Content-Type": "application/json"})
@@ -173,8 +220,7 @@ def pairs_search():
         }
     }
 
-    url = f"{OPENSEARCH_URL}/{index}/_search"
-    r = requests.post(url, json=body, timeout=TIMEOUT)
+    r = os_search(index, body)
 
     if r.status_code >= 300:
         return (r.text, r.status_code, {"Content-Type": "application/json"})
@@ -265,6 +311,11 @@ returning id, name_tek, name_tep_korr
         rows = pg_query(sql, {"id": row_id, "name_tep_korr": name_tep_korr, "name_tek": name_tek})
         if not rows:
             return jsonify({"error": "row not found"}), 404
+        # правка сразу в индекс пар (через alias); полный /reindex после сохранения не нужен
+        try:
+            OS_INDEXER.upsert(PAIRS_INDEX, rows[0]["id"], rows[0])
+        except Exception as e:
+            print("pairs index enqueue failed:", e)
         return jsonify(rows[0])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -272,11 +323,12 @@ returning id, name_tek, name_tep_korr
 @app.get("/reports/nomenclature_by_object")
 def report_nomenclature_by_object():
     sql = """
+      -- сводка по объектам (sql/18_report_object_summary_v1.sql), а не count по всей номенклатуре
       select
         o.subobject_name  as object_name,
-        count(n.id)   as cnt
-      from public.nomenclature_spec_all_v1 n
-      left join public.object_v1 o on n.object_id = o.id
+        sum(s.total_positions)::bigint   as cnt
+      from public.report_object_summary_v1 s
+      left join public.object_v1 o on s.object_id = o.id
       group by o.subobject_name
       order by o.subobject_name
     """